@@ -0,0 +1,57 @@
+from database.connect_to_db import Session
+from typing import Iterable, List, Sequence
+from datetime import date, datetime, time
+import io
+import json
+
+def parse_records(body: bytes, content_type: str = "") -> List:
+    """
+    JSON array (or a single object) by default, one JSON object per line when
+    content type is application/x-ndjson / application/jsonl.
+    Raises ValueError on malformed input.
+    """
+    text_body = body.decode("utf-8")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return [json.loads(line) for line in text_body.splitlines() if line.strip()]
+
+    data = json.loads(text_body) if text_body.strip() else []
+    if isinstance(data, dict):
+        return [data]
+    if not isinstance(data, list):
+        raise ValueError("Body must be a JSON array, an object or NDJSON")
+    return data
+
+def _copy_value(value) -> str:
+    # PostgreSQL COPY text format
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+def copy_rows(db: Session, table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+    """COPY rows into table inside the session's current transaction."""
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write("\t".join(_copy_value(v) for v in row))
+        buffer.write("\n")
+        count += 1
+    if not count:
+        return 0
+
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+    return count
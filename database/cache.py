@@ -0,0 +1,154 @@
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Hashable, Optional, Tuple
+import threading
+import time
+
+class QueryCache:
+    """
+    Bounded LRU cache for query results.
+
+    Every entry can carry a TTL (None = keep until evicted or invalidated) and
+    the time window it was computed for, so writers can drop only the entries
+    whose window contains the rows they just wrote.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = 30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Optional[float], Optional[tuple]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped by every invalidation, which is also remembered in _recent so
+        # set(generation=...) can tell whether one that ran during the load
+        # covered the key being stored.
+        self._generation = 0
+        self._recent: "deque[Tuple[int, Callable[[Hashable, Optional[tuple]], bool]]]" = deque(maxlen=256)
+        self.stale_loads = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(
+        self, key: Hashable, value: Any, ttl: Optional[float] = -1, window: Optional[tuple] = None,
+        generation: Optional[int] = None,
+    ) -> bool:
+        # ttl=-1 -> use the cache default, ttl=None -> never expires
+        # generation: value of generation() before the value was loaded; if an
+        # invalidation happened since, the value may be stale and is dropped
+        if ttl == -1:
+            ttl = self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if generation is not None and self._invalidated_since(generation, key, window):
+                self.stale_loads += 1
+                return False
+            self._entries[key] = (value, expires_at, window)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def _invalidated_since(self, generation: int, key: Hashable, window: Optional[tuple]) -> bool:
+        # caller holds the lock
+        if generation == self._generation:
+            return False
+        if not self._recent or self._recent[0][0] > generation + 1:
+            # older invalidations already fell out of _recent: assume the worst
+            return True
+        return any(g > generation and matches(key, window) for g, matches in self._recent)
+
+    def _record(self, matches: Callable[[Hashable, Optional[tuple]], bool]):
+        # caller holds the lock
+        self._generation += 1
+        self._recent.append((self._generation, matches))
+
+    def get_or_set(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = -1, window: Optional[tuple] = None):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            generation = self.generation()
+            value = loader()
+            self.set(key, value, ttl=ttl, window=window, generation=generation)
+        return value
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._record(lambda k, w: k == key)
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]):
+        with self._lock:
+            self._record(lambda k, w: predicate(k))
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def invalidate_window(self, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """
+        Drop entries whose window overlaps [start, end). start=None drops every
+        entry; entries stored without a window are always dropped.
+        """
+        with self._lock:
+            if start is None:
+                self._record(lambda k, w: True)
+                stale = list(self._entries)
+            else:
+                end = end or start
+                self._record(lambda k, w: w is None or _overlaps(w, start, end))
+                stale = [
+                    key for key, (_, _, window) in self._entries.items()
+                    if window is None or _overlaps(window, start, end)
+                ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self.invalidate_window(None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_loads": self.stale_loads,
+            }
+
+def _overlaps(window: tuple, start: datetime, end: datetime) -> bool:
+    w_start, w_end = window
+    try:
+        return w_start < end and w_end >= start if end > start else w_start <= start <= w_end
+    except TypeError:
+        # naive vs aware datetimes: cannot tell, treat as overlapping
+        return True
@@ -1,10 +1,12 @@
-from database.connect_to_db import engine, SessionLocal, Session, text, SQLAlchemyError
+from database.connect_to_db import engine, SessionLocal, Session, text, SQLAlchemyError, fetch_all_async
+from database.suggest import suggest_index
+from database.permission import invalidate_camera_permissions
 from datetime import datetime
 import database.schemas as schemas
 from fastapi.responses import JSONResponse
 from typing import Union, Dict, Any
 from fastapi import UploadFile
-import pandas as pd
+from database.upload import UploadSpec, upload_file
 
 def error_response(code: int, message: str):
     return JSONResponse( status_code=code, content={"detail": {"error": message}} )
@@ -12,6 +14,22 @@ def error_response(code: int, message: str):
 def success_response(code: int, content: Union[Dict[str, Any], str]):
     return JSONResponse( status_code=code, content=content)
 
+CAMERA_UPLOAD = UploadSpec(
+    table="camera",
+    label="camera",
+    columns={
+        "Camera ID": "cameraid",
+        "Camera Name": "cameraname",
+        "Location": "cameralocation",
+        "Status": "camerastatus",
+    },
+    defaults={"camerastatus": True},
+    booleans=("camerastatus",),
+    required=("cameraid",),
+    key=("cameraid",),
+    on_commit=invalidate_camera_permissions,
+)
+
 class CameraDB:
     def _fetch_all(self, query: str, params: dict = None):
         try:
@@ -24,39 +42,37 @@ class CameraDB:
         except SQLAlchemyError as e:
             print(f"Database error: {e}")
             return []
+
+    async def _fetch_all_async(self, query: str, params: dict = None):
+        try:
+            return await fetch_all_async(query, params)
+        except SQLAlchemyError as e:
+            print(f"Database error: {e}")
+            return []
         
     def get_cameras(self):
         return self._fetch_all("SELECT * FROM camera WHERE isdeleted = false")
 
-    def suggest_camera_id(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT cameraid FROM camera
-            WHERE isdeleted = false AND camerastatus = true AND LOWER(cameraid) LIKE LOWER(:keyword)
-            ORDER BY cameraid ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["cameraid"], "label": row["cameraid"]} for row in rows]
+    async def get_cameras_async(self):
+        return await self._fetch_all_async("SELECT * FROM camera WHERE isdeleted = false")
+
+    def suggest_camera_id(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("camera_id", q, mode=mode)
+
+    async def suggest_camera_id_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("camera_id", q, mode=mode)
     
-    def suggest_camera_name(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT cameraname FROM camera
-            WHERE isdeleted = false AND camerastatus = true AND LOWER(cameraname) LIKE LOWER(:keyword)
-            ORDER BY cameraname ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["cameraname"], "label": row["cameraname"]} for row in rows]
+    def suggest_camera_name(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("camera_name", q, mode=mode)
+
+    async def suggest_camera_name_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("camera_name", q, mode=mode)
     
-    def suggest_camera_location(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT cameralocation FROM camera
-            WHERE isdeleted = false AND camerastatus = true AND LOWER(cameralocation) LIKE LOWER(:keyword)
-            ORDER BY cameralocation ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["cameralocation"], "label": row["cameralocation"]} for row in rows]
+    def suggest_camera_location(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("camera_location", q, mode=mode)
+
+    async def suggest_camera_location_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("camera_location", q, mode=mode)
 
 
 class CameraService:
@@ -121,6 +137,8 @@ class CameraService:
           })
 
         db.commit()
+        suggest_index.invalidate("camera")
+        invalidate_camera_permissions()
         return success_response(200, {"cameraid": camera.cameraid, "createddate": str(now)})
     
     @staticmethod
@@ -156,6 +174,8 @@ class CameraService:
                         {"old_cameraid": cameraid}
                     )
                     db.commit()
+                    suggest_index.invalidate("camera")
+                    invalidate_camera_permissions()
                     update_fields["update_cameraid"] = camera.cameraid
                     
         # field other
@@ -170,6 +190,8 @@ class CameraService:
         try:
           db.execute(update_sql, update_fields)
           db.commit()
+          suggest_index.invalidate("camera")
+          invalidate_camera_permissions()
           return success_response(200, { "cameraid": update_fields.get("cameraid", cameraid), "updateddate": str(now)})
         except Exception as e:
             db.rollback()
@@ -182,52 +204,12 @@ class CameraService:
 
         db.execute(text("UPDATE camera SET isdeleted = true WHERE cameraid = :cameraid"), {"cameraid": cameraid})
         db.commit()
+        suggest_index.invalidate("camera")
+        invalidate_camera_permissions()
         return success_response(200,{"cameraid": cameraid, "isdeleted": True})
 
     @staticmethod
-    async def upload_cameras(uploadby: str, file: UploadFile, db: Session):
-      try:
-        now = datetime.now()
-
-        # ตรวจสอบประเภทไฟล์
-        filename = file.filename.lower()
-        file.file.seek(0)
-        if filename.endswith(".xlsx") or filename.endswith(".xls"):
-            df = pd.read_excel(file.file, engine="openpyxl")
-        elif filename.endswith(".csv"):
-            df = pd.read_csv(file.file)
-        else:
-            raise error_response(400, "File must be .xlsx or .csv")
- 
-        # แปลงข้อมูลแต่ละแถวเป็น dict ที่ตรงกับ SQL
-        camera_data = []
-        for _, row in df.iterrows():
-            camera_data.append({
-                "cameraid": row.get("Camera ID"),
-                "cameraname": row.get("Camera Name"),
-                "cameralocation": row.get("Location"),
-                "camerastatus": row.get("Status", "Active"),
-                "createdby": uploadby,
-                "createddate": now,
-            })
- 
-        # SQL สำหรับ insert
-        insert_sql = """
-            INSERT INTO prodtype (
-                cameraid, cameraname, cameralocation, camerastatus, createdby, createddate
-            )
-            VALUES (
-                :cameraid, :cameraname, :cameralocation, :camerastatus, :createdby, :createddate
-            )
-        """
-        # ทำ bulk insert
-        db.execute(text(insert_sql), camera_data)
-        db.commit()
-        return success_response(200,{"message": f"{len(camera_data)} records uploaded successfully!"})
- 
-      except Exception as e:
-          print(f"Error uploading camera: {e}")
-          db.rollback()
-          raise error_response(500, "Failed to upload camera")
+    def upload_cameras(uploadby: str, file: UploadFile, db: Session, mode: str = "insert"):
+        return upload_file(CAMERA_UPLOAD, uploadby, file, db, mode)
       
 
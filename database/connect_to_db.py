@@ -1,6 +1,12 @@
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Callable, Optional
+import os
+import threading
+import time
 
 DB_HOST = "127.0.0.1"
 DB_PORT = 15432
@@ -10,9 +16,131 @@ DB_PASS = "password"
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL)
+# Per process: every uvicorn worker of main and ws_main gets its own pool, so
+# (DB_POOL_SIZE + DB_MAX_OVERFLOW) * workers * apps must fit in max_connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# shows up in pg_stat_activity, set per app (e.g. main / ws_main)
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "pdr")
+
+class PoolStats:
+    """Checkout counters and time spent waiting for a pooled connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.last_wait = wait
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / waits * 1000, 3) if waits else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "last_wait_ms": round(self.last_wait * 1000, 3),
+            }
+
+# module level so the numbers survive pool.recreate() (dispose / invalidation)
+pool_stats = PoolStats()
+
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_stats.record(time.perf_counter() - started)
+        return conn
+
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={"application_name": DB_APPLICATION_NAME},
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional asyncpg engine for the read path: async routes await queries on the
+# event loop instead of holding a threadpool thread each. DB_ASYNC=false, or
+# asyncpg not being installed, falls back to the sync engine in the threadpool.
+DB_ASYNC = os.getenv("DB_ASYNC", "true").lower() in ("1", "true", "yes")
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    try:
+        import asyncpg  # noqa: F401
+    except ImportError:
+        asyncpg = None
+    if asyncpg is not None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        # separate pool with the same limits; count it when sizing max_connections
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args={"server_settings": {"application_name": DB_APPLICATION_NAME}},
+        )
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def _fetch_all_sync(query: str, params: Optional[dict] = None) -> list:
+    with engine.connect() as conn:
+        return list(conn.execute(text(query), params or {}).mappings())
+
+async def fetch_all_async(query: str, params: Optional[dict] = None) -> list:
+    """Rows as mappings, like the *DB._fetch_all helpers (errors are raised, not swallowed)."""
+    if async_engine is None:
+        return await run_in_threadpool(_fetch_all_sync, query, params)
+    async with async_engine.connect() as conn:
+        result = await conn.execute(text(query), params or {})
+        return list(result.mappings())
+
+async def run_read(fn: Callable[..., Any], *args) -> Any:
+    """
+    Await a sync read function called as fn(*args, db). On the async engine
+    it runs through AsyncSession.run_sync (greenlet, no thread); otherwise in
+    the threadpool with a regular Session.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(lambda sync_session: fn(*args, sync_session))
+
+    def call():
+        db = SessionLocal()
+        try:
+            return fn(*args, db)
+        finally:
+            db.close()
+    return await run_in_threadpool(call)
+
 def test_db_connection():
     try:
         with engine.connect() as conn:
@@ -21,6 +149,45 @@ def test_db_connection():
     except SQLAlchemyError as e:
         raise RuntimeError(f"Database connection failed: {str(e)}")
     
+def pool_status() -> dict:
+    pool = engine.pool
+    status = {
+        "application_name": DB_APPLICATION_NAME,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeout": DB_POOL_TIMEOUT,
+        "recycle": DB_POOL_RECYCLE,
+        "pre_ping": DB_POOL_PRE_PING,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        **pool_stats.to_dict(),
+    }
+    if async_engine is not None:
+        async_pool = async_engine.pool
+        status["async"] = {
+            "checked_out": async_pool.checkedout(),
+            "checked_in": async_pool.checkedin(),
+            "overflow": max(async_pool.overflow(), 0),
+        }
+    return status
+
+def server_connections() -> dict:
+    """Connections PostgreSQL sees per application_name, against max_connections."""
+    with engine.connect() as conn:
+        max_connections = int(conn.execute(text("SHOW max_connections")).scalar())
+        rows = conn.execute(text("""
+            SELECT COALESCE(NULLIF(application_name, ''), '(none)') AS application_name,
+                   count(*) AS connections,
+                   count(*) FILTER (WHERE state = 'active') AS active,
+                   count(*) FILTER (WHERE state = 'idle') AS idle
+            FROM pg_stat_activity
+            WHERE datname = current_database()
+            GROUP BY 1
+            ORDER BY 1
+        """)).mappings()
+        return {"max_connections": max_connections, "applications": [dict(r) for r in rows]}
+
 def get_db():
     db = SessionLocal()
     try:
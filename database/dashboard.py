@@ -2,12 +2,151 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import text
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timedelta
+from database.cache import QueryCache
 import database.schemas as schemas
+import functools
+import os
 # from database.connect_to_db import get_db
 
+ROLLUP_SLOT = timedelta(hours=1)
+
+# Whole hours of the rollup table. The rollup is keyed on prodid; the line
+# (prodlot) is joined from defectsummary here, the same way as for raw rows,
+# so later defectsummary edits are reflected without touching the rollup.
+_ROLLUP_COUNTS_SQL = """
+SELECT
+    r.hour_slot,
+    NULLIF(r.defecttype, '') AS defecttype,
+    NULLIF(r.prodname, '') AS prodname,
+    ds.prodlot AS line,
+    NULLIF(r.cameraid, '') AS cameraid,
+    SUM(r.defect_count) AS quantity
+FROM public.defecthourlyrollup r
+LEFT JOIN public.defectsummary ds ON NULLIF(r.prodid, '') = ds.prodid
+WHERE r.hour_slot >= :start AND r.hour_slot < :end
+  AND r.defect_count > 0
+  AND (:productname IS NULL OR r.prodname = :productname)
+  AND (:prodline IS NULL OR ds.prodlot = :prodline)
+  AND (:cameraid IS NULL OR r.cameraid = :cameraid)
+GROUP BY 1, 2, 3, 4, 5
+"""
+
+# Partial hours at the ends of the range, same shape as _ROLLUP_COUNTS_SQL.
+# Rows in partitions moved to productdefectresult_archive by the retention
+# policy are only counted through the rollup (see migration 003).
+# The bare ">= / <=" bounds stay in the WHERE clause so the planner can use
+# the defecttime index (and partition pruning).
+_RAW_COUNTS_SQL = """
+SELECT
+    DATE_TRUNC('hour', pdr.defecttime) AS hour_slot,
+    pdr.defecttype,
+    pdr.prodname,
+    ds.prodlot AS line,
+    pdr.cameraid,
+    COUNT(*) AS quantity
+FROM public.productdefectresult pdr
+LEFT JOIN public.defectsummary ds ON pdr.prodid = ds.prodid
+WHERE pdr.defecttime >= :start AND pdr.defecttime <= :end
+  AND (:include_end OR pdr.defecttime < :end)
+  AND (:productname IS NULL OR pdr.prodname = :productname)
+  AND (:prodline IS NULL OR ds.prodlot = :prodline)
+  AND (:cameraid IS NULL OR pdr.cameraid = :cameraid)
+GROUP BY 1, 2, 3, 4, 5
+"""
+
+def _floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def _split_range(start: datetime, end: datetime):
+    """
+    Split the inclusive range [start, end] into the whole hours covered by the
+    rollup and the partial edges that must be read from raw rows.
+    Returns ((rollup_start, rollup_end) or None, [(edge_start, edge_end, include_end), ...])
+    """
+    first_full = _floor_hour(start)
+    if first_full < start:
+        first_full += ROLLUP_SLOT
+    last_full = _floor_hour(end)
+
+    if first_full >= last_full:
+        return None, [(start, end, True)]
+
+    edges = []
+    if start < first_full:
+        edges.append((start, first_full, False))
+    edges.append((last_full, end, True))
+    return (first_full, last_full), edges
+
+def _sum_by(rows, keys):
+    grouped = {}
+    for row in rows:
+        key = tuple(row[k] for k in keys)
+        grouped[key] = grouped.get(key, 0) + row["quantity"]
+    return grouped
+
+def _nulls_last(value):
+    # ORDER BY puts NULLs last
+    return (value is None, value or "")
+
+# Widget results keyed on (widget, normalized filters). Windows that are still
+# open expire after DASHBOARD_CACHE_TTL seconds, closed windows stay until they
+# are evicted or invalidated by a write (see invalidate_dashboard).
+dashboard_cache = QueryCache(
+    maxsize=int(os.getenv("DASHBOARD_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("DASHBOARD_CACHE_TTL", "5")),
+)
+
+def _normalize_filter_value(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+def _window_closed(end: datetime) -> bool:
+    now = datetime.now(end.tzinfo) if end.tzinfo else datetime.now()
+    return end < now
+
+def _cached(widget: str):
+    """Cache a DashboardService method called as fn(start, end, *filters, db)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            *filters, db = args
+            filters = tuple(_normalize_filter_value(v) for v in filters)
+            start, end = filters[0], filters[1]
+            return dashboard_cache.get_or_set(
+                (widget,) + filters,
+                lambda: fn(*filters, db),
+                ttl=None if _window_closed(end) else -1,
+                window=(start, end),
+            )
+        return wrapper
+    return decorator
+
+def invalidate_dashboard(payload: Optional[str] = None):
+    """
+    Handler for NOTIFY dashboard_invalidate. payload is the hour that received
+    new productdefectresult rows, or "<start>/<end>" for the hours touched by a
+    defectsummary write; empty/None drops every cached result.
+    """
+    if not payload:
+        dashboard_cache.clear()
+        return
+    try:
+        if "/" in payload:
+            start, end = (datetime.fromisoformat(part) for part in payload.split("/", 1))
+        else:
+            start = datetime.fromisoformat(payload)
+            end = start + ROLLUP_SLOT
+    except ValueError:
+        dashboard_cache.clear()
+        return
+    dashboard_cache.invalidate_window(start, end)
+
 class DashboardService:
     @staticmethod
+    @_cached("defects_camera")
     def get_defects_with_ng_gt_zero(start: datetime, end: datetime, db: Session):
         sql = """
         SELECT 
@@ -33,6 +172,7 @@ class DashboardService:
         return result
 
     @staticmethod
+    @_cached("ratio")
     def get_ratio(start: datetime, end: datetime, productname: Optional[str], prodline: Optional[str], cameraid: Optional[str], db: Session):
         sql = """
         SELECT
@@ -67,109 +207,175 @@ class DashboardService:
         }).mappings().fetchall()
 
     @staticmethod
-    def ng_distribution(start: datetime, end: datetime, productname: Optional[str], prodline: Optional[str], cameraid: Optional[str], db: Session):
-        sql = """
-        SELECT 
-            pdr.defecttype,
-            pdr.prodname,
-            ds.prodlot as line,
-            DATE_TRUNC('hour', pdr.defecttime) AS hour_slot,
-            COUNT(*) AS defect_count
-        FROM public.productdefectresult pdr
-        LEFT JOIN public.defectsummary ds ON pdr.prodid = ds.prodid
-        WHERE pdr.defecttime BETWEEN :start AND :end
-          AND (:productname IS NULL OR pdr.prodname = :productname)
-          AND (:prodline IS NULL OR ds.prodlot = :prodline)
-          AND (:cameraid IS NULL OR pdr.cameraid = :cameraid)
-        GROUP BY pdr.defecttype, hour_slot, pdr.prodname, ds.prodlot
-        ORDER BY hour_slot, pdr.defecttype;
+    def _hourly_counts(start: datetime, end: datetime, productname: Optional[str], prodline: Optional[str], cameraid: Optional[str], db: Session):
         """
-        return db.execute(text(sql), {
-            "start": start,
-            "end": end,
-            "productname": productname,
-            "prodline": prodline,
-            "cameraid": cameraid
-        }).mappings().fetchall()
+        Defect counts per (hour_slot, defecttype, prodname, line, cameraid).
+        Whole hours are read from defecthourlyrollup, only the partial hours at
+        each end of the range are counted from productdefectresult.
+        """
+        filters = {"productname": productname, "prodline": prodline, "cameraid": cameraid}
+        rollup_range, edges = _split_range(start, end)
+        counts = {}
+
+        def add(rows):
+            for row in rows:
+                key = (row["hour_slot"], row["defecttype"], row["prodname"], row["line"], row["cameraid"])
+                counts[key] = counts.get(key, 0) + row["quantity"]
+
+        if rollup_range:
+            add(db.execute(text(_ROLLUP_COUNTS_SQL), {
+                "start": rollup_range[0],
+                "end": rollup_range[1],
+                **filters
+            }).mappings().fetchall())
+
+        for edge_start, edge_end, include_end in edges:
+            add(db.execute(text(_RAW_COUNTS_SQL), {
+                "start": edge_start,
+                "end": edge_end,
+                "include_end": include_end,
+                **filters
+            }).mappings().fetchall())
+
+        return [
+            {"hour_slot": k[0], "defecttype": k[1], "prodname": k[2], "line": k[3], "cameraid": k[4], "quantity": v}
+            for k, v in counts.items()
+        ]
+
+    @staticmethod
+    @_cached("ng_distribution")
+    def ng_distribution(start: datetime, end: datetime, productname: Optional[str], prodline: Optional[str], cameraid: Optional[str], db: Session):
+        counts = DashboardService._hourly_counts(start, end, productname, prodline, cameraid, db)
+        grouped = _sum_by(counts, ("defecttype", "hour_slot", "prodname", "line"))
+        result = [
+            {"defecttype": k[0], "prodname": k[2], "line": k[3], "hour_slot": k[1], "defect_count": v}
+            for k, v in grouped.items()
+        ]
+        result.sort(key=lambda r: (r["hour_slot"], _nulls_last(r["defecttype"])))
+        return result
 
     @staticmethod
+    @_cached("top_5_defects")
     def top_5_defects(start: datetime, end: datetime, productname: Optional[str], prodline: Optional[str], cameraid: Optional[str], db: Session):
+        counts = DashboardService._hourly_counts(start, end, productname, prodline, cameraid, db)
+        grouped = _sum_by(counts, ("defecttype", "line"))
+        top = sorted(grouped.items(), key=lambda kv: kv[1], reverse=True)[:5]
+        if not top:
+            return []
+
+        # all_defect_times still needs the raw timestamps, but only for the top 5 defect types
         sql = """
         SELECT
             pdr.defecttype,
             ds.prodlot AS line,
-            COUNT(*) AS quantity,
             ARRAY_AGG(pdr.defecttime ORDER BY pdr.defecttime) AS all_defect_times
         FROM public.productdefectresult pdr
-        LEFT JOIN public.defectsummary ds ON pdr.prodid = ds.prodid 
+        LEFT JOIN public.defectsummary ds ON pdr.prodid = ds.prodid
         WHERE pdr.defecttime BETWEEN :start AND :end
+          AND (pdr.defecttype = ANY(:defecttypes) OR (:with_null_type AND pdr.defecttype IS NULL))
           AND (:productname IS NULL OR pdr.prodname = :productname)
-          AND (:prodlot IS NULL OR ds.prodlot = :prodlot)
+          AND (:prodline IS NULL OR ds.prodlot = :prodline)
           AND (:cameraid IS NULL OR pdr.cameraid = :cameraid)
         GROUP BY pdr.defecttype, ds.prodlot
-        ORDER BY quantity DESC
-        LIMIT 5;
         """
-        return db.execute(text(sql), {
+        defecttypes = list({k[0] for k, _ in top if k[0] is not None})
+        rows = db.execute(text(sql), {
             "start": start,
             "end": end,
-            "prodlot": prodline,
+            "defecttypes": defecttypes,
+            "with_null_type": any(k[0] is None for k, _ in top),
             "productname": productname,
+            "prodline": prodline,
             "cameraid": cameraid
         }).mappings().fetchall()
+        times = {(row["defecttype"], row["line"]): row["all_defect_times"] for row in rows}
+
+        return [
+            {"defecttype": k[0], "line": k[1], "quantity": v, "all_defect_times": times.get(k, [])}
+            for k, v in top
+        ]
 
     @staticmethod
+    @_cached("top_5_trends")
     def top_5_trends(start: datetime, end: datetime, db: Session):
-        sql = """
-        SELECT 
-            pdr.defecttype,
-            ds.prodlot as line,
-            DATE_TRUNC('hour', pdr.defecttime) AS hour_slot,
-            COUNT(*) AS quantity
-        FROM public.productdefectresult pdr
-        LEFT JOIN public.defectsummary ds ON pdr.prodid = ds.prodid 
-        WHERE pdr.defecttime BETWEEN :start AND :end
-        AND pdr.defecttype IN (
-            SELECT pdr2.defecttype
-            FROM public.productdefectresult pdr2
-            LEFT JOIN public.defectsummary ds2 ON pdr2.prodid = ds2.prodid 
-            WHERE pdr2.defecttime BETWEEN :start AND :end
-            GROUP BY pdr2.defecttype
-            ORDER BY COUNT(*) DESC
-            LIMIT 5
-        )
-        GROUP BY pdr.defecttype, hour_slot, ds.prodlot
-        ORDER BY hour_slot, pdr.defecttype;
-        """
-        result = db.execute(text(sql), {
-            "start": start,
-            "end": end
-        }).mappings().fetchall()
+        counts = DashboardService._hourly_counts(start, end, None, None, None, db)
+        totals = _sum_by(counts, ("defecttype",))
+        ranked = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
+        top_types = set([k[0] for k, _ in ranked if k[0] is not None][:5])
+
+        grouped = _sum_by([c for c in counts if c["defecttype"] in top_types], ("defecttype", "hour_slot", "line"))
+        result = [
+            {"defecttype": k[0], "line": k[2], "hour_slot": k[1], "quantity": v}
+            for k, v in grouped.items()
+        ]
+        result.sort(key=lambda r: (r["hour_slot"], _nulls_last(r["defecttype"])))
         return result
     
     @staticmethod
+    @_cached("total_products")
     def get_total_products(start: datetime, end: datetime, productname: Optional[str], prodline: Optional[str], cameraid: Optional[str], db: Session):
-        sql = """
-        SELECT 
-            COUNT(DISTINCT pdr.prodid) as total_products
-        FROM public.productdefectresult pdr
-        LEFT JOIN public.defectsummary ds ON pdr.prodid = ds.prodid
-        WHERE pdr.defecttime BETWEEN :start AND :end
-          AND (:productname IS NULL OR pdr.prodname = :productname)
-          AND (:prodline IS NULL OR ds.prodlot = :prodline)
-          AND (:cameraid IS NULL OR pdr.cameraid = :cameraid)
-        """
-        result = db.execute(text(sql), {
-            "start": start,
-            "end": end,
-            "prodline": prodline,
+        rollup_range, edges = _split_range(start, end)
+        params = {
             "productname": productname,
+            "prodline": prodline,
             "cameraid": cameraid
-        }).mappings().fetchone()
+        }
+        parts = []
+
+        if rollup_range:
+            parts.append("""
+            SELECT NULLIF(r.prodid, '') AS prodid
+            FROM public.producthourlyrollup r
+            LEFT JOIN public.defectsummary ds ON NULLIF(r.prodid, '') = ds.prodid
+            WHERE r.hour_slot >= :rollup_start AND r.hour_slot < :rollup_end
+              AND r.result_count > 0
+              AND (:productname IS NULL OR r.prodname = :productname)
+              AND (:prodline IS NULL OR ds.prodlot = :prodline)
+              AND (:cameraid IS NULL OR r.cameraid = :cameraid)
+            """)
+            params["rollup_start"], params["rollup_end"] = rollup_range
+
+        for i, (edge_start, edge_end, include_end) in enumerate(edges):
+            parts.append(f"""
+            SELECT pdr.prodid
+            FROM public.productdefectresult pdr
+            LEFT JOIN public.defectsummary ds ON pdr.prodid = ds.prodid
+            WHERE pdr.defecttime >= :start_{i} AND pdr.defecttime <= :end_{i}
+              AND (:include_end_{i} OR pdr.defecttime < :end_{i})
+              AND (:productname IS NULL OR pdr.prodname = :productname)
+              AND (:prodline IS NULL OR ds.prodlot = :prodline)
+              AND (:cameraid IS NULL OR pdr.cameraid = :cameraid)
+            """)
+            params[f"start_{i}"] = edge_start
+            params[f"end_{i}"] = edge_end
+            params[f"include_end_{i}"] = include_end
+
+        sql = f"""
+        SELECT 
+            COUNT(DISTINCT p.prodid) as total_products
+        FROM ({" UNION ALL ".join(parts)}) p
+        """
+        result = db.execute(text(sql), params).mappings().fetchone()
         
         # Return ในรูปแบบ array เพื่อให้ตรงกับ frontend expectation
         return [{"total_products": result["total_products"] if result else 0}]
     
+    @staticmethod
+    def get_dashboard(start: datetime, end: datetime, productname: Optional[str], prodline: Optional[str], cameraid: Optional[str], db: Session):
+        """
+        Every dashboard widget in one round trip, on one session. Each entry is
+        exactly what the matching /dashboard-* endpoint returns and is served
+        from the same cache entry, so both stay consistent.
+        """
+        return {
+            "total_products": DashboardService.get_total_products(start, end, productname, prodline, cameraid, db),
+            "good_ng_ratio": DashboardService.get_ratio(start, end, productname, prodline, cameraid, db),
+            "ng_distribution": DashboardService.ng_distribution(start, end, productname, prodline, cameraid, db),
+            "top_5_defects": DashboardService.top_5_defects(start, end, productname, prodline, cameraid, db),
+            "top_5_trends": DashboardService.top_5_trends(start, end, db),
+            "defects_camera": DashboardService.get_defects_with_ng_gt_zero(start, end, db),
+        }
+
     @staticmethod
     def get_lines_list(db: Session):
         """ดึงรายการ production lines สำหรับ dropdown filter"""
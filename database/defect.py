@@ -1,11 +1,12 @@
 from database.connect_to_db import engine, SessionLocal, Session, text, SQLAlchemyError
+from database.suggest import suggest_index
 from fastapi import HTTPException
 import database.schemas as schemas
 from datetime import datetime
 from fastapi.responses import JSONResponse
 from typing import Union, Dict, Any
 from fastapi import UploadFile
-import pandas as pd
+from database.upload import UploadSpec, upload_file
 
 def error_response(code: int, message: str):
     return JSONResponse( status_code=code, content={"detail": {"error": message}} )
@@ -13,6 +14,21 @@ def error_response(code: int, message: str):
 def success_response(code: int, content: Union[Dict[str, Any], str]):
     return JSONResponse( status_code=code, content=content)
 
+DEFECT_TYPE_UPLOAD = UploadSpec(
+    table="defecttype",
+    label="defect type",
+    columns={
+        "Defect Type ID": "defectid",
+        "Defect Type Name": "defecttype",
+        "Description": "defectdescription",
+        "Status": "defectstatus",
+    },
+    defaults={"defectstatus": True},
+    booleans=("defectstatus",),
+    required=("defectid",),
+    key=("defectid",),
+)
+
 class DefectDB:
     def _fetch_all(self, query: str, params: dict = None):
         try:
@@ -29,25 +45,17 @@ class DefectDB:
     def get_defect_types(self):
         return self._fetch_all("SELECT * FROM defecttype WHERE isdeleted = false")
     
-    def suggest_defecttype_id(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT defectid FROM defecttype
-            WHERE isdeleted = false AND defectstatus = true AND LOWER(defectid) LIKE LOWER(:keyword)
-            ORDER BY defectid ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["defectid"], "label": row["defectid"]} for row in rows]
+    def suggest_defecttype_id(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("defecttype_id", q, mode=mode)
+
+    async def suggest_defecttype_id_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("defecttype_id", q, mode=mode)
     
-    def suggest_defecttype_name(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT defecttype FROM defecttype
-            WHERE isdeleted = false AND defectstatus = true AND LOWER(defecttype) LIKE LOWER(:keyword)
-            ORDER BY defecttype ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["defecttype"], "label": row["defecttype"]} for row in rows]
+    def suggest_defecttype_name(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("defecttype_name", q, mode=mode)
+
+    async def suggest_defecttype_name_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("defecttype_name", q, mode=mode)
         
     def add_defect_type(self, defect: schemas.DefectTypeCreate, db: Session):
         # Check if user exists
@@ -109,6 +117,7 @@ class DefectDB:
             })
 
         db.commit()
+        suggest_index.invalidate("defecttype")
         return success_response(200, {"defectid": defect.defectid, "createddate": str(now)})
     
     def update_defect_type(self, defectid: str, defect: schemas.DefectTypeUpdate, db: Session):
@@ -140,6 +149,7 @@ class DefectDB:
                         {"new_defectid": defect.defectid}
                     )
                   db.commit()
+                  suggest_index.invalidate("defecttype")
 
               update_fields["defectid"] = defect.defectid
           
@@ -163,6 +173,7 @@ class DefectDB:
         update_sql = text(f"UPDATE defecttype SET {set_clause} WHERE defectid = :old_defectid")
         db.execute(update_sql, update_fields)
         db.commit()
+        suggest_index.invalidate("defecttype")
         return success_response(200, { "defectid": update_fields.get("defectid", defectid), "updateddate": str(now)})
         
     @staticmethod
@@ -172,51 +183,10 @@ class DefectDB:
 
         db.execute(text("UPDATE defecttype SET isdeleted = true WHERE defectid = :defectid"), {"defectid": defectid})
         db.commit()
+        suggest_index.invalidate("defecttype")
         return success_response(200, {"defectid": defectid, "isdeleted": True})
       
     @staticmethod
-    async def upload_defect_types(uploadby: str, file: UploadFile, db: Session):
-      try:
-        now = datetime.now()
-
-        # ตรวจสอบประเภทไฟล์
-        filename = file.filename.lower()
-        file.file.seek(0)
-        if filename.endswith(".xlsx") or filename.endswith(".xls"):
-            df = pd.read_excel(file.file, engine="openpyxl")
-        elif filename.endswith(".csv"):
-            df = pd.read_csv(file.file)
-        else:
-            raise error_response(400, "File must be .xlsx or .csv")
-
-        # แปลงข้อมูลแต่ละแถวเป็น dict ที่ตรงกับ SQL
-        defect_type_data = []
-        for _, row in df.iterrows():
-            defect_type_data.append({
-                "defectid": row.get("Defect Type ID"),
-                "defecttype": row.get("Defect Type Name"),
-                "defectdescription": row.get("Description"),
-                "defectstatus": row.get("Status", "Active"),
-                "createdby": uploadby,
-                "createddate": now
-            })
-
-        # SQL สำหรับ insert
-        insert_sql = """
-            INSERT INTO defecttype (
-                defectid, defecttype, defectdescription, defectstatus, createdby, createddate
-            )
-            VALUES (
-                :defectid, :defecttype, :defectdescription, :defectstatus, :createdby, :createddate
-            )
-        """
-        # ทำ bulk insert
-        db.execute(text(insert_sql), defect_type_data)
-        db.commit()
-        return success_response(200,{"message": f"{len(defect_type_data)} records uploaded successfully!"})
- 
-      except Exception as e:
-          print(f"Error uploading defect type: {e}")
-          db.rollback()
-          raise error_response(500, "Failed to upload defect type")
+    def upload_defect_types(uploadby: str, file: UploadFile, db: Session, mode: str = "insert"):
+        return upload_file(DEFECT_TYPE_UPLOAD, uploadby, file, db, mode)
       
@@ -0,0 +1,64 @@
+from datetime import datetime
+from typing import Iterable, Iterator
+from openpyxl import Workbook
+import csv
+import io
+import os
+import tempfile
+
+CSV_FLUSH_ROWS = 500
+XLSX_CHUNK_SIZE = 64 * 1024
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+def rows_to_csv(rows: Iterable) -> Iterator[str]:
+    """First item of rows is the header. Yields CSV text every CSV_FLUSH_ROWS rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _xlsx_value(value):
+    # Excel has no timezone / list types
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    if isinstance(value, (list, tuple, dict)):
+        return str(value)
+    return value
+
+def rows_to_xlsx(rows: Iterable, sheet_name: str = "Sheet1") -> Iterator[bytes]:
+    """
+    Write-only workbook: openpyxl spools rows to disk instead of keeping cells
+    in memory. The workbook is saved to a temp file which is then streamed out.
+    """
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title=sheet_name)
+        for row in rows:
+            ws.append([_xlsx_value(v) for v in row])
+        wb.save(path)
+
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(XLSX_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+def export_rows(rows: Iterable, file_format: str, sheet_name: str = "Sheet1") -> Iterator:
+    if file_format == "xlsx":
+        return rows_to_xlsx(rows, sheet_name)
+    return rows_to_csv(rows)
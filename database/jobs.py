@@ -0,0 +1,155 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+import os
+import threading
+import time
+import traceback
+import uuid
+
+JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", "2"))
+# seconds a finished job stays queryable
+JOB_TTL = int(os.getenv("UPLOAD_JOB_TTL", "3600"))
+# per-row errors kept per job
+JOB_MAX_ERRORS = int(os.getenv("UPLOAD_JOB_MAX_ERRORS", "1000"))
+# seconds shutdown() waits for running jobs before abandoning them
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("UPLOAD_JOB_SHUTDOWN_TIMEOUT", "30"))
+
+class Job:
+    def __init__(self, kind: str, description: str = ""):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.status = "queued"          # queued | running | succeeded | failed
+        self.phase = None               # parse | insert
+        self.created = datetime.now()
+        self.started: Optional[datetime] = None
+        self.finished: Optional[datetime] = None
+        self.finished_at: Optional[float] = None
+        self.rows_total = 0
+        self.rows_parsed = 0
+        self.rows_inserted = 0
+        self.rows_rejected = 0
+        self.errors: List[dict] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._future: Optional[Future] = None
+        # releases the job's resources (e.g. its temp file) if it never finishes
+        self._cleanup: Optional[Callable[[], None]] = None
+
+    def update(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+    def add_errors(self, errors: List[dict]):
+        with self._lock:
+            self.rows_rejected += len(errors)
+            room = JOB_MAX_ERRORS - len(self.errors)
+            if room > 0:
+                self.errors.extend(errors[:room])
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            progress = (self.rows_parsed + self.rows_inserted) / (2 * self.rows_total) if self.rows_total else 0.0
+            return {
+                "jobId": self.id,
+                "kind": self.kind,
+                "description": self.description,
+                "status": self.status,
+                "phase": self.phase,
+                "progress": 1.0 if self.status == "succeeded" else round(min(progress, 1.0), 4),
+                "rowsTotal": self.rows_total,
+                "rowsParsed": self.rows_parsed,
+                "rowsInserted": self.rows_inserted,
+                "rowsRejected": self.rows_rejected,
+                "errors": list(self.errors),
+                "result": self.result,
+                "error": self.error,
+                "created": self.created.isoformat(),
+                "started": self.started.isoformat() if self.started else None,
+                "finished": self.finished.isoformat() if self.finished else None,
+            }
+
+class JobManager:
+    """Runs blocking work (spreadsheet uploads) in a thread pool and keeps its status around."""
+
+    def __init__(self, workers: int = JOB_WORKERS, ttl: int = JOB_TTL):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self, kind: str, fn: Callable, *args, description: str = "",
+        cleanup: Optional[Callable[[], None]] = None,
+    ) -> Job:
+        """
+        fn(job, *args) runs in the pool; its return value becomes job.result.
+        cleanup is called instead of relying on fn when the job is abandoned at
+        shutdown (still queued, or running past the shutdown timeout).
+        """
+        self._purge()
+        job = Job(kind, description)
+        job._cleanup = cleanup
+        with self._lock:
+            self._jobs[job.id] = job
+        job._future = self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job: Job, fn: Callable, args: tuple):
+        job.update(status="running", started=datetime.now())
+        try:
+            result = fn(job, *args)
+            job.update(status="succeeded", result=result)
+        except Exception as e:
+            traceback.print_exc()
+            job.update(status="failed", error=str(e))
+        finally:
+            job.update(finished=datetime.now(), finished_at=time.monotonic())
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        self._purge()
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _purge(self):
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _abandon(self, job: Job, reason: str):
+        job.update(status="failed", error=reason, finished=datetime.now(), finished_at=time.monotonic())
+        if job._cleanup is not None:
+            try:
+                job._cleanup()
+            except Exception as e:
+                print(f"Job {job.id} cleanup error: {e}")
+
+    def shutdown(self, timeout: float = JOB_SHUTDOWN_TIMEOUT):
+        """Drop queued jobs, give running ones up to timeout seconds, then abandon them."""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job._future is not None]
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+        for job in jobs:
+            if job._future.cancelled():
+                self._abandon(job, "Cancelled at shutdown")
+        running = {job._future: job for job in jobs if not job._future.done()}
+        if running:
+            _, not_done = wait(running, timeout=timeout)
+            for future in not_done:
+                self._abandon(running[future], f"Abandoned at shutdown after {timeout:g}s")
+
+job_manager = JobManager()
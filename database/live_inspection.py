@@ -1,94 +1,501 @@
+import json
 import logging
 from fastapi import WebSocket, WebSocketDisconnect
-from database.connect_to_db import Session, text
-from typing import Dict, List
+from database.connect_to_db import Session, text, run_read
+from database.cache import QueryCache
+from database.pubsub import create_pubsub
+from starlette.concurrency import run_in_threadpool
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
 import asyncio
+import base64
+import binascii
+import os
+import re
+import time
+import uuid
 
-# Global maps for sockets and incoming updates
-active_websockets: Dict[str, List[WebSocket]] = {}
-pending_updates: Dict[str, asyncio.Queue] = {}
+# What happens when a camera's buffers are full (each frame is a full snapshot):
+#   conflate     : keep only the latest update / frame (default)
+#   drop_oldest  : bounded buffers, the oldest entry makes room
+#   backpressure : bounded buffers, Node-RED gets 429 until viewers catch up
+LIVE_DELIVERY_POLICIES = ("conflate", "drop_oldest", "backpressure")
+LIVE_DELIVERY_POLICY = os.getenv("LIVE_DELIVERY_POLICY", "conflate")
+# per-camera overrides, e.g. {"CAM01": "backpressure"}
+LIVE_CAMERA_POLICIES: Dict[str, str] = json.loads(os.getenv("LIVE_CAMERA_POLICIES", "{}"))
+for _policy in [LIVE_DELIVERY_POLICY, *LIVE_CAMERA_POLICIES.values()]:
+    if _policy not in LIVE_DELIVERY_POLICIES:
+        raise ValueError(f"Unknown live delivery policy: {_policy}")
 
-async def live_defect_ws_handler(websocket: WebSocket, camera_id: str, db: Session):
-    await websocket.accept()
+# frames buffered per websocket (drop_oldest / backpressure)
+LIVE_CLIENT_BUFFER = int(os.getenv("LIVE_CLIENT_BUFFER", "8"))
+# raw updates from Node-RED waiting for enrichment (drop_oldest / backpressure)
+LIVE_INBOX_SIZE = int(os.getenv("LIVE_INBOX_SIZE", "32"))
+# a send that takes longer than this closes the websocket
+LIVE_SEND_TIMEOUT = float(os.getenv("LIVE_SEND_TIMEOUT", "5"))
+# backpressure: seconds a "buffers full" report keeps rejecting pushes
+LIVE_CONGESTION_TTL = float(os.getenv("LIVE_CONGESTION_TTL", "1"))
+# Clients that offer this websocket subprotocol (or connect with ?format=binary)
+# get each frame as a JSON header without the image plus the raw image as a
+# binary frame; everyone else keeps the base64-in-JSON messages.
+LIVE_BINARY_SUBPROTOCOL = "live.binary.v1"
+# With the postgres pub/sub backend, images are written here (the shared-data
+# volume) and only the file name travels through NOTIFY; every worker reads
+# the image itself. Files older than LIVE_FRAME_RETENTION seconds are removed.
+LIVE_FRAME_DIR = Path(os.getenv("LIVE_FRAME_DIR", "shared/live-frames"))
+LIVE_FRAME_RETENTION = float(os.getenv("LIVE_FRAME_RETENTION", "30"))
+# smaller images stay inline in the message
+LIVE_FRAME_INLINE_LIMIT = 2048
 
-    if camera_id not in active_websockets:
-        active_websockets[camera_id] = []
-    if camera_id not in pending_updates:
-        pending_updates[camera_id] = asyncio.Queue()
+def live_delivery_policy(camera_id: str) -> str:
+    return LIVE_CAMERA_POLICIES.get(camera_id, LIVE_DELIVERY_POLICY)
 
-    active_websockets[camera_id].append(websocket)
+# camera_id -> static camera/product fields for enrichment. Dropped by
+# NOTIFY live_metadata_invalidate (camera/product/prodtype triggers, migration
+# 008); the TTL picks up a camera starting to report a different product.
+live_metadata_cache = QueryCache(
+    maxsize=int(os.getenv("LIVE_METADATA_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("LIVE_METADATA_TTL", "60")),
+)
 
+_METADATA_SQL = text("""
+    SELECT
+        c.cameralocation AS "location",
+        c.cameraid AS "cameraId",
+        c.cameraname AS "cameraName",
+        c.camerastatus AS "status",
+        p.prodid AS "productId",
+        p.prodname AS "productName",
+        pt.prodtypeid AS "productTypeId",
+        pt.prodtype AS "productTypeName",
+        p.prodserial AS "serialNo",
+        p.createddate AS "productDateTime",
+        ds.prodlot AS "lotNo"
+    FROM public.camera c
+    INNER JOIN public.productdefectresult d ON c.cameraid = d.cameraid
+    INNER JOIN public.product p ON d.prodid = p.prodid
+    INNER JOIN public.prodtype pt ON p.prodtypeid = pt.prodtypeid
+    LEFT JOIN public.defectsummary ds ON p.prodid = ds.prodid
+    WHERE c.isdeleted = false
+    AND p.isdeleted = false
+    AND c.cameraid = :camera_id
+    ORDER BY c.cameraid, p.prodid
+    LIMIT 1
+""")
+
+# the counters change with every inspected product, so they are read per push
+_COUNTERS_SQL = text("""
+    SELECT
+        ds.totalng AS "totalNG",
+        NULL AS "totalPlanning",
+        NULL AS "actualPlanning"
+    FROM public.defectsummary ds
+    WHERE ds.prodid = :prodid
+      AND ds.prodlot IS NOT DISTINCT FROM :lotno
+    LIMIT 1
+""")
+
+def get_live_metadata(camera_id: str, db: Session) -> Optional[dict]:
+    metadata = live_metadata_cache.get(camera_id)
+    if metadata is None:
+        generation = live_metadata_cache.generation()
+        row = db.execute(_METADATA_SQL, {"camera_id": camera_id}).mappings().first()
+        if row is None:
+            # not cached: the camera shows up as soon as its first result is written
+            return None
+        metadata = dict(row)
+        live_metadata_cache.set(camera_id, metadata, generation=generation)
+    return metadata
+
+def invalidate_live_metadata(payload: Optional[str] = None):
+    """Handler for NOTIFY live_metadata_invalidate; empty/None drops every camera."""
+    if payload:
+        live_metadata_cache.invalidate(payload)
+    else:
+        live_metadata_cache.clear()
+
+def build_live_message(camera_id: str, merged_data: dict, db: Session) -> dict:
+    """Node-RED update + camera/product metadata -> the message sent to clients."""
+    meta = get_live_metadata(camera_id, db)
+    if not meta:
+        return {"error": "No defect + planning found"}
+    counters = db.execute(_COUNTERS_SQL, {
+        "prodid": meta["productId"],
+        "lotno": meta["lotNo"],
+    }).mappings().first() or {}
+    total_ng = counters.get("totalNG")
+    total_planning = counters.get("totalPlanning")
+    actual_planning = counters.get("actualPlanning")
+
+    result = {
+        "liveStream": merged_data.get("liveStream", ""),
+        "location": meta["location"],
+        "cameraId": meta["cameraId"],
+        "cameraName": meta["cameraName"],
+        "status": "OK" if meta["status"] else "NG",
+        "lotNo": meta["lotNo"],
+        "totalNG": str(total_ng if total_ng is not None else 10),
+        "totalProduct": str(total_planning if total_planning is not None else 1000),
+        "actualProduct": str(actual_planning if actual_planning is not None else 1000),
+        "currentInspection": {
+            "productId": meta["productId"],
+            "productName": meta["productName"],
+            "serialNo": meta["serialNo"],
+            "productDateTime": meta["productDateTime"].strftime("%Y-%m-%d %H:%M:%S") if meta["productDateTime"] else None,
+        },
+        "colorDetection": merged_data.get("colorDetection", {}),
+        "typeClassification": merged_data.get("typeClassification", {}),
+        "componentDetection": merged_data.get("componentDetection", {}),
+        "objectCounting": merged_data.get("objectCounting", {}),
+        "barcodeReading": merged_data.get("barcodeReading", {}),
+    }
+    return result
+
+def _serialize(message: dict) -> str:
+    # same encoding as WebSocket.send_json
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def _split_live_stream(value) -> Tuple[Optional[bytes], str]:
+    """liveStream (base64, optionally a data: URL) -> (raw bytes, "data:...;base64," prefix or "")."""
+    if not value or not isinstance(value, str):
+        return None, ""
+    prefix = ""
+    if value.startswith("data:"):
+        head, _, value = value.partition(",")
+        prefix = head + ","
+    try:
+        return base64.b64decode(value, validate=True), prefix
+    except (binascii.Error, ValueError):
+        return None, ""
+
+def _mime(prefix: str) -> Optional[str]:
+    if not prefix:
+        return None
+    return prefix[5:].split(";")[0].rstrip(",") or None
+
+def _binary_frame(message: dict, image: Optional[bytes] = None, prefix: str = "") -> Tuple[str, Optional[bytes]]:
+    """
+    Binary mode: the message without the image as a JSON text frame, followed
+    by the image as a binary frame when "image" is not null. image is given
+    when it was read from LIVE_FRAME_DIR, otherwise liveStream is decoded.
+    """
+    if image is None:
+        image, prefix = _split_live_stream(message.get("liveStream"))
+    if image is None:
+        header = {**message, "image": None}
+    else:
+        header = {**message, "liveStream": None, "image": {"size": len(image), "mime": _mime(prefix)}}
+    return _serialize(header), image
+
+_FRAME_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]")
+_frames_pruned_at = 0.0
+
+def store_live_frame(camera_id: str, data: dict) -> dict:
+    """
+    Move a large liveStream image out of the update into LIVE_FRAME_DIR.
+    Returns the update to publish: liveStream replaced by liveStreamFile (and
+    the data: URL prefix, to rebuild the original string for JSON clients).
+    """
+    image, prefix = _split_live_stream(data.get("liveStream"))
+    if image is None or len(data["liveStream"]) <= LIVE_FRAME_INLINE_LIMIT:
+        return data
+    LIVE_FRAME_DIR.mkdir(parents=True, exist_ok=True)
+    name = f"{_FRAME_NAME_RE.sub('_', camera_id)}-{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    tmp = LIVE_FRAME_DIR / f".{name}.tmp"
+    tmp.write_bytes(image)
+    # readers never see a half-written file
+    os.replace(tmp, LIVE_FRAME_DIR / name)
+    _prune_live_frames()
+    return {**data, "liveStream": None, "liveStreamFile": name, "liveStreamPrefix": prefix}
+
+def load_live_frame(name: str) -> Optional[bytes]:
+    if not name or _FRAME_NAME_RE.search(name):
+        return None
     try:
+        return (LIVE_FRAME_DIR / name).read_bytes()
+    except FileNotFoundError:
+        # pruned before this worker got to it
+        return None
+
+def _prune_live_frames():
+    global _frames_pruned_at
+    now = time.time()
+    if now - _frames_pruned_at < LIVE_FRAME_RETENTION / 2:
+        return
+    _frames_pruned_at = now
+    for path in LIVE_FRAME_DIR.iterdir():
+        try:
+            if now - path.stat().st_mtime > LIVE_FRAME_RETENTION:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+
+class DeliveryBuffer:
+    """Bounded queue that applies a delivery policy instead of growing or blocking."""
+
+    def __init__(self, policy: str, maxsize: int):
+        self.policy = policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=1 if policy == "conflate" else maxsize)
+        self.coalesced = 0
+        self.dropped = 0
+
+    def offer(self, item) -> bool:
+        """Queue item without waiting; False if it was refused (backpressure)."""
+        if self.queue.full():
+            if self.policy == "backpressure":
+                self.dropped += 1
+                return False
+            self.queue.get_nowait()
+            if self.policy == "conflate":
+                self.coalesced += 1
+            else:
+                self.dropped += 1
+        self.queue.put_nowait(item)
+        return True
+
+    async def get(self):
+        return await self.queue.get()
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+class Subscriber:
+    """One websocket with its own outbound buffer and sender task."""
+
+    def __init__(self, websocket: WebSocket, policy: str, binary: bool = False):
+        self.websocket = websocket
+        self.binary = binary
+        self.buffer = DeliveryBuffer(policy, LIVE_CLIENT_BUFFER)
+        self.closed = asyncio.Event()
+        self.sent = 0
+
+    async def run(self):
+        try:
+            while True:
+                frame = await self.buffer.get()
+                await asyncio.wait_for(self._send(frame), LIVE_SEND_TIMEOUT)
+                self.sent += 1
+        except (WebSocketDisconnect, RuntimeError, asyncio.TimeoutError) as e:
+            logging.info(f"[WebSocket] Send stopped: {type(e).__name__}")
+        finally:
+            self.closed.set()
+
+    async def _send(self, frame):
+        if not self.binary:
+            await self.websocket.send_text(frame)
+            return
+        header, image = frame
+        await self.websocket.send_text(header)
+        if image is not None:
+            await self.websocket.send_bytes(image)
+
+class CameraHub:
+    """
+    Fan-out for one camera: each pushed update is enriched and serialized once
+    by the hub task, then offered to every subscriber's buffer. A slow client
+    only ever affects its own buffer (and, under backpressure, the producer).
+    """
+
+    def __init__(self, camera_id: str):
+        self.camera_id = camera_id
+        self.policy = live_delivery_policy(camera_id)
+        self.subscribers: Set[Subscriber] = set()
+        self.inbox = DeliveryBuffer(self.policy, LIVE_INBOX_SIZE)
+        self._task: Optional[asyncio.Task] = None
+        self._reported_at = 0.0
+        self.published = 0
+        self.frames = 0
+        # totals of subscribers that already left
+        self._gone_coalesced = 0
+        self._gone_dropped = 0
+
+    def subscribe(self, websocket: WebSocket, binary: bool = False) -> Subscriber:
+        subscriber = Subscriber(websocket, self.policy, binary)
+        self.subscribers.add(subscriber)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            self._gone_coalesced += subscriber.buffer.coalesced
+            self._gone_dropped += subscriber.buffer.dropped
+
+    def publish(self, data: dict):
+        self.published += 1
+        if not self.inbox.offer(data):
+            self._report_congestion()
+
+    def _report_congestion(self):
+        # at most one report per half TTL; the push side stops answering 429
+        # LIVE_CONGESTION_TTL seconds after the last one
+        now = time.monotonic()
+        if now - self._reported_at < LIVE_CONGESTION_TTL / 2:
+            return
+        self._reported_at = now
+        asyncio.ensure_future(_publish_congestion(self.camera_id))
+
+    async def _run(self):
         while True:
-            # Wait for new merged data from Node-RED
-            merged_data = await pending_updates[camera_id].get()
-
-            # Run SQL to get camera/product metadata
-            sql = text("""
-                SELECT
-                    c.cameralocation AS "location",
-                    c.cameraid AS "cameraId",
-                    c.cameraname AS "cameraName",
-                    c.camerastatus AS "status",
-                    p.prodid AS "productId",
-                    p.prodname AS "productName",
-                    pt.prodtypeid AS "productTypeId",
-                    pt.prodtype AS "productTypeName",
-                    p.prodserial AS "serialNo",
-                    d.resultid,
-                    d.imagepath as "imagepath", 
-                    d.defecttype AS "defectType",
-                    p.createddate AS "productDateTime",
-                    ds.prodlot AS "lotNo",
-                    ds.totalng AS "totalNG",
-                    NULL AS "totalPlanning",
-                    NULL AS "totalPlanning",  
-                    NULL AS "actualPlanning"
-                FROM public.camera c
-                INNER JOIN public.productdefectresult d ON c.cameraid = d.cameraid
-                INNER JOIN public.product p ON d.prodid = p.prodid
-                INNER JOIN public.prodtype pt ON p.prodtypeid = pt.prodtypeid
-                LEFT JOIN public.defectsummary ds ON p.prodid = ds.prodid
-                WHERE c.isdeleted = false
-                AND p.isdeleted = false
-                AND c.cameraid = :camera_id
-                ORDER BY c.cameraid, p.prodid;
-            """)
-            row = db.execute(sql, {"camera_id": camera_id}).mappings().first()
-            if not row:
-                await websocket.send_json({"error": "No defect + planning found"})
+            data = await self.inbox.get()
+            if not self.subscribers:
+                continue
+            try:
+                message = await run_read(build_live_message, self.camera_id, data)
+                image = None
+                if data.get("liveStreamFile"):
+                    image = await run_in_threadpool(load_live_frame, data["liveStreamFile"])
+            except Exception as e:
+                print(f"[WebSocket] Live enrichment error ({self.camera_id}): {e}")
                 continue
+            # each format is encoded once, and only if someone wants it
+            subscribers = list(self.subscribers)
+            prefix = data.get("liveStreamPrefix", "")
+            json_frame = binary_frame = None
+            if any(not s.binary for s in subscribers):
+                if image is not None:
+                    message["liveStream"] = prefix + base64.b64encode(image).decode("ascii")
+                json_frame = _serialize(message)
+            if any(s.binary for s in subscribers):
+                binary_frame = _binary_frame(message, image, prefix)
+            self.frames += 1
+            congested = False
+            for subscriber in subscribers:
+                if not subscriber.buffer.offer(binary_frame if subscriber.binary else json_frame):
+                    congested = True
+            if congested:
+                self._report_congestion()
+            print(f"[WebSocket] Broadcasted to {self.camera_id} ({len(self.subscribers)} clients)")
 
-            result = {
-                "liveStream": merged_data.get("liveStream", ""),
-                "location": row["location"],
-                "cameraId": row["cameraId"],
-                "cameraName": row["cameraName"],
-                "status": "OK" if row["status"] else "NG",
-                "lotNo": row["lotNo"],
-                "totalNG": str(row["totalNG"] if row["totalNG"] is not None else 10),
-                "totalProduct": str(row["totalPlanning"] if row["totalPlanning"] is not None else 1000),
-                "actualProduct": str(row["actualPlanning"] if row["actualPlanning"] is not None else 1000),
-                "currentInspection": {
-                    "productId": row["productId"],
-                    "productName": row["productName"],
-                    "serialNo": row["serialNo"],
-                    "productDateTime": row["productDateTime"].strftime("%Y-%m-%d %H:%M:%S") if row["productDateTime"] else None,
-                },
-                "colorDetection": merged_data.get("colorDetection", {}),
-                "typeClassification": merged_data.get("typeClassification", {}),
-                "componentDetection": merged_data.get("componentDetection", {}),
-                "objectCounting": merged_data.get("objectCounting", {}),
-                "barcodeReading": merged_data.get("barcodeReading", {}),
-            }
-
-            await websocket.send_json(result)
-            print(f"[WebSocket] Broadcasted to {camera_id}")
-
-    except WebSocketDisconnect:
-        logging.info(f"[WebSocket] Disconnected: live-defect/{camera_id}")
-        active_websockets[camera_id].remove(websocket)
-        if not active_websockets[camera_id]:
-            del active_websockets[camera_id]
-            del pending_updates[camera_id]
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
 
+    def stats(self) -> dict:
+        clients = list(self.subscribers)
+        return {
+            "policy": self.policy,
+            "subscribers": len(clients),
+            "published": self.published,
+            "frames": self.frames,
+            # updates / frames replaced by a newer one (conflate)
+            "coalesced": self.inbox.coalesced + self._gone_coalesced + sum(s.buffer.coalesced for s in clients),
+            # updates / frames discarded (drop_oldest, backpressure)
+            "dropped": self.inbox.dropped + self._gone_dropped + sum(s.buffer.dropped for s in clients),
+            "inbox_depth": self.inbox.qsize(),
+            "clients": [
+                {
+                    "format": "binary" if s.binary else "json",
+                    "buffered": s.buffer.qsize(),
+                    "sent": s.sent,
+                    "coalesced": s.buffer.coalesced,
+                    "dropped": s.buffer.dropped,
+                }
+                for s in clients
+            ],
+        }
+
+# camera_id -> hub, only while the camera has subscribers
+live_hubs: Dict[str, CameraHub] = {}
+
+def publish_live_update(camera_id: str, data: dict) -> int:
+    """Hand a Node-RED update to the camera's hub; returns the number of subscribers (0 = dropped)."""
+    hub = live_hubs.get(camera_id)
+    if hub is None or not hub.subscribers:
+        return 0
+    hub.publish(data)
+    return len(hub.subscribers)
+
+# Pushes go through pub/sub so they reach the hub on whichever worker holds
+# the camera's websockets (LIVE_PUBSUB_BACKEND, PostgreSQL NOTIFY by default).
+# Hubs under backpressure report full buffers on a second channel so the
+# worker that receives the push can answer 429.
+LIVE_CHANNEL = "live_update"
+LIVE_CONGESTION_CHANNEL = "live_congestion"
+live_pubsub = create_pubsub()
+
+# camera_id -> when a hub last reported full buffers (local monotonic clock)
+_congested_at: Dict[str, float] = {}
+# camera_id -> pushes answered with 429 by this worker
+rejected_pushes: Dict[str, int] = {}
+
+async def _publish_congestion(camera_id: str):
+    try:
+        await live_pubsub.publish(LIVE_CONGESTION_CHANNEL, {"cameraId": camera_id})
+    except Exception as e:
+        print(f"[WebSocket] Congestion report failed ({camera_id}): {e}")
+
+def _on_live_update(message: dict):
+    publish_live_update(message["cameraId"], message["data"])
+
+def _on_congestion(message: dict):
+    _congested_at[message["cameraId"]] = time.monotonic()
+
+def is_congested(camera_id: str) -> bool:
+    reported = _congested_at.get(camera_id)
+    return reported is not None and time.monotonic() - reported < LIVE_CONGESTION_TTL
+
+def start_live_pubsub():
+    live_pubsub.subscribe(LIVE_CHANNEL, _on_live_update)
+    live_pubsub.subscribe(LIVE_CONGESTION_CHANNEL, _on_congestion)
+    live_pubsub.start(asyncio.get_event_loop())
+
+async def push_live_update(camera_id: str, data: dict) -> bool:
+    """
+    Deliver a Node-RED update to the camera's subscribers on every worker.
+    Returns False (nothing published) while a backpressure camera's viewers
+    are behind.
+    """
+    if live_delivery_policy(camera_id) == "backpressure" and is_congested(camera_id):
+        rejected_pushes[camera_id] = rejected_pushes.get(camera_id, 0) + 1
+        return False
+    if live_pubsub.name != "memory":
+        # keep image-rate traffic out of PostgreSQL: only the file name is sent
+        data = await run_in_threadpool(store_live_frame, camera_id, data)
+    await live_pubsub.publish(LIVE_CHANNEL, {"cameraId": camera_id, "data": data})
+    return True
+
+async def _wait_disconnect(websocket: WebSocket):
+    # clients don't send anything; this only notices them going away
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+def _wants_binary(websocket: WebSocket) -> bool:
+    return (
+        LIVE_BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+        or websocket.query_params.get("format") == "binary"
+    )
+
+async def live_defect_ws_handler(websocket: WebSocket, camera_id: str):
+    binary = _wants_binary(websocket)
+    if LIVE_BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", []):
+        await websocket.accept(subprotocol=LIVE_BINARY_SUBPROTOCOL)
+    else:
+        await websocket.accept()
+
+    hub = live_hubs.get(camera_id)
+    if hub is None:
+        hub = live_hubs[camera_id] = CameraHub(camera_id)
+    subscriber = hub.subscribe(websocket, binary)
+
+    sender = asyncio.create_task(subscriber.run())
+    receiver = asyncio.create_task(_wait_disconnect(websocket))
+    closed = asyncio.create_task(subscriber.closed.wait())
+    try:
+        await asyncio.wait({sender, receiver, closed}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (sender, receiver, closed):
+            task.cancel()
+        logging.info(f"[WebSocket] Disconnected: live-defect/{camera_id}")
+        hub.unsubscribe(subscriber)
+        if not hub.subscribers and live_hubs.get(camera_id) is hub:
+            del live_hubs[camera_id]
+            await hub.stop()
@@ -1,6 +1,7 @@
 from database.connect_to_db import engine, Session, text, SQLAlchemyError
 from fastapi import HTTPException
 import database.schemas as schemas
+from database.permission import invalidate_role_permissions
 
 class MenuDB:
     def _fetch_all(self, query: str):
@@ -40,6 +41,7 @@ class MenuDB:
         })
 
         db.commit()
+        invalidate_role_permissions()
         return {"status": "Menu created", "menuId": menu.menuid}
 
     def update_menu(self, menuid: str, menu: schemas.MenuUpdate, db: Session):
@@ -63,5 +65,6 @@ class MenuDB:
 
         db.execute(update_sql, update_fields)
         db.commit()
+        invalidate_role_permissions()
         return {"status": "Menu updated", "menuId": menuid}
 
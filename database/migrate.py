@@ -0,0 +1,42 @@
+from database.connect_to_db import engine, text, SQLAlchemyError
+from pathlib import Path
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+
+# Arbitrary key for pg_advisory_xact_lock so that main and ws_main starting
+# together do not run the same migration twice.
+MIGRATION_LOCK_KEY = 7302001
+
+def apply_migrations():
+    """
+    Run every migrations/*.sql file that is not recorded in schemamigration yet,
+    in file name order, inside one transaction. Any failure rolls everything
+    back and is raised: the app must not start on a half-migrated schema.
+    """
+    applied = []
+    current = "schemamigration"
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schemamigration (
+                    version varchar(255) PRIMARY KEY,
+                    applieddate timestamp NOT NULL DEFAULT now()
+                )
+            """))
+            done = {row[0] for row in conn.execute(text("SELECT version FROM schemamigration"))}
+
+            for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+                if path.name in done:
+                    continue
+                current = path.name
+                # exec_driver_sql: the files contain plpgsql bodies (":=", "::") that text() would treat as binds;
+                # no_parameters: otherwise psycopg2 reads the "%L" / "%I" / "%s" of format() as placeholders
+                conn.execution_options(no_parameters=True).exec_driver_sql(path.read_text(encoding="utf-8"))
+                conn.execute(text("INSERT INTO schemamigration (version) VALUES (:version)"), {"version": path.name})
+                applied.append(path.name)
+                print(f"Applied migration {path.name}")
+    except Exception as e:
+        print(f"Migration error ({current}): {e}")
+        raise
+    return applied
@@ -1,4 +1,5 @@
 from database.connect_to_db import engine, Session, text, SQLAlchemyError
+from database.suggest import suggest_index
 from fastapi import FastAPI, UploadFile, File, Form
 from pathlib import Path
 import shutil
@@ -103,25 +104,17 @@ class DetectionModelDB:
             WHERE mv.modelversionid = :modelversionid
         """, {"modelversionid": modelversionid})
     
-    def suggest_modelname(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT modelname FROM model
-            WHERE isdeleted = false AND LOWER(modelname) LIKE LOWER(:keyword)
-            ORDER BY modelname ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["modelname"], "label": row["modelname"]} for row in rows]
+    def suggest_modelname(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("modelname", q, mode=mode)
+
+    async def suggest_modelname_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("modelname", q, mode=mode)
     
-    def suggest_function(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT functionname FROM function
-            WHERE LOWER(functionname) LIKE LOWER(:keyword)
-            ORDER BY functionname ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["functionname"], "label": row["functionname"]} for row in rows]
+    def suggest_function(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("function", q, mode=mode)
+
+    async def suggest_function_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("function", q, mode=mode)
 
 
 class DetectionModelService:
@@ -229,6 +222,7 @@ class DetectionModelService:
             """)
         
         db.commit()
+        suggest_index.invalidate("model")
         row = db.execute(joined_sql, {"modelid": modelid}).mappings().first()
         if row is None:
             return error_response(404, "Model not found")
@@ -247,6 +241,7 @@ class DetectionModelService:
 
         db.execute(text("UPDATE model SET isdeleted = true WHERE modelid = :modelid"), {"modelid": modelid})
         db.commit()
+        suggest_index.invalidate("model")
         return success_response(200, {"message": "Model marked as deleted", "modelid": modelid, "isdeleted": True})
     
     @staticmethod
@@ -447,6 +442,7 @@ class DetectionModelService:
             })
 
         db.commit()
+        suggest_index.invalidate("model")
         return success_response(200, { "modelversionid": modelversionid, "versionno": versionno })
  
     @staticmethod
@@ -0,0 +1,159 @@
+from database.connect_to_db import SessionLocal, Session, text
+from datetime import datetime, timedelta
+from typing import List, Optional
+import os
+import re
+
+PARENT_TABLE = "productdefectresult"
+DEFAULT_PARTITION = "productdefectresult_default"
+ARCHIVE_TABLE = "productdefectresult_archive"
+
+# day | month
+PARTITION_INTERVAL = os.getenv("PDR_PARTITION_INTERVAL", "month")
+# how many partitions to keep created ahead of the current one
+PARTITION_PREMAKE = int(os.getenv("PDR_PARTITION_PREMAKE", "2"))
+# rows older than this many days leave productdefectresult (0 = keep forever)
+RETENTION_DAYS = int(os.getenv("PDR_RETENTION_DAYS", "0"))
+# archive | drop
+RETENTION_MODE = os.getenv("PDR_RETENTION_MODE", "archive")
+# seconds between two maintenance runs
+MAINTENANCE_INTERVAL = int(os.getenv("PDR_MAINTENANCE_INTERVAL", "3600"))
+
+# Same idea as MIGRATION_LOCK_KEY: only one worker runs maintenance at a time
+MAINTENANCE_LOCK_KEY = 7302004
+
+_BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    value = value.strip()
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+def _period_start(value: datetime, interval: str = PARTITION_INTERVAL) -> datetime:
+    value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "month":
+        value = value.replace(day=1)
+    return value
+
+def _next_period(value: datetime, interval: str = PARTITION_INTERVAL) -> datetime:
+    start = _period_start(value, interval)
+    if interval == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+def _partition_name(lower: datetime, interval: str = PARTITION_INTERVAL) -> str:
+    suffix = lower.strftime("%Y%m") if interval == "month" else lower.strftime("%Y%m%d")
+    return f"{PARENT_TABLE}_p{suffix}"
+
+def _literal(value: datetime) -> str:
+    return f"'{value:%Y-%m-%d %H:%M:%S}'"
+
+class PartitionService:
+    @staticmethod
+    def list_partitions(db: Session, parent: str = PARENT_TABLE) -> List[dict]:
+        rows = db.execute(text("""
+            SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = :parent
+        """), {"parent": parent}).mappings().fetchall()
+
+        partitions = []
+        for row in rows:
+            match = _BOUND_RE.search(row["bound"] or "")
+            partitions.append({
+                "name": row["name"],
+                "is_default": row["bound"] == "DEFAULT",
+                "lower": _parse_bound(match.group(1)) if match else None,
+                "upper": _parse_bound(match.group(2)) if match else None,
+            })
+        partitions.sort(key=lambda p: (p["upper"] is None, p["upper"] or datetime.min))
+        return partitions
+
+    @staticmethod
+    def ensure_partitions(db: Session, now: Optional[datetime] = None) -> List[str]:
+        """Create partitions up to PARTITION_PREMAKE periods after the current one."""
+        now = now or datetime.now()
+        partitions = PartitionService.list_partitions(db)
+        ranged = [p for p in partitions if not p["is_default"]]
+        if not partitions:
+            # table was not converted by migration 003
+            return []
+
+        target = _period_start(now)
+        for _ in range(PARTITION_PREMAKE + 1):
+            target = _next_period(target)
+
+        uppers = [p["upper"] for p in ranged if p["upper"] is not None]
+        lower = max(uppers) if uppers else _period_start(now)
+        created = []
+        while lower < target:
+            upper = _next_period(lower)
+            name = _partition_name(lower)
+            range_sql = f"defecttime >= {_literal(lower)} AND defecttime < {_literal(upper)}"
+
+            # Rows that already landed in the default partition for this range
+            # are moved through the parent so the rollup triggers stay balanced.
+            db.execute(text(f"""
+                CREATE TEMP TABLE _pdr_moved ON COMMIT DROP AS
+                SELECT * FROM {DEFAULT_PARTITION} WHERE {range_sql}
+            """))
+            db.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {range_sql}"))
+            db.execute(text(f"""
+                CREATE TABLE {name} PARTITION OF {PARENT_TABLE}
+                FOR VALUES FROM ({_literal(lower)}) TO ({_literal(upper)})
+            """))
+            db.execute(text(f"INSERT INTO {PARENT_TABLE} SELECT * FROM _pdr_moved"))
+            db.execute(text("DROP TABLE _pdr_moved"))
+
+            created.append(name)
+            lower = upper
+        return created
+
+    @staticmethod
+    def apply_retention(db: Session, now: Optional[datetime] = None) -> dict:
+        """Detach partitions that ended before the retention cutoff and archive or drop them."""
+        result = {"archived": [], "dropped": []}
+        if RETENTION_DAYS <= 0:
+            return result
+
+        now = now or datetime.now()
+        cutoff = now - timedelta(days=RETENTION_DAYS)
+        for p in PartitionService.list_partitions(db):
+            if p["is_default"] or p["upper"] is None or p["upper"] > cutoff:
+                continue
+
+            db.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {p['name']}"))
+            if RETENTION_MODE == "drop":
+                db.execute(text(f"DROP TABLE {p['name']}"))
+                result["dropped"].append(p["name"])
+            else:
+                lower = _literal(p["lower"]) if p["lower"] else "MINVALUE"
+                db.execute(text(f"""
+                    ALTER TABLE {ARCHIVE_TABLE} ATTACH PARTITION {p['name']}
+                    FOR VALUES FROM ({lower}) TO ({_literal(p['upper'])})
+                """))
+                result["archived"].append(p["name"])
+        return result
+
+    @staticmethod
+    def run_maintenance():
+        db = SessionLocal()
+        try:
+            if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY}).scalar():
+                return {"skipped": True}
+            created = PartitionService.ensure_partitions(db)
+            retention = PartitionService.apply_retention(db)
+            db.commit()
+            if created or retention["archived"] or retention["dropped"]:
+                print(f"Partition maintenance: created={created} retention={retention}")
+            return {"created": created, **retention}
+        except Exception as e:
+            # anything else would end partition_maintenance_loop for good
+            db.rollback()
+            print(f"Partition maintenance error: {type(e).__name__}: {e}")
+            return {"error": str(e)}
+        finally:
+            db.close()
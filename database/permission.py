@@ -1,7 +1,11 @@
 from database.connect_to_db import engine, Session, text, SQLAlchemyError
+from database.cache import QueryCache
 from sqlalchemy import text
 from fastapi.responses import JSONResponse
-from typing import Union, Dict, Any
+from typing import Union, Dict, Any, List, Tuple
+import hashlib
+import json
+import os
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
@@ -60,48 +64,74 @@ class PermissionDB:
             return error_response(401, "Invalid credentials")
         
     def user_permission(self, userid: str, db: Session):
+        return self.user_permission_tree(userid, db)[0]
+
+    def user_permission_tree(self, userid: str, db: Session) -> Tuple[List[dict], str]:
+        """
+        Menu tree for a user plus its ETag. Built from three cached pieces: the
+        user's role set, the menus granted to that role set and the Live
+        Inspection camera submenu.
+        """
+        roleids = permission_cache.get_or_set(("user", userid), lambda: self._user_roles(userid, db))
+        menus, menus_tag = permission_cache.get_or_set(("roles", roleids), lambda: self._role_menus(roleids, db))
+
+        rows = list(menus)
+        tags = [menus_tag]
+        # the camera submenu only hangs off Live Inspection with view (1) permission
+        if any(row["menuid"] == "LI000" and 1 in (row["actions"] or []) for row in menus):
+            cameras, cameras_tag = permission_cache.get_or_set(("cameras",), lambda: self._camera_menus(db))
+            rows.extend(cameras)
+            tags.append(cameras_tag)
+        return rows, _etag("".join(tags))
+
+    def roles_with_action(self, menuid: str, actionid: int, db: Session) -> List[dict]:
+        """Roles granted actionid on menuid (GIN index on rolepermission.actionid)."""
+        sql = text("""
+            SELECT r.roleid, r.rolename
+            FROM rolepermission rp
+            JOIN role r ON r.roleid = rp.roleid
+            WHERE rp.menuid = :menuid
+              AND rp.actionid @> ARRAY[CAST(:actionid AS integer)]
+              AND r.isdeleted = false
+            ORDER BY r.rolename
+        """)
+        return [dict(row._mapping) for row in db.execute(sql, {"menuid": menuid, "actionid": actionid})]
+
+    def _user_roles(self, userid: str, db: Session) -> tuple:
+        result = db.execute(text("SELECT DISTINCT roleid FROM userrole WHERE userid = :userid"), {"userid": userid})
+        return tuple(sorted(row[0] for row in result))
+
+    def _role_menus(self, roleids: tuple, db: Session) -> Tuple[List[dict], str]:
+        if not roleids:
+            return [], _etag("")
         sql = text("""
-            WITH user_roles AS (
-                SELECT roleid
-                FROM userrole
-                WHERE userid = :userid
-            ),
-            role_permissions_expanded AS (
+            WITH unnested_actions AS (
                 SELECT
                     rp.roleid,
                     rp.menuid,
-                    (string_to_array(rp.actionid, ',')::int[]) AS action_array
+                    UNNEST(rp.actionid) AS actionid
                 FROM rolepermission rp
-                JOIN user_roles ur ON ur.roleid = rp.roleid
-            ),
-            unnested_actions AS (
-                SELECT
-                    rpe.roleid,
-                    rpe.menuid,
-                    UNNEST(rpe.action_array) AS actionid
-                FROM role_permissions_expanded rpe
-            ),
-            permissions AS (
-                SELECT
-                    m.menuid,
-                    m.parentid,
-                    m.menuname,
-                    m.icon,
-                    m.seq,
-                    m."path",
-                    ARRAY_AGG(DISTINCT ua.actionid ORDER BY ua.actionid) AS actions
-                FROM unnested_actions ua
-                LEFT JOIN menu m ON m.menuid = ua.menuid
-                GROUP BY m.menuid, m.parentid, m.menuname, m.icon, m.seq, m."path"
-                ORDER BY m.seq
-            ),
-            has_li000 AS (
-                SELECT 1 AS ok
-                FROM permissions
-                WHERE menuid = 'LI000'
-                  AND 1 = ANY(actions)
-            ),
-            cameras AS (
+                WHERE rp.roleid = ANY(:roleids)
+            )
+            SELECT
+                m.menuid,
+                m.parentid,
+                m.menuname,
+                m.icon,
+                m.seq,
+                m."path" AS path,
+                ARRAY_AGG(DISTINCT ua.actionid ORDER BY ua.actionid) AS actions
+            FROM unnested_actions ua
+            LEFT JOIN menu m ON m.menuid = ua.menuid
+            GROUP BY m.menuid, m.parentid, m.menuname, m.icon, m.seq, m."path"
+            ORDER BY m.seq
+        """)
+        rows = [dict(row._mapping) for row in db.execute(sql, {"roleids": list(roleids)})]
+        return rows, _etag(rows)
+
+    def _camera_menus(self, db: Session) -> Tuple[List[dict], str]:
+        sql = text("""
+            WITH cameras AS (
                 SELECT
                     c.cameraid,
                     c.cameraname,
@@ -110,62 +140,67 @@ class PermissionDB:
                 FROM camera c
                 WHERE c.camerastatus = true
                   AND c.isdeleted = false
-                ORDER BY c.cameraname
-            ),
-            locations AS (
+            )
+            SELECT * FROM (
                 SELECT DISTINCT
-                    cameralocation,
-                    0 AS loc_seq
+                    cameralocation AS menuid,
+                    'LI000' AS parentid,
+                    cameralocation AS menuname,
+                    '' AS icon,
+                    0::bigint AS seq,
+                    '' AS path,
+                    ARRAY[1]::integer[] AS actions,
+                    0 AS part
                 FROM cameras
-                ORDER BY cameralocation
-            ),
-            camera_list AS (
-                SELECT
-                    c.*,
-                    ROW_NUMBER() OVER (PARTITION BY c.cameralocation ORDER BY c.cameraname) AS cam_seq
-                FROM cameras c
-            )
-
-            SELECT
-                menuid,
-                parentid,
-                menuname,
-                icon,
-                seq,
-                path,
-                actions
-            FROM permissions
+            ) l
 
             UNION ALL
 
             SELECT
-                l.cameralocation AS menuid,
-                'LI000' AS parentid,
-                l.cameralocation AS menuname,
+                cameraid AS menuid,
+                cameralocation AS parentid,
+                cameraname AS menuname,
                 '' AS icon,
-                l.loc_seq AS seq,
-                '' AS path,
-                ARRAY[1]::integer[] AS actions
-            FROM locations l
-            JOIN has_li000 h ON TRUE
-
-            UNION ALL
+                ROW_NUMBER() OVER (PARTITION BY cameralocation ORDER BY cameraname) AS seq,
+                path,
+                ARRAY[1]::integer[] AS actions,
+                1 AS part
+            FROM cameras
 
-            SELECT
-                cl.cameraid AS menuid,
-                cl.cameralocation AS parentid,
-                cl.cameraname AS menuname,
-                '' AS icon,
-                cl.cam_seq AS seq,
-                cl.path AS path,
-                ARRAY[1]::integer[] AS actions
-            FROM camera_list cl
-            JOIN has_li000 h ON TRUE
+            ORDER BY part, parentid, menuname
         """)
+        rows = []
+        for row in db.execute(sql):
+            row = dict(row._mapping)
+            del row["part"]
+            rows.append(row)
+        return rows, _etag(rows)
+
+def _etag(value) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, default=str, sort_keys=True)
+    return '"' + hashlib.sha1(value.encode("utf-8")).hexdigest() + '"'
+
+# ("user", userid) -> role ids, ("roles", role ids) -> (menus, etag),
+# ("cameras",) -> (camera submenu, etag). Writers call the invalidate_* helpers
+# below; the TTL picks up changes made by other workers.
+permission_cache = QueryCache(
+    maxsize=int(os.getenv("PERMISSION_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("PERMISSION_CACHE_TTL", "300")),
+)
 
-        result = db.execute(sql, {"userid": userid})
-        rows = result.fetchall()
+def invalidate_user_permissions(*userids: str):
+    """After a user's roles change."""
+    for userid in userids:
+        permission_cache.invalidate(("user", userid))
 
-        return [dict(row._mapping) for row in rows]
+def invalidate_role_permissions(roleid=None):
+    """After a role's permissions change; roleid=None drops every role set (and user -> roles)."""
+    if roleid is None:
+        permission_cache.invalidate_where(lambda key: key[0] in ("roles", "user"))
+    else:
+        permission_cache.invalidate_where(lambda key: key[0] == "roles" and roleid in key[1])
 
-  
\ No newline at end of file
+def invalidate_camera_permissions():
+    """After cameras are added, changed or removed."""
+    permission_cache.invalidate(("cameras",))
@@ -0,0 +1,101 @@
+from database.connect_to_db import DATABASE_URL
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+import select
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+
+class PgListener:
+    """
+    Background thread that LISTENs on PostgreSQL channels and calls the
+    registered handlers with each NOTIFY payload.
+
+    Uses its own connection (not one from the pool). After a reconnect the
+    handlers are called with payload=None because notifications may have been
+    missed in between.
+    """
+
+    def __init__(self, dsn: str = DATABASE_URL, poll_timeout: float = 5.0, retry_delay: float = 3.0):
+        self.dsn = dsn
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self._handlers: Dict[str, List[Callable[[Optional[str]], None]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+
+    def subscribe(self, channel: str, handler: Callable[[Optional[str]], None]):
+        with self._lock:
+            self._handlers[channel].append(handler)
+            conn = self._conn
+        if conn is not None:
+            # already listening on other channels: LISTEN on the new one as well
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{channel}"')
+            except psycopg2.Error as e:
+                print(f"LISTEN {channel} failed: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_timeout + 1)
+
+    def _dispatch(self, channel: str, payload: Optional[str]):
+        with self._lock:
+            handlers = list(self._handlers.get(channel, []))
+        for handler in handlers:
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"Notify handler error ({channel}): {e}")
+
+    def _run(self):
+        first = True
+        while not self._stop.is_set():
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with self._lock:
+                    channels = list(self._handlers)
+                    self._conn = conn
+                with conn.cursor() as cur:
+                    for channel in channels:
+                        cur.execute(f'LISTEN "{channel}"')
+
+                if not first:
+                    for channel in channels:
+                        self._dispatch(channel, None)
+                first = False
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except psycopg2.Error as e:
+                print(f"PgListener error: {e}")
+                first = False
+                time.sleep(self.retry_delay)
+            finally:
+                with self._lock:
+                    conn, self._conn = self._conn, None
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except psycopg2.Error:
+                        pass
+
+pg_listener = PgListener()
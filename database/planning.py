@@ -1,11 +1,12 @@
 from database.connect_to_db import engine, Session, text, SQLAlchemyError
+from database.suggest import suggest_index
 from fastapi import HTTPException
 from datetime import datetime
 from fastapi.responses import JSONResponse
 import database.schemas as schemas
 from typing import Union, Dict, Any
 from fastapi import UploadFile
-import pandas as pd
+from database.upload import UploadSpec, upload_file
 
 def error_response(code: int, message: str):
     return JSONResponse( status_code=code, content={"detail": {"error": message}} )
@@ -13,6 +14,24 @@ def error_response(code: int, message: str):
 def success_response(code: int, content: Union[Dict[str, Any], str]):
     return JSONResponse( status_code=code, content=content)
 
+PLANNING_UPLOAD = UploadSpec(
+    table="planning",
+    label="plan",
+    columns={
+        "Plan ID": "planid",
+        "Product ID": "prodid",
+        "Lot No": "prodlot",
+        "Line ID": "prodline",
+        "Quantity": "quantity",
+        "Start Date": "startdatetime",
+        "End Date": "enddatetime",
+    },
+    datetimes=("startdatetime", "enddatetime"),
+    required=("planid",),
+    key=("planid",),
+    soft_delete=False,
+)
+
 class PlanningDB:
     def _fetch_all(self, query: str, params: dict = None):
         try:
@@ -29,35 +48,23 @@ class PlanningDB:
     def get_planning(self):
         return self._fetch_all("SELECT * FROM planning")
     
-    def suggest_planid(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT prodid FROM planning
-            WHERE LOWER(prodid) LIKE LOWER(:keyword)
-            ORDER BY prodid ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["prodid"], "label": row["prodid"]} for row in rows]
+    def suggest_planid(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("planid", q, mode=mode)
+
+    async def suggest_planid_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("planid", q, mode=mode)
     
-    def suggest_plan_lotno(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT prodlot FROM planning
-            WHERE LOWER(prodlot) LIKE LOWER(:keyword)
-            ORDER BY prodlot ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["prodlot"], "label": row["prodlot"]} for row in rows]
+    def suggest_plan_lotno(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("plan_lotno", q, mode=mode)
+
+    async def suggest_plan_lotno_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("plan_lotno", q, mode=mode)
     
-    def suggest_plan_lineid(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT prodline FROM planning
-            WHERE LOWER(prodline) LIKE LOWER(:keyword)
-            ORDER BY prodline ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["prodline"], "label": row["prodline"]} for row in rows]
+    def suggest_plan_lineid(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("plan_lineid", q, mode=mode)
+
+    async def suggest_plan_lineid_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("plan_lineid", q, mode=mode)
     
     def add_planning(self, plan: schemas.PlanningCreate, db: Session):
         now = datetime.now()
@@ -110,6 +117,7 @@ class PlanningDB:
         })
 
         db.commit()
+        suggest_index.invalidate("planning")
         return success_response(200, {"planid": plan.planid, "createddate": str(now)})
 
     def update_planning(self, planid: str, plan: schemas.PlanningUpdate, db: Session):
@@ -160,6 +168,7 @@ class PlanningDB:
 
           db.execute(update_sql, update_fields)
           db.commit()
+          suggest_index.invalidate("planning")
           return success_response(200, {"planid": update_fields.get("planid", planid), "updateddate": str(now)})
       except Exception as e:
           db.rollback()
@@ -172,53 +181,8 @@ class PlanningDB:
 
         db.execute(text("DELETE FROM planning WHERE planid = :planid"), {"planid": planid})
         db.commit()
+        suggest_index.invalidate("planning")
         return success_response(200,{"planid": planid, "isdeleted": True})
 
-    async def upload_planning(uploadby: str, file: UploadFile, db: Session):
-      try:
-        now = datetime.now()
-
-        # ตรวจสอบประเภทไฟล์
-        filename = file.filename.lower()
-        file.file.seek(0)
-        if filename.endswith(".xlsx") or filename.endswith(".xls"):
-            df = pd.read_excel(file.file, engine="openpyxl")
-        elif filename.endswith(".csv"):
-            df = pd.read_csv(file.file)
-        else:
-            raise error_response(400, "File must be .xlsx or .csv")
-
-        # แปลงข้อมูลแต่ละแถวเป็น dict ที่ตรงกับ SQL
-        role_data = []
-        for _, row in df.iterrows():
-            role_data.append({
-                "planid": row.get("Plan ID"),
-                "prodid": row.get("Product ID"),
-                "prodlot": row.get("Lot No"),
-                "prodline": row.get("Line ID"),
-                "quantity": row.get("Quantity"),
-                "rolename": row.get("Role Name"),
-                "startdatetime": pd.to_datetime(row.get("Start Date")) if pd.notnull(row.get("Start Date")) else None,
-                "enddatetime": pd.to_datetime(row.get("End Date")) if pd.notnull(row.get("End Date")) else None,
-                "createdby": uploadby,
-                "createddate": now,
-            })
-
-        # SQL สำหรับ insert
-        insert_sql = """
-            INSERT INTO planning (
-                planid, prodid, prodlot, prodline, quantity, startdatetime, enddatetime, createdby, createddate
-            )
-            VALUES (
-                :planid, :prodid, :prodlot, :prodline, :quantity, :startdatetime, :enddatetime, :createdby, :createddate
-            )
-        """
-        # ทำ bulk insert
-        db.execute(text(insert_sql), role_data)
-        db.commit()
-        return success_response(200,{"message": f"{len(role_data)} records uploaded successfully!"})
- 
-      except Exception as e:
-          print(f"Error uploading planning: {e}")
-          db.rollback()
-          raise error_response(500, "Failed to upload plan")
+    def upload_planning(uploadby: str, file: UploadFile, db: Session, mode: str = "insert"):
+        return upload_file(PLANNING_UPLOAD, uploadby, file, db, mode)
@@ -1,10 +1,11 @@
-from database.connect_to_db import engine, Session, text, SQLAlchemyError
+from database.connect_to_db import engine, Session, text, SQLAlchemyError, fetch_all_async
+from database.suggest import suggest_index
 from datetime import datetime
 from fastapi.responses import JSONResponse
 import database.schemas as schemas
 from typing import Union, Dict, Any
 from fastapi import UploadFile
-import pandas as pd
+from database.upload import UploadSpec, upload_file
 
 def error_response(code: int, message: str):
     return JSONResponse( status_code=code, content={"detail": {"error": message}} )
@@ -12,6 +13,37 @@ def error_response(code: int, message: str):
 def success_response(code: int, content: Union[Dict[str, Any], str]):
     return JSONResponse( status_code=code, content=content)
 
+PRODUCT_UPLOAD = UploadSpec(
+    table="product",
+    label="product",
+    columns={
+        "Product ID": "prodid",
+        "Product Name": "prodname",
+        "Product Type ID": "prodtypeid",
+        "Serial No": "prodserial",
+        "Status": "prodstatus",
+    },
+    defaults={"prodstatus": True},
+    booleans=("prodstatus",),
+    required=("prodid",),
+    key=("prodid",),
+)
+
+PRODUCT_TYPE_UPLOAD = UploadSpec(
+    table="prodtype",
+    label="product types",
+    columns={
+        "Product Type ID": "prodtypeid",
+        "Product Type": "prodtype",
+        "Description": "proddescription",
+        "Status": "prodstatus",
+    },
+    defaults={"prodstatus": True},
+    booleans=("prodstatus",),
+    required=("prodtypeid",),
+    key=("prodtypeid",),
+)
+
 class ProductDB:
     def _fetch_all(self, query: str, params: dict = None):
         try:
@@ -25,61 +57,54 @@ class ProductDB:
             print(f"Database error: {e}")
             return []
 
+    async def _fetch_all_async(self, query: str, params: dict = None):
+        try:
+            return await fetch_all_async(query, params)
+        except SQLAlchemyError as e:
+            print(f"Database error: {e}")
+            return []
+
     def get_products(self):
         return self._fetch_all("SELECT * FROM product WHERE isdeleted = false")
+
+    async def get_products_async(self):
+        return await self._fetch_all_async("SELECT * FROM product WHERE isdeleted = false")
     
     def get_product_types(self):
         return self._fetch_all("SELECT * FROM prodtype WHERE isdeleted = false")
 
-    def suggest_product_id(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT prodid FROM product
-            WHERE isdeleted = false AND prodstatus = true AND LOWER(prodid) LIKE LOWER(:keyword)
-            ORDER BY prodid ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["prodid"], "label": row["prodid"]} for row in rows]
+    async def get_product_types_async(self):
+        return await self._fetch_all_async("SELECT * FROM prodtype WHERE isdeleted = false")
+
+    def suggest_product_id(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("product_id", q, mode=mode)
+
+    async def suggest_product_id_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("product_id", q, mode=mode)
     
-    def suggest_product_name(self, q: str):
-      rows = self._fetch_all("""
-          SELECT DISTINCT prodname FROM product
-          WHERE isdeleted = false AND prodstatus = true AND LOWER(prodname) LIKE LOWER(:keyword)
-          ORDER BY prodname ASC
-          LIMIT 10; """,
-          {"keyword": q + "%"}
-      )
-      return [{"value": row["prodname"], "label": row["prodname"]} for row in rows]
+    def suggest_product_name(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("product_name", q, mode=mode)
+
+    async def suggest_product_name_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("product_name", q, mode=mode)
     
-    def suggest_serial_no(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT prodserial FROM product
-            WHERE isdeleted = false AND prodstatus = true AND LOWER(prodserial) LIKE LOWER(:keyword)
-            ORDER BY prodserial ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["prodserial"], "label": row["prodserial"]} for row in rows]
-
-    def suggest_producttype_id(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT prodtypeid FROM prodtype
-            WHERE isdeleted = false AND prodstatus = true AND LOWER(prodtypeid) LIKE LOWER(:keyword)
-            ORDER BY prodtypeid ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["prodtypeid"], "label": row["prodtypeid"]} for row in rows]
+    def suggest_serial_no(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("serial_no", q, mode=mode)
+
+    async def suggest_serial_no_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("serial_no", q, mode=mode)
+
+    def suggest_producttype_id(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("producttype_id", q, mode=mode)
+
+    async def suggest_producttype_id_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("producttype_id", q, mode=mode)
     
-    def suggest_producttype_name(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT prodtype FROM prodtype
-            WHERE isdeleted = false AND prodstatus = true AND LOWER(prodtype) LIKE LOWER(:keyword)
-            ORDER BY prodtype ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["prodtype"], "label": row["prodtype"]} for row in rows]
+    def suggest_producttype_name(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("producttype_name", q, mode=mode)
+
+    async def suggest_producttype_name_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("producttype_name", q, mode=mode)
     
 
 class ProductService:
@@ -147,6 +172,7 @@ class ProductService:
             })
 
         db.commit()
+        suggest_index.invalidate("product")
         return success_response(200, {"prodid": product.prodid, "createddate": str(now)})
 
     @staticmethod
@@ -188,6 +214,7 @@ class ProductService:
                         {"old_prodid": prodid}
                     )
                   db.commit()
+                  suggest_index.invalidate("product")
                   update_fields["update_prodid"] = product.prodid
 
       # field other
@@ -205,6 +232,7 @@ class ProductService:
       try:
         db.execute(update_sql, update_fields)
         db.commit()
+        suggest_index.invalidate("product")
         return success_response(200, { "prodid": update_fields.get("prodid", prodid), "updateddate": str(now)})
       except Exception as e:
         db.rollback()
@@ -217,55 +245,12 @@ class ProductService:
 
         db.execute(text("UPDATE product SET isdeleted = true WHERE prodid = :prodid"), {"prodid": prodid})
         db.commit()
+        suggest_index.invalidate("product")
         return success_response(200, {"prodid": prodid, "isdeleted": True})
     
     @staticmethod
-    async def upload_products(uploadby: str, file: UploadFile, db: Session):
-        try:
-            now = datetime.now()
-
-            # ตรวจสอบประเภทไฟล์
-            filename = file.filename.lower()
-            file.file.seek(0)
-            if filename.endswith(".xlsx") or filename.endswith(".xls"):
-                df = pd.read_excel(file.file, engine="openpyxl")
-            elif filename.endswith(".csv"):
-                df = pd.read_csv(file.file)
-            else:
-                raise error_response(400, "File must be .xlsx or .csv")
-
-            # แปลงข้อมูลแต่ละแถวเป็น dict ที่ตรงกับ SQL
-            product_data = []
-            for _, row in df.iterrows():
-                product_data.append({
-                    "prodid": row.get("Product ID"),
-                    "prodname": row.get("Product Name"),
-                    "prodtypeid": row.get("Product Type ID"),
-                    "prodserial": row.get("Serial No"),
-                    "prodstatus": row.get("Status", "Active"),
-                    "createdby": uploadby,
-                    "createddate": now,
-                })
-
-            # SQL สำหรับ insert
-            insert_sql = """
-                INSERT INTO product (
-                    prodid, prodname, prodtypeid, prodserial, prodstatus, createdby, createddate
-                )
-                VALUES (
-                    :prodid, :prodname, :prodtypeid, :prodserial, :prodstatus, :createdby, :createddate
-                )
-            """
-
-            # ทำ bulk insert
-            db.execute(text(insert_sql), product_data)
-            db.commit()
-            return success_response(200,{"message": f"{len(product_data)} records uploaded successfully!"})
-
-        except Exception as e:
-            print(f"Error uploading product: {e}")
-            db.rollback()
-            raise error_response(500, "Failed to upload product")
+    def upload_products(uploadby: str, file: UploadFile, db: Session, mode: str = "insert"):
+        return upload_file(PRODUCT_UPLOAD, uploadby, file, db, mode)
 
 
 class ProductTypeService:
@@ -326,6 +311,7 @@ class ProductTypeService:
                 "createddate": now
             })
         db.commit()
+        suggest_index.invalidate("prodtype")
         return success_response(200, {"prodid": prodtype.prodtypeid, "createddate": str(now)})
 
     @staticmethod
@@ -361,6 +347,7 @@ class ProductTypeService:
                         {"old_pprodtypeid": prodtypeid}
                     )
                     db.commit()
+                    suggest_index.invalidate("prodtype")
                     update_fields["update_prodtypeid"] = prodtype.prodtypeid
 
         if prodtype.prodtype is not None: update_fields["prodtype"] = prodtype.prodtype
@@ -377,6 +364,7 @@ class ProductTypeService:
         try:
           db.execute(update_sql, update_fields)
           db.commit()
+          suggest_index.invalidate("prodtype")
           return success_response(200, {"prodtypeid": update_fields.get("prodtypeid", prodtypeid), "updateddate": str(now)})
         except Exception as e:
             db.rollback()
@@ -389,54 +377,10 @@ class ProductTypeService:
 
         db.execute(text("UPDATE prodtype SET isdeleted = true WHERE prodtypeid = :prodtypeid"), {"prodtypeid": prodtypeid})
         db.commit()
+        suggest_index.invalidate("prodtype")
         return success_response(200,{"prodtypeid": prodtypeid, "isdeleted": True})
 
     @staticmethod
-    async def upload_product_types(uploadby: str, file: UploadFile, db: Session):
-        try:
-            now = datetime.now()
-
-            # ตรวจสอบประเภทไฟล์
-            filename = file.filename.lower()
-            file.file.seek(0)
-            if filename.endswith(".xlsx") or filename.endswith(".xls"):
-                df = pd.read_excel(file.file, engine="openpyxl")
-            elif filename.endswith(".csv"):
-                df = pd.read_csv(file.file)
-            else:
-                raise error_response(400, "File must be .xlsx or .csv")
-
-            # แปลงข้อมูลแต่ละแถวเป็น dict ที่ตรงกับ SQL
-            product_types_data = []
-            for _, row in df.iterrows():
-                product_types_data.append({
-                    "prodtypeid": row.get("Product Type ID"),
-                    "prodtype": row.get("Product Type"),
-                    "proddescription": row.get("Description"),
-                    "prodstatus": row.get("Status", "Active"),
-                    # "createdby": row.get("Created By", "system"),
-                    # "createddate": pd.to_datetime(row.get("Created Date")) if pd.notnull(row.get("Created Date")) else None,
-                    # "updatedby": row.get("Updated By", "system"),
-                    # "updateddate": pd.to_datetime(row.get("Updated Date")) if pd.notnull(row.get("Updated Date")) else None,
-                })
-
-            # SQL สำหรับ insert
-            insert_sql = """
-                INSERT INTO prodtype (
-                    prodtypeid, prodtype, proddescription, prodstatus, createdby, createddate
-                )
-                VALUES (
-                    :prodtypeid, :prodtype, :proddescription, :prodstatus, :createdby, :createddate
-                )
-            """
-
-            # ทำ bulk insert
-            db.execute(text(insert_sql), product_types_data)
-            db.commit()
-            return success_response(200,{"message": f"{len(product_types_data)} records uploaded successfully!"})
-
-        except Exception as e:
-            print(f"Error uploading product types: {e}")
-            db.rollback()
-            raise error_response(500, "Failed to upload product types")
+    def upload_product_types(uploadby: str, file: UploadFile, db: Session, mode: str = "insert"):
+        return upload_file(PRODUCT_TYPE_UPLOAD, uploadby, file, db, mode)
  
@@ -0,0 +1,178 @@
+from database.connect_to_db import engine, text, SQLAlchemyError
+from database.pg_listener import PgListener, pg_listener
+from starlette.concurrency import run_in_threadpool
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+import asyncio
+import json
+import os
+
+# "postgres": LISTEN/NOTIFY, reaches every worker / process; "memory": this process only
+PUBSUB_BACKEND = os.getenv("LIVE_PUBSUB_BACKEND", "postgres")
+# NOTIFY payloads are limited to 8000 bytes; larger messages go through live_update_payload
+NOTIFY_INLINE_LIMIT = 7000
+# seconds a live_update_payload row is kept for slow listeners
+PAYLOAD_RETENTION = int(os.getenv("LIVE_PAYLOAD_RETENTION", "60"))
+PAYLOAD_CLEANUP_INTERVAL = 30.0
+
+Handler = Callable[[dict], None]
+
+class PubSub:
+    """
+    Channel -> handlers. Handlers are plain functions called on the event loop
+    passed to start(), once per published message, in every process that
+    subscribed.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    def subscribe(self, channel: str, handler: Handler):
+        self._handlers[channel].append(handler)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self._loop = loop or asyncio.get_event_loop()
+
+    def stop(self):
+        pass
+
+    async def publish(self, channel: str, message: dict):
+        raise NotImplementedError
+
+    def _deliver(self, channel: str, message: dict):
+        # always on the event loop thread
+        self.received += 1
+        for handler in list(self._handlers.get(channel, [])):
+            try:
+                handler(message)
+            except Exception as e:
+                self.errors += 1
+                print(f"PubSub handler error ({channel}): {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+class InMemoryPubSub(PubSub):
+    """Same-process delivery (single worker, tests)."""
+
+    name = "memory"
+
+    async def publish(self, channel: str, message: dict):
+        self.published += 1
+        self._deliver(channel, message)
+
+class PostgresPubSub(PubSub):
+    """
+    Delivery through PostgreSQL NOTIFY, so a push received by one worker
+    reaches subscribers on all of them. Messages up to NOTIFY_INLINE_LIMIT
+    bytes travel in the payload ("m:<json>"); larger ones are written to
+    live_update_payload and only the row id is sent ("r:<id>"). Live images do
+    not come through here (see store_live_frame), so that table should see
+    little traffic; a task started by start() prunes it.
+    """
+
+    name = "postgres"
+
+    def __init__(self, listener: PgListener = pg_listener):
+        super().__init__()
+        self.listener = listener
+        self._listening = set()
+        self._prune_task: Optional[asyncio.Task] = None
+        self.by_reference = 0
+
+    def subscribe(self, channel: str, handler: Handler):
+        super().subscribe(channel, handler)
+        if channel not in self._listening:
+            self._listening.add(channel)
+            self.listener.subscribe(channel, lambda payload: self._on_notify(channel, payload))
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        super().start(loop)
+        self.listener.start()
+        if self._prune_task is None:
+            self._prune_task = self._loop.create_task(self._prune_loop())
+
+    def stop(self):
+        self.listener.stop()
+        if self._prune_task is not None:
+            self._prune_task.cancel()
+            self._prune_task = None
+
+    async def _prune_loop(self):
+        while True:
+            try:
+                await run_in_threadpool(self._prune)
+            except Exception as e:
+                print(f"PubSub prune error: {e}")
+            await asyncio.sleep(PAYLOAD_CLEANUP_INTERVAL)
+
+    def _prune(self):
+        with engine.begin() as conn:
+            conn.execute(text("""
+                DELETE FROM live_update_payload
+                WHERE created < now() - make_interval(secs => :retention)
+            """), {"retention": PAYLOAD_RETENTION})
+
+    async def publish(self, channel: str, message: dict):
+        await run_in_threadpool(self._publish, channel, json.dumps(message, default=str))
+        self.published += 1
+
+    def _publish(self, channel: str, body: str):
+        with engine.begin() as conn:
+            if len(body.encode("utf-8")) <= NOTIFY_INLINE_LIMIT:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": "m:" + body})
+            else:
+                self.by_reference += 1
+                conn.execute(text("""
+                    WITH ins AS (
+                        INSERT INTO live_update_payload (channel, payload)
+                        VALUES (:channel, :body)
+                        RETURNING id
+                    )
+                    SELECT pg_notify(:channel, 'r:' || id) FROM ins
+                """), {"channel": channel, "body": body})
+
+    def _on_notify(self, channel: str, payload: Optional[str]):
+        # listener thread
+        if not payload:
+            # reconnect: missed updates are simply superseded by the next ones
+            return
+        try:
+            if payload.startswith("r:"):
+                with engine.connect() as conn:
+                    body = conn.execute(
+                        text("SELECT payload FROM live_update_payload WHERE id = :id"),
+                        {"id": int(payload[2:])},
+                    ).scalar()
+                if body is None:
+                    return
+            else:
+                body = payload[2:]
+            message = json.loads(body)
+        except (SQLAlchemyError, ValueError) as e:
+            self.errors += 1
+            print(f"PubSub receive error ({channel}): {e}")
+            return
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._deliver, channel, message)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "by_reference": self.by_reference}
+
+def create_pubsub(backend: str = PUBSUB_BACKEND) -> PubSub:
+    if backend == "memory":
+        return InMemoryPubSub()
+    if backend == "postgres":
+        return PostgresPubSub()
+    raise ValueError(f"Unknown pub/sub backend: {backend}")
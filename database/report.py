@@ -1,9 +1,47 @@
-from database.connect_to_db import engine, Session, text, SQLAlchemyError
+from database.connect_to_db import engine, Session, text, SQLAlchemyError, fetch_all_async
+from database.suggest import suggest_index
 from fastapi import HTTPException
 import database.schemas as schemas
 from fastapi.responses import JSONResponse
 import database.schemas as schemas
-from typing import Union, Dict, Any
+from database.bulk import copy_rows
+from pydantic import ValidationError
+from typing import Union, Dict, Any, Optional, List
+from datetime import datetime
+import psycopg2
+import base64
+import json
+
+PRODUCT_DEFECT_PAGE_SIZE = 100
+PRODUCT_DEFECT_MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 2000
+
+# productdefectresult columns written by the bulk ingest, filled from
+# ReportProductResult by _product_result_row (the lot lives in defectsummary,
+# so the bulk schemas do not take one)
+PRODUCT_RESULT_COLUMNS = ("defecttime", "prodid", "prodname", "defectid", "defecttype", "cameraid", "prodstatus")
+# columns written by the bulk ingest (same as add_product_detail)
+PRODUCT_DETAIL_COLUMNS = (
+    "productid", "productname", "serialno", "date", "time", "lotno",
+    "defecttype", "cameraid", "status", "comment",
+)
+HISTORY_COLUMNS = ("date", "time", "updatedby", "productid")
+# defectsummary columns written by the write-behind ingest, filled from
+# ReportDefectCreate by _write_defects (total is ok + ng, not stored), and
+# updated by update_report_defect
+DEFECT_SUMMARY_COLUMNS = ("prodid", "prodlot", "defectid", "totalok", "totalng")
+
+def encode_cursor(defecttime: Optional[datetime], resultid: int) -> str:
+    raw = json.dumps([defecttime.isoformat() if defecttime else None, resultid])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        defecttime, resultid = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(defecttime) if defecttime else None), int(resultid)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
 
 def error_response(code: int, message: str):
     return JSONResponse( status_code=code, content={"detail": {"error": message}} )
@@ -24,21 +62,164 @@ class ReportDB:
             print(f"Database error: {e}")
             return []
 
+    async def _fetch_all_async(self, query: str, params: dict = None):
+        try:
+            return await fetch_all_async(query, params)
+        except SQLAlchemyError as e:
+            print(f"Database error: {e}")
+            return []
+
     def get_defect_summary(self):
         return self._fetch_all("SELECT * FROM defectsummary")
+
+    async def get_defect_summary_async(self):
+        return await self._fetch_all_async("SELECT * FROM defectsummary")
     
-    def get_product_defect_results(self):
-        return self._fetch_all("SELECT * FROM productdefectresult")
-    
-    def suggest_defect_lotno(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT prodlot FROM defectsummary
-            WHERE LOWER(prodlot) LIKE LOWER(:keyword)
-            ORDER BY prodlot ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
+    def _stream(self, query: str, params: dict = None, batch_size: int = EXPORT_BATCH_SIZE):
+        # server-side cursor: rows are fetched batch_size at a time, never all at once
+        with engine.connect().execution_options(stream_results=True, yield_per=batch_size) as conn:
+            result = conn.execute(text(query), params or {})
+            yield list(result.keys())
+            for row in result:
+                yield tuple(row)
+
+    def _product_defect_filters(self, start, end, cameraid, productid, productname, lotno, defecttype):
+        conditions = []
+        params = {}
+        if start:
+            conditions.append("p.defecttime >= :start")
+            params["start"] = start
+        if end:
+            conditions.append("p.defecttime <= :end")
+            params["end"] = end
+        if cameraid:
+            conditions.append("p.cameraid = :cameraid")
+            params["cameraid"] = cameraid
+        if productid:
+            conditions.append("p.prodid = :productid")
+            params["productid"] = productid
+        if productname:
+            conditions.append("p.prodname = :productname")
+            params["productname"] = productname
+        if defecttype:
+            conditions.append("p.defecttype = :defecttype")
+            params["defecttype"] = defecttype
+        if lotno:
+            conditions.append("""EXISTS (
+                SELECT 1 FROM defectsummary ds
+                WHERE ds.prodid = p.prodid AND ds.prodlot = :lotno
+            )""")
+            params["lotno"] = lotno
+        return conditions, params
+
+    def _product_defect_page_query(
+        self, start, end, cameraid, productid, productname, lotno, defecttype, cursor, limit
+    ):
+        # keyset pagination on (defecttime, resultid) DESC, newest first
+        limit = max(1, min(limit, PRODUCT_DEFECT_MAX_PAGE_SIZE))
+        conditions, params = self._product_defect_filters(
+            start, end, cameraid, productid, productname, lotno, defecttype
         )
-        return [{"value": row["prodlot"], "label": row["prodlot"]} for row in rows]
+        params["limit"] = limit + 1
+
+        if cursor:
+            last_time, last_id = decode_cursor(cursor)
+            params["last_id"] = last_id
+            if last_time is None:
+                # NULL defecttime rows sort first in DESC order
+                conditions.append("((p.defecttime IS NULL AND p.resultid < :last_id) OR p.defecttime IS NOT NULL)")
+            else:
+                conditions.append("(p.defecttime, p.resultid) < (:last_time, :last_id)")
+                params["last_time"] = last_time
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"""
+            SELECT p.* FROM productdefectresult p
+            {where}
+            ORDER BY p.defecttime DESC, p.resultid DESC
+            LIMIT :limit
+        """
+        return sql, params, limit
+
+    def _product_defect_page(self, rows, limit: int):
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["defecttime"], rows[-1]["resultid"])
+        return {"product_defect_results": [dict(row) for row in rows], "next_cursor": next_cursor}
+
+    def get_product_defect_results(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        cameraid: Optional[str] = None,
+        productid: Optional[str] = None,
+        productname: Optional[str] = None,
+        lotno: Optional[str] = None,
+        defecttype: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = PRODUCT_DEFECT_PAGE_SIZE,
+    ):
+        sql, params, limit = self._product_defect_page_query(
+            start, end, cameraid, productid, productname, lotno, defecttype, cursor, limit
+        )
+        return self._product_defect_page(self._fetch_all(sql, params), limit)
+
+    async def get_product_defect_results_async(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        cameraid: Optional[str] = None,
+        productid: Optional[str] = None,
+        productname: Optional[str] = None,
+        lotno: Optional[str] = None,
+        defecttype: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = PRODUCT_DEFECT_PAGE_SIZE,
+    ):
+        sql, params, limit = self._product_defect_page_query(
+            start, end, cameraid, productid, productname, lotno, defecttype, cursor, limit
+        )
+        return self._product_defect_page(await self._fetch_all_async(sql, params), limit)
+
+    def stream_product_defect_results(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        cameraid: Optional[str] = None,
+        productid: Optional[str] = None,
+        productname: Optional[str] = None,
+        lotno: Optional[str] = None,
+        defecttype: Optional[str] = None,
+    ):
+        """Header row, then every matching row as a tuple (for export)."""
+        conditions, params = self._product_defect_filters(
+            start, end, cameraid, productid, productname, lotno, defecttype
+        )
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._stream(f"""
+            SELECT p.* FROM productdefectresult p
+            {where}
+            ORDER BY p.defecttime, p.resultid
+        """, params)
+
+    def stream_defect_summary(self, productid: Optional[str] = None, lotno: Optional[str] = None):
+        conditions = []
+        params = {}
+        if productid:
+            conditions.append("prodid = :productid")
+            params["productid"] = productid
+        if lotno:
+            conditions.append("prodlot = :lotno")
+            params["lotno"] = lotno
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._stream(f"SELECT * FROM defectsummary {where}", params)
+    
+    def suggest_defect_lotno(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("defect_lotno", q, mode=mode)
+
+    async def suggest_defect_lotno_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("defect_lotno", q, mode=mode)
     
 
     #--- Product Defect Result -------------------------------------------------------------
@@ -99,33 +280,161 @@ class ReportDB:
         except SQLAlchemyError as e:
             raise error_response(500, str(e))
 
+    def _defect_ids(self, defecttypes, db: Session) -> Dict[str, Any]:
+        """defecttype name -> defectid, for the names the bulk items carry."""
+        names = [name for name in set(defecttypes) if name]
+        if not names:
+            return {}
+        rows = db.execute(text("""
+            SELECT defecttype, defectid FROM defecttype
+            WHERE defecttype = ANY(:names) AND isdeleted = false
+        """), {"names": names}).fetchall()
+        return {row.defecttype: row.defectid for row in rows}
+
+    def defect_type_exists(self, defecttype: str, db: Session) -> bool:
+        return defecttype in self._defect_ids([defecttype], db)
+
+    def _product_result_row(self, item: schemas.ReportProductResult, defect_ids: Dict[str, Any]) -> tuple:
+        # same order as PRODUCT_RESULT_COLUMNS
+        return (
+            item.datetime, item.productid, item.productname, defect_ids[item.defecttype],
+            item.defecttype, item.cameraid, item.status,
+        )
+
+    def _write_bulk(self, items: List[schemas.ReportProductBulkItem], defect_ids: Dict[str, Any], db: Session):
+        results, details, history = [], [], []
+        for item in items:
+            results.append(self._product_result_row(item, defect_ids))
+            detail = getattr(item, "detail", None)
+            if detail:
+                details.append(tuple(getattr(detail, c) for c in PRODUCT_DETAIL_COLUMNS))
+                history.extend(
+                    (h.date, h.time, h.updatedby, detail.productid) for h in detail.history
+                )
+        copy_rows(db, "productdefectresult", PRODUCT_RESULT_COLUMNS, results)
+        copy_rows(db, "productdetail", PRODUCT_DETAIL_COLUMNS, details)
+        copy_rows(db, "history", HISTORY_COLUMNS, history)
+
+    def _write_batch(self, writer, items: List[tuple], db: Session):
+        """
+        Write all (key, item) pairs in one transaction. If the database rejects
+        the batch, retry item by item (one savepoint each) so only the bad items
+        fail. Returns (key, status) pairs.
+        """
+        try:
+            writer([item for _, item in items], db)
+            db.commit()
+            return [(key, {"index": key, "status": "ok"}) for key, _ in items]
+        except (SQLAlchemyError, psycopg2.Error):
+            db.rollback()
+
+        statuses = []
+        for key, item in items:
+            try:
+                with db.begin_nested():
+                    writer([item], db)
+                statuses.append((key, {"index": key, "status": "ok"}))
+            except (SQLAlchemyError, psycopg2.Error) as e:
+                statuses.append((key, {"index": key, "status": "error", "error": str(e).strip()}))
+        db.commit()
+        return statuses
+
+    def _write_known_defects(self, writer, items: List[tuple], db: Session):
+        """
+        _write_batch for items that carry a defecttype name. Items whose type is
+        unknown (or deleted) fail without being written; the rest are written
+        with the resolved defect ids.
+        """
+        defect_ids = self._defect_ids((item.defecttype for _, item in items), db)
+        statuses, known = [], []
+        for key, item in items:
+            if item.defecttype in defect_ids:
+                known.append((key, item))
+            else:
+                statuses.append((key, {"index": key, "status": "error", "error": f"Unknown defect type: {item.defecttype}"}))
+        if known:
+            statuses.extend(self._write_batch(lambda batch, db: writer(batch, defect_ids, db), known, db))
+        return statuses
+
+    def write_report_products(self, items: List[tuple], db: Session):
+        return self._write_known_defects(self._write_bulk, items, db)
+
+    def _write_defects(self, items: List[schemas.ReportDefectCreate], defect_ids: Dict[str, Any], db: Session):
+        copy_rows(db, "defectsummary", DEFECT_SUMMARY_COLUMNS, (
+            (item.productid, item.lotno, defect_ids[item.defecttype], item.ok, item.ng)
+            for item in items
+        ))
+
+    def write_report_defects(self, items: List[tuple], db: Session):
+        statuses = self._write_known_defects(self._write_defects, items, db)
+        written = {key for key, status in statuses if status["status"] == "ok"}
+        suggest_index.update("defectsummary", {"prodlot": [item.lotno for key, item in items if key in written]})
+        return statuses
+
+    def bulk_add_report_products(self, records: List[Any], db: Session):
+        """
+        Validate every record, then COPY all valid ones in one transaction
+        (see _write_batch).
+        """
+        statuses = [None] * len(records)
+        valid = []
+        for i, record in enumerate(records):
+            try:
+                valid.append((i, schemas.ReportProductBulkItem(**record)))
+            except (ValidationError, TypeError) as e:
+                statuses[i] = {"index": i, "status": "error", "error": str(e)}
+
+        for i, status in self.write_report_products(valid, db):
+            statuses[i] = status
+
+        inserted = sum(1 for s in statuses if s["status"] == "ok")
+        return success_response(200, {
+            "inserted": inserted,
+            "failed": len(statuses) - inserted,
+            "results": statuses,
+        })
+
     #--- Report Defect Summary -------------------------------------------------------------
 
     def add_report_defect(self, item: schemas.ReportDefectCreate, db: Session):
         try:
-            db.execute(text("""
-                INSERT INTO defectsummary (lotno, producttype, defecttype, total, ok, ng)
-                VALUES (:lotno, :producttype, :defecttype, :total, :ok, :ng)
-            """), item.dict(by_alias=True))
+            defect_ids = self._defect_ids([item.defecttype], db)
+            if item.defecttype not in defect_ids:
+                return error_response(422, f"Unknown defect type: {item.defecttype}")
+            self._write_defects([item], defect_ids, db)
             db.commit()
+            suggest_index.update("defectsummary", {"prodlot": [item.lotno]})
             return success_response(200, {"status": "DefectSummary added", "lotNo": item.lotno})
         
-        except SQLAlchemyError as e:
-            raise error_response(500, str(e))
+        except (SQLAlchemyError, psycopg2.Error) as e:
+            db.rollback()
+            return error_response(500, str(e))
 
     def update_report_defect(self, lotno: str, item: schemas.ReportDefectUpdate, db: Session):
         try:
-            update_fields = item.dict(exclude_unset=True, by_alias=True)
+            fields = item.dict(exclude_unset=True)
+            # defectsummary keeps ok / ng and the defect id; producttype and
+            # total are not stored (total is ok + ng)
+            update_fields = {
+                column: fields[key]
+                for key, column in (("ok", "totalok"), ("ng", "totalng"))
+                if key in fields
+            }
+            if "defecttype" in fields:
+                defect_ids = self._defect_ids([fields["defecttype"]], db)
+                if fields["defecttype"] not in defect_ids:
+                    return error_response(422, f"Unknown defect type: {fields['defecttype']}")
+                update_fields["defectid"] = defect_ids[fields["defecttype"]]
             if not update_fields:
-                raise error_response(400, "No fields to update")
-            update_fields["lotno"] = lotno
-            set_clause = ", ".join([f"{k} = :{k}" for k in update_fields if k != "lotno"])
+                return error_response(400, "No fields to update")
+            set_clause = ", ".join([f"{k} = :{k}" for k in update_fields])
             db.execute(text(f"""
-                UPDATE defectsummary SET {set_clause} WHERE lotno = :lotno
-            """), update_fields)
+                UPDATE defectsummary SET {set_clause} WHERE prodlot = :prodlot
+            """), {**update_fields, "prodlot": lotno})
             db.commit()
             return success_response(200, {"status": "DefectSummary updated", "lotNo": lotno})
         
         except SQLAlchemyError as e:
-            raise error_response(500, str(e))
+            db.rollback()
+            return error_response(500, str(e))
 
@@ -1,4 +1,6 @@
 from database.connect_to_db import engine, Session, text, SQLAlchemyError
+from database.suggest import suggest_index
+from database.permission import invalidate_role_permissions
 from fastapi import HTTPException
 import database.schemas as schemas
 from datetime import datetime
@@ -23,20 +25,11 @@ class RoleDB:
             print(f"Database error: {e}")
             return []
 
-    def suggest_role_name(self, q: str):
-        try:
-            with engine.connect() as conn:
-                result = conn.execute(text("""
-                    SELECT rolename 
-                    FROM role 
-                    WHERE rolename ILIKE :q AND isdeleted = false 
-                    ORDER BY rolename 
-                    LIMIT 10
-                """), {"q": f"%{q}%"})
-                return [{"label": row.rolename, "value": row.rolename} for row in result]
-        except SQLAlchemyError as e:
-            print(f"Database error: {e}")
-            return []
+    def suggest_role_name(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("role_name", q, mode=mode)
+
+    async def suggest_role_name_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("role_name", q, mode=mode)
 
     def add_role(self, role: schemas.RoleCreate, db: Session):
         # Check if role already exists
@@ -64,6 +57,7 @@ class RoleDB:
                 "isdeleted": False
             })
             db.commit()
+            suggest_index.invalidate("role")
         except Exception as e:
             db.rollback()
             return error_response(500, f"Database error: {str(e)}")
@@ -116,6 +110,7 @@ class RoleDB:
         try:
             db.execute(update_sql, update_fields)
             db.commit()
+            suggest_index.invalidate("role")
             return success_response(200, {"roleid": update_fields.get("roleid", roleid), "updateddate": str(now)})
         except Exception as e:
             db.rollback()
@@ -131,6 +126,7 @@ class RoleDB:
         try:
             db.execute(update_sql, {"roleid": roleid})
             db.commit()
+            suggest_index.invalidate("role")
             return success_response(200, {"roleid": roleid})
         except Exception as e:
             db.rollback()
@@ -163,14 +159,8 @@ class RoleDB:
             
             permission_list = []
             for row in permissions:
-                # แปลง actionid string เป็น array of integers
-                actionid_str = str(row.actionid)
-                if ',' in actionid_str:
-                    # "1,2,3,4,5,6" → [1,2,3,4,5,6]
-                    actions = [int(x.strip()) for x in actionid_str.split(',') if x.strip().isdigit()]
-                else:
-                    # "1" → [1]
-                    actions = [int(actionid_str)] if actionid_str.isdigit() else [1]
+                # actionid is integer[] (migration 006)
+                actions = list(row.actionid or [])
                 
                 permission_list.append({
                     "menuid": row.menuid,
@@ -193,99 +183,88 @@ class RoleDB:
         """
         Update permissions for a role using (roleid, menuid) as PK - no permissionid needed
         Auto-add parent menus when child menus are selected
+
+        Only the difference against the stored rows is written: one multi-row
+        upsert for new/changed menus and one delete for removed ones.
         """
         try:
-            print(f"🔄 Starting update_role_permissions for roleId: {roleid}")
-            print(f"📋 Permissions data: {permissions_data}")
-            
             # ตรวจสอบว่า role มีอยู่จริง
             if not db.execute(text("SELECT 1 FROM role WHERE roleid = :roleid"), 
                              {"roleid": roleid}).first():
                 raise HTTPException(status_code=404, detail="Role not found")
 
-            # ดึงข้อมูล menu structure เพื่อหา parent menus
-            menu_query = text("""
-                SELECT menuid, parentid, menuname 
-                FROM menu 
-                ORDER BY seq
-            """)
-            menus = db.execute(menu_query).fetchall()
-            
-            # สร้าง mapping ของ parent-child relationships
-            menu_parents = {}
-            for menu in menus:
-                if menu.parentid:  # มี parent
-                    menu_parents[menu.menuid] = menu.parentid
-
-            # ลบ permissions เก่าทั้งหมดของ role นี้
-            delete_sql = text("DELETE FROM rolepermission WHERE roleid = :roleid")
-            db.execute(delete_sql, {"roleid": roleid})
-            print(f"🗑️ Deleted existing permissions for roleId: {roleid}")
-
-            # เตรียม permissions ใหม่
+            # เมนูที่เลือก -> actions (รายการแรกของแต่ละเมนูมีผล)
             permissions = permissions_data.get('permissions', [])
-            menus_to_add = set()  # ใช้ set เพื่อหลีกเลี่ยง duplicate
-            
-            # เพิ่ม menus ที่เลือกและ parent menus ที่จำเป็น
+            selected = {}
             for perm in permissions:
                 menuid = perm.get('menuId')
-                if menuid:
-                    menus_to_add.add(menuid)
-                    
-                    # ถ้า menu นี้มี parent ให้เพิ่ม parent ด้วย
-                    if menuid in menu_parents:
-                        parent_id = menu_parents[menuid]
-                        menus_to_add.add(parent_id)
-                        print(f"📋 Auto-adding parent menu: {parent_id} for child: {menuid}")
-
-            # Insert permissions
-            if menus_to_add:
-                for menuid in menus_to_add:
-                    # หา actions สำหรับ menu นี้
-                    actions = [1]  # default View permission
-                    
-                    # ถ้าเป็น menu ที่เลือกไว้ ใช้ actions ที่กำหนด
-                    for perm in permissions:
-                        if perm.get('menuId') == menuid:
-                            actions = perm.get('actions', [1])
-                            break
-                    
-                    # ถ้าเป็น parent menu ที่ auto-add ให้เฉพาะ View permission
-                    is_auto_added_parent = (
-                        menuid not in [p.get('menuId') for p in permissions] and
-                        menuid in [menu_parents.get(p.get('menuId')) for p in permissions if p.get('menuId') in menu_parents]
-                    )
-                    
-                    if is_auto_added_parent:
-                        actions = [1]  # เฉพาะ View สำหรับ parent ที่ auto-add
-                    
-                    actions_str = ','.join(map(str, actions))
-                    
-                    insert_sql = text("""
-                        INSERT INTO rolepermission (roleid, menuid, actionid)
-                        VALUES (:roleid, :menuid, :actionid)
-                    """)
-                    
-                    db.execute(insert_sql, {
-                        "roleid": roleid,
-                        "menuid": menuid,
-                        "actionid": actions_str
-                    })
-                    
-                    action_type = "auto-added parent" if is_auto_added_parent else "selected"
-                    print(f"✅ Inserted permission ({action_type}): roleId={roleid}, menuId={menuid}, actions={actions_str}")
+                if menuid and menuid not in selected:
+                    selected[menuid] = sorted({int(a) for a in perm.get('actions', [1])}) or [1]
+
+            # parent ของเมนูที่เลือก ได้เฉพาะ View ถ้าไม่ได้ถูกเลือกเอง
+            menu_parents = dict(db.execute(text("""
+                SELECT menuid, parentid
+                FROM menu
+                WHERE menuid = ANY(:menuids) AND parentid IS NOT NULL
+            """), {"menuids": list(selected)}).fetchall()) if selected else {}
+
+            desired = dict(selected)
+            for parent_id in menu_parents.values():
+                desired.setdefault(parent_id, [1])
+
+            current = {
+                row.menuid: sorted(row.actionid or [])
+                for row in db.execute(text("""
+                    SELECT menuid, actionid FROM rolepermission WHERE roleid = :roleid
+                """), {"roleid": roleid})
+            }
+
+            to_insert = [menuid for menuid in desired if menuid not in current]
+            to_update = [menuid for menuid in desired if menuid in current and current[menuid] != desired[menuid]]
+            to_delete = [menuid for menuid in current if menuid not in desired]
+
+            upserts = to_insert + to_update
+            if upserts:
+                params = {"roleid": roleid}
+                values = []
+                for i, menuid in enumerate(upserts):
+                    params[f"menuid{i}"] = menuid
+                    params[f"actionid{i}"] = desired[menuid]
+                    values.append(f"(:roleid, :menuid{i}, CAST(:actionid{i} AS integer[]))")
+                db.execute(text(f"""
+                    INSERT INTO rolepermission (roleid, menuid, actionid)
+                    VALUES {", ".join(values)}
+                    ON CONFLICT (roleid, menuid) DO UPDATE SET actionid = EXCLUDED.actionid
+                """), params)
+
+            if to_delete:
+                db.execute(text("""
+                    DELETE FROM rolepermission
+                    WHERE roleid = :roleid AND menuid = ANY(:menuids)
+                """), {"roleid": roleid, "menuids": to_delete})
 
             db.commit()
-            print(f"💾 Successfully updated role permissions for roleId: {roleid}")
+            if upserts or to_delete:
+                invalidate_role_permissions(roleid)
+            print(
+                f"💾 Updated role permissions for roleId: {roleid} "
+                f"(+{len(to_insert)} ~{len(to_update)} -{len(to_delete)})"
+            )
             
             return {
                 "status": "success",
                 "message": "Role permissions updated successfully",
                 "roleId": roleid,
-                "permissionsCount": len(menus_to_add),
-                "autoAddedParents": len(menus_to_add) - len(permissions)
+                "permissionsCount": len(desired),
+                "autoAddedParents": len(desired) - len(selected),
+                "inserted": len(to_insert),
+                "updated": len(to_update),
+                "deleted": len(to_delete),
             }
             
+        except HTTPException:
+            db.rollback()
+            raise
         except Exception as e:
             db.rollback()
             print(f"❌ Error in update_role_permissions: {str(e)}")
@@ -196,6 +196,7 @@ class TransactionUpdate(BaseModel):
     # updateddate: Optional[datetime] = Field(default_factory=datetime.now, alias="updatedDate")
 
 class ReportDefectCreate(BaseModel):
+    productid: str = Field(alias="productId")
     lotno: str = Field(alias="lotNo")
     producttype: str = Field(alias="productType")
     defecttype: str = Field(alias="defectType")
@@ -210,15 +211,17 @@ class ReportDefectUpdate(BaseModel):
     ok: Optional[int] = None
     ng: Optional[int] = None
 
-class ReportProductCreate(BaseModel):
+class ReportProductResult(BaseModel):
     datetime: datetime
     productid: str = Field(alias="productId")
     productname: str = Field(alias="productName")
-    lotno: str = Field(alias="lotNo")
     status: str
     defecttype: str = Field(alias="defectType")
     cameraid: str = Field(alias="cameraId")
 
+class ReportProductCreate(ReportProductResult):
+    lotno: str = Field(alias="lotNo")
+
 class ReportProductUpdate(BaseModel):
     status: Optional[str] = None
     defecttype: Optional[str] = Field(default=None, alias="defectType")
@@ -242,6 +245,9 @@ class ProductDetailCreate(BaseModel):
     comment: str
     history: List[HistoryItem]
 
+class ReportProductBulkItem(ReportProductResult):
+    detail: Optional[ProductDetailCreate] = None
+
 class PermissionCreate(BaseModel):
     permissionid: int = Field(alias="permissionId")
     menuid: str = Field(alias="menuId")
@@ -273,6 +279,15 @@ class DashboardFilter(BaseModel):
     prodline: Optional[str] = Field(default=None, alias="lineNo")
     cameraid: Optional[str] = Field(default=None, alias="cameraId")
 
+class SuggestQuery(BaseModel):
+    field: str
+    q: str
+    mode: Optional[str] = "prefix"
+
+class SuggestBatch(BaseModel):
+    queries: List[SuggestQuery]
+    limit: Optional[int] = None
+
 class Config:
     orm_mode = True
     allow_population_by_field_name = True
@@ -0,0 +1,489 @@
+from database.connect_to_db import engine, text, SQLAlchemyError, fetch_all_async
+from starlette.concurrency import run_in_threadpool
+from bisect import bisect_left
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import os
+import re
+import threading
+import time
+
+# seconds before an index is reloaded even without a local write
+# (picks up writes made by other workers / directly in the database)
+SUGGEST_TTL = float(os.getenv("SUGGEST_TTL", "300"))
+SUGGEST_LIMIT = 10
+# don't retry a failed load on every keystroke
+SUGGEST_RETRY = 5.0
+SUGGEST_MODES = ("prefix", "fuzzy")
+# fuzzy: "db" = pg_trgm in PostgreSQL (memory if that fails), "memory" = always in-process
+SUGGEST_FUZZY_BACKEND = os.getenv("SUGGEST_FUZZY_BACKEND", "db")
+# same default as pg_trgm.similarity_threshold
+SUGGEST_TRGM_THRESHOLD = float(os.getenv("SUGGEST_TRGM_THRESHOLD", "0.3"))
+# seconds a finished lookup is handed to identical requests (0 = only while in flight)
+SUGGEST_COALESCE_WINDOW = float(os.getenv("SUGGEST_COALESCE_WINDOW", "0.05"))
+SUGGEST_BATCH_MAX = 50
+SUGGEST_MAX_LIMIT = 100
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+def _fold(value: str) -> str:
+    return value.casefold()
+
+def trigrams(value: str) -> Set[str]:
+    """Trigrams the way pg_trgm builds them: per alphanumeric word, padded '  word '."""
+    out = set()
+    for word in _WORD_RE.findall(_fold(value)):
+        padded = f"  {word} "
+        out.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return out
+
+def _inner_trigrams(value: str) -> Set[str]:
+    # unpadded trigrams: present in any value that contains the word as a substring
+    out = set()
+    for word in _WORD_RE.findall(_fold(value)):
+        out.update(word[i:i + 3] for i in range(len(word) - 2))
+    return out
+
+class PrefixIndex:
+    """Sorted (casefolded, value) pairs; a prefix lookup is one bisect plus a short scan."""
+
+    def __init__(self, values):
+        self._entries: List[Tuple[str, str]] = sorted({(_fold(v), v) for v in values})
+        self._postings: Optional[Dict[str, List[int]]] = None
+        self._grams: List[frozenset] = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def contains(self, q: str, limit: int = SUGGEST_LIMIT) -> List[str]:
+        key = _fold(q)
+        out = []
+        for folded, value in self._entries:
+            if key in folded:
+                out.append(value)
+                if len(out) >= limit:
+                    break
+        return out
+
+    def _trigram_postings(self) -> Dict[str, List[int]]:
+        # built on the first fuzzy lookup; the index is replaced (not mutated) on reload
+        if self._postings is None:
+            postings: Dict[str, List[int]] = {}
+            grams = []
+            for i, (_, value) in enumerate(self._entries):
+                entry_grams = frozenset(trigrams(value))
+                grams.append(entry_grams)
+                for gram in entry_grams:
+                    postings.setdefault(gram, []).append(i)
+            self._grams = grams
+            self._postings = postings
+        return self._postings
+
+    def fuzzy(self, q: str, limit: int = SUGGEST_LIMIT, threshold: float = SUGGEST_TRGM_THRESHOLD) -> List[str]:
+        """
+        Ranked substring + typo-tolerant matches: prefix matches first, then other
+        substring matches, then by trigram similarity. Candidates come from a
+        trigram -> entries inverted index, not a scan.
+        """
+        key = _fold(q)
+        q_grams = trigrams(q)
+        if len(key) < 3 or not q_grams:
+            # too short for trigrams to mean anything
+            if not key:
+                return []
+            return list(dict.fromkeys(self.prefix(q, limit) + self.contains(q, limit)))[:limit]
+
+        postings = self._trigram_postings()
+        # similarity >= threshold needs at least ceil(threshold * |q|) shared
+        # trigrams, so every match has one of the |q| - that + 1 rarest ones
+        needed = max(1, -(-int(threshold * 100) * len(q_grams) // 100))
+        rarest = sorted(q_grams, key=lambda g: len(postings.get(g, ())))
+        candidates = set()
+        for gram in rarest[:len(q_grams) - needed + 1]:
+            candidates.update(postings.get(gram, ()))
+        # a value containing q contains all of q's inner trigrams -> the rarest one is enough
+        inner = _inner_trigrams(q)
+        if inner:
+            candidates.update(postings.get(min(inner, key=lambda g: len(postings.get(g, ()))), ()))
+
+        ranked = []
+        for i in candidates:
+            folded, value = self._entries[i]
+            grams = self._grams[i]
+            common = len(q_grams & grams)
+            score = common / (len(q_grams) + len(grams) - common)
+            is_substring = key in folded
+            if is_substring or score >= threshold:
+                ranked.append((not folded.startswith(key), not is_substring, -score, folded, value))
+        ranked.sort()
+        return [r[-1] for r in ranked[:limit]]
+
+    def updated(self, added: Iterable[str] = (), removed: Iterable[str] = ()) -> "PrefixIndex":
+        """
+        Copy of the index with values added / removed by bisect, instead of a
+        full reload. Lookups may be running on this one, so it is not mutated;
+        the trigram postings of the copy are rebuilt on its first fuzzy lookup.
+        """
+        entries = list(self._entries)
+        for value in removed:
+            entry = (_fold(value), value)
+            i = bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+        for value in added:
+            entry = (_fold(value), value)
+            i = bisect_left(entries, entry)
+            if i == len(entries) or entries[i] != entry:
+                entries.insert(i, entry)
+        index = PrefixIndex(())
+        index._entries = entries
+        return index
+
+    def prefix(self, q: str, limit: int = SUGGEST_LIMIT) -> List[str]:
+        key = _fold(q)
+        i = bisect_left(self._entries, (key,))
+        out = []
+        while i < len(self._entries) and len(out) < limit:
+            folded, value = self._entries[i]
+            if not folded.startswith(key):
+                break
+            out.append(value)
+            i += 1
+        return out
+
+class SuggestSource:
+    def __init__(self, name: str, table: str, column: str, where: str = "", match: str = "prefix"):
+        self.name = name
+        self.table = table
+        self.column = column
+        self.where = where
+        self.match = match
+        self.index: Optional[PrefixIndex] = None
+        self.loaded_at = 0.0
+        self.failed_at = 0.0
+        self.stale = True
+
+    @property
+    def sql(self) -> str:
+        condition = f"{self.where} AND " if self.where else ""
+        return f"SELECT DISTINCT {self.column} FROM {self.table} WHERE {condition}{self.column} IS NOT NULL"
+
+    @property
+    def present_sql(self) -> str:
+        # which of :values still occur (and pass where); used by SuggestService.update
+        condition = f"{self.where} AND " if self.where else ""
+        return f"SELECT DISTINCT {self.column} FROM {self.table} WHERE {condition}{self.column}::text = ANY(:values)"
+
+    @property
+    def fuzzy_sql(self) -> str:
+        # lower(col::text) matches the trigram indexes from migration 005
+        condition = f"{self.where} AND " if self.where else ""
+        expr = f"lower({self.column}::text)"
+        return f"""
+            SELECT value FROM (
+                SELECT DISTINCT {self.column} AS value, {expr} AS folded
+                FROM {self.table}
+                WHERE {condition}({expr} LIKE :pattern OR {expr} % :q)
+            ) s
+            ORDER BY folded LIKE :prefix DESC, similarity(folded, :q) DESC, value
+            LIMIT :limit
+        """
+
+class Coalescer:
+    """
+    Identical lookups share one computation: callers arriving while it runs wait
+    for its result, and so do callers within `window` seconds after it finished.
+    """
+
+    def __init__(self, window: float = SUGGEST_COALESCE_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        # key -> (future, finished_at or None while in flight)
+        self._entries: Dict[tuple, Tuple[Future, Optional[float]]] = {}
+        self.computed = 0
+        self.shared = 0
+
+    def run(self, key: tuple, fn):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or time.monotonic() - entry[1] <= self.window):
+                self.shared += 1
+                future, owner = entry[0], False
+            else:
+                future, owner = Future(), True
+                self._entries[key] = (future, None)
+                self.computed += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._entries.pop(key, None)
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        with self._lock:
+            now = time.monotonic()
+            if self.window > 0:
+                self._entries[key] = (future, now)
+            else:
+                self._entries.pop(key, None)
+            expired = [k for k, (_, done) in self._entries.items() if done is not None and now - done > self.window]
+            for k in expired:
+                del self._entries[k]
+        return result
+
+    def clear(self):
+        # drop finished results; in-flight lookups still complete for their waiters
+        with self._lock:
+            self._entries = {k: e for k, e in self._entries.items() if e[1] is None}
+
+class SuggestService:
+    """
+    In-memory prefix indexes for the suggest-* typeahead endpoints, one per
+    (table, column). Writers that know the values they touched call
+    update(table, {column: values}) to patch the indexes in place; others call
+    invalidate(table) and the index is rebuilt on the next lookup. Either way
+    it is also rebuilt every SUGGEST_TTL seconds.
+    """
+
+    def __init__(self, ttl: float = SUGGEST_TTL):
+        self.ttl = ttl
+        self._sources: Dict[str, SuggestSource] = {}
+        self._lock = threading.Lock()
+        self._coalescer = Coalescer()
+        # suggest_async: identical lookups in flight on the event loop share one task
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+    def register(self, name: str, table: str, column: str, where: str = "", match: str = "prefix"):
+        self._sources[name] = SuggestSource(name, table, column, where, match)
+
+    def _load(self, source: SuggestSource):
+        try:
+            with engine.connect() as conn:
+                values = [str(row[0]) for row in conn.execute(text(source.sql))]
+        except SQLAlchemyError as e:
+            print(f"Suggest index load error ({source.name}): {e}")
+            source.failed_at = time.monotonic()
+            return
+        source.index = PrefixIndex(values)
+        source.loaded_at = time.monotonic()
+        source.stale = False
+
+    def load_all(self):
+        for source in self._sources.values():
+            with self._lock:
+                self._load(source)
+
+    def invalidate(self, table: str):
+        table = table.strip('"')
+        for source in self._sources.values():
+            if source.table.strip('"') == table:
+                source.stale = True
+        self._coalescer.clear()
+
+    def update(self, table: str, values: Dict[str, Iterable]):
+        """
+        Patch the loaded indexes of table after a write. values maps a column
+        to the values that were written or removed (old and new ones for an
+        update). One query per affected index checks which of them still pass
+        its filter; those are added, the rest removed.
+        """
+        table = table.strip('"')
+        for source in self._sources.values():
+            if source.table.strip('"') != table or source.column not in values:
+                continue
+            candidates = {str(v) for v in values[source.column] if v is not None}
+            if not candidates:
+                continue
+            with self._lock:
+                if source.index is None or self._needs_load(source):
+                    # rebuilt on the next lookup anyway
+                    continue
+                try:
+                    with engine.connect() as conn:
+                        present = {str(row[0]) for row in conn.execute(
+                            text(source.present_sql), {"values": list(candidates)}
+                        )}
+                except SQLAlchemyError as e:
+                    print(f"Suggest index update error ({source.name}): {e}")
+                    source.stale = True
+                    continue
+                source.index = source.index.updated(added=present, removed=candidates - present)
+        self._coalescer.clear()
+
+    def _needs_load(self, source: SuggestSource) -> bool:
+        now = time.monotonic()
+        if now - source.failed_at < SUGGEST_RETRY:
+            return False
+        return source.stale or now - source.loaded_at > self.ttl
+
+    def _source(self, name: str) -> SuggestSource:
+        source = self._sources[name]
+        if self._needs_load(source):
+            with self._lock:
+                # another thread may have reloaded it while we waited
+                if self._needs_load(source):
+                    self._load(source)
+        return source
+
+    def _fuzzy_params(self, q: str, limit: int) -> dict:
+        key = q.lower()
+        escaped = key.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return {"q": key, "pattern": f"%{escaped}%", "prefix": f"{escaped}%", "limit": limit}
+
+    def _fuzzy_db(self, source: SuggestSource, q: str, limit: int, conn=None) -> Optional[List[str]]:
+        params = self._fuzzy_params(q, limit)
+        try:
+            with (nullcontext(conn) if conn is not None else engine.connect()) as c:
+                try:
+                    return [str(row[0]) for row in c.execute(text(source.fuzzy_sql), params)]
+                except SQLAlchemyError:
+                    # keep a shared connection usable for the rest of the batch
+                    c.rollback()
+                    raise
+        except SQLAlchemyError as e:
+            # e.g. pg_trgm not installed
+            print(f"Fuzzy suggest error ({source.name}), using in-memory index: {e}")
+            return None
+
+    async def _fuzzy_db_async(self, source: SuggestSource, q: str, limit: int) -> Optional[List[str]]:
+        try:
+            rows = await fetch_all_async(source.fuzzy_sql, self._fuzzy_params(q, limit))
+            return [str(row["value"]) for row in rows]
+        except SQLAlchemyError as e:
+            print(f"Fuzzy suggest error ({source.name}), using in-memory index: {e}")
+            return None
+
+    def _check(self, name: str, mode: str) -> str:
+        name = name.replace("-", "_")
+        if name not in self._sources:
+            raise ValueError(f"Unknown suggest field: {name}")
+        if mode not in SUGGEST_MODES:
+            raise ValueError(f"mode must be one of {', '.join(SUGGEST_MODES)}")
+        return name
+
+    def _lookup(self, name: str, q: str, limit: int, mode: str, conn=None) -> List[dict]:
+        source = self._sources[name]
+        values = None
+        if mode == "fuzzy" and SUGGEST_FUZZY_BACKEND == "db":
+            values = self._fuzzy_db(source, q, limit, conn)
+        if values is None:
+            values = self._index_lookup(self._source(name), q, limit, mode)
+        return [{"value": v, "label": v} for v in values]
+
+    def _index_lookup(self, source: SuggestSource, q: str, limit: int, mode: str) -> List[str]:
+        index = source.index or PrefixIndex([])
+        if mode == "fuzzy":
+            return index.fuzzy(q, limit)
+        if source.match == "contains":
+            return index.contains(q, limit)
+        return index.prefix(q, limit)
+
+    async def _lookup_async(self, name: str, q: str, limit: int, mode: str) -> List[dict]:
+        source = self._sources[name]
+        values = None
+        if mode == "fuzzy" and SUGGEST_FUZZY_BACKEND == "db":
+            values = await self._fuzzy_db_async(source, q, limit)
+        if values is None:
+            if self._needs_load(source):
+                # rare (write / TTL); building the index is CPU work, keep it off the loop
+                await run_in_threadpool(self._source, name)
+            if mode == "fuzzy":
+                # trigram scoring can take tens of ms on large indexes
+                values = await run_in_threadpool(self._index_lookup, source, q, limit, mode)
+            else:
+                values = self._index_lookup(source, q, limit, mode)
+        return [{"value": v, "label": v} for v in values]
+
+    def _coalesced(self, name: str, q: str, limit: int, mode: str, conn=None) -> List[dict]:
+        # lookups are case-insensitive, so "p0" and "P0" share a result
+        return self._coalescer.run((name, _fold(q), limit, mode), lambda: self._lookup(name, q, limit, mode, conn))
+
+    def suggest(self, name: str, q: str, limit: int = SUGGEST_LIMIT, mode: str = "prefix") -> List[dict]:
+        name = self._check(name, mode)
+        return self._coalesced(name, q, limit, mode)
+
+    async def suggest_async(self, name: str, q: str, limit: int = SUGGEST_LIMIT, mode: str = "prefix") -> List[dict]:
+        """suggest() for async routes: never blocks the event loop on the database."""
+        name = self._check(name, mode)
+        key = (name, _fold(q), limit, mode)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup_async(name, q, limit, mode))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shielded: one caller going away must not cancel the others' lookup
+        return await asyncio.shield(task)
+
+    def suggest_many(self, queries: List[Tuple[str, str, str]], limit: int = SUGGEST_LIMIT) -> List[dict]:
+        """
+        Answer several (field, q, mode) lookups at once. Prefix lookups never touch
+        the database; fuzzy ones share a single connection.
+        """
+        if len(queries) > SUGGEST_BATCH_MAX:
+            raise ValueError(f"At most {SUGGEST_BATCH_MAX} queries per request")
+        if not 1 <= limit <= SUGGEST_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {SUGGEST_MAX_LIMIT}")
+        checked = [(self._check(name, mode), q, mode) for name, q, mode in queries]
+
+        conn = None
+        if SUGGEST_FUZZY_BACKEND == "db" and any(mode == "fuzzy" for _, _, mode in checked):
+            try:
+                conn = engine.connect()
+            except SQLAlchemyError as e:
+                print(f"Fuzzy suggest connect error, using in-memory index: {e}")
+        try:
+            return [
+                {"field": name, "q": q, "mode": mode, "suggestions": self._coalesced(name, q, limit, mode, conn)}
+                for name, q, mode in checked
+            ]
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            name: {
+                "table": s.table,
+                "column": s.column,
+                "size": len(s.index) if s.index else 0,
+                "age": round(now - s.loaded_at, 1) if s.loaded_at else None,
+                "stale": s.stale,
+            }
+            for name, s in self._sources.items()
+        }
+
+suggest_index = SuggestService()
+
+_ACTIVE_PRODUCT = "isdeleted = false AND prodstatus = true"
+for _name, _table, _column, _where in [
+    ("camera_id", "camera", "cameraid", "isdeleted = false AND camerastatus = true"),
+    ("camera_name", "camera", "cameraname", "isdeleted = false AND camerastatus = true"),
+    ("camera_location", "camera", "cameralocation", "isdeleted = false AND camerastatus = true"),
+    ("defecttype_id", "defecttype", "defectid", "isdeleted = false AND defectstatus = true"),
+    ("defecttype_name", "defecttype", "defecttype", "isdeleted = false AND defectstatus = true"),
+    ("modelname", "model", "modelname", "isdeleted = false"),
+    ("function", "function", "functionname", ""),
+    ("planid", "planning", "prodid", ""),
+    ("plan_lotno", "planning", "prodlot", ""),
+    ("plan_lineid", "planning", "prodline", ""),
+    ("product_id", "product", "prodid", _ACTIVE_PRODUCT),
+    ("product_name", "product", "prodname", _ACTIVE_PRODUCT),
+    ("serial_no", "product", "prodserial", _ACTIVE_PRODUCT),
+    ("producttype_id", "prodtype", "prodtypeid", _ACTIVE_PRODUCT),
+    ("producttype_name", "prodtype", "prodtype", _ACTIVE_PRODUCT),
+    ("defect_lotno", "defectsummary", "prodlot", ""),
+    ("transaction_lotno", "transactionreport", "prodlot", ""),
+    ("userid", '"user"', "userid", "isdeleted = false AND userstatus = true"),
+    ("username", '"user"', "username", "isdeleted = false AND userstatus = true"),
+]:
+    suggest_index.register(_name, _table, _column, _where)
+
+# role search has always matched anywhere in the name
+suggest_index.register("role_name", "role", "rolename", "isdeleted = false", match="contains")
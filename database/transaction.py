@@ -1,4 +1,5 @@
 from database.connect_to_db import engine, Session, text, SQLAlchemyError
+from database.suggest import suggest_index
 from fastapi import HTTPException
 import database.schemas as schemas
 from datetime import datetime
@@ -19,15 +20,11 @@ class TransactionDB:
     def get_transaction(self):
         return self._fetch_all("SELECT * FROM transactionreport")
     
-    def suggest_transaction_lotno(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT prodlot FROM transactionreport
-            WHERE LOWER(prodlot) LIKE LOWER(:keyword)
-            ORDER BY prodlot ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["prodlot"], "label": row["prodlot"]} for row in rows]
+    def suggest_transaction_lotno(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("transaction_lotno", q, mode=mode)
+
+    async def suggest_transaction_lotno_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("transaction_lotno", q, mode=mode)
     
     def add_transaction(self, txn: schemas.TransactionCreate, db: Session):
         if db.execute(text("SELECT 1 FROM transaction WHERE runningno = :runningno"),
@@ -57,6 +54,7 @@ class TransactionDB:
             "updateddate": txn.updateddate
         })
         db.commit()
+        suggest_index.update("transactionreport", {"prodlot": [txn.lotno]})
         return {"status": "Transaction created", "runningNo": txn.runningno}
 
     def update_transaction(self, runningno: int, txn: schemas.TransactionUpdate, db: Session):
@@ -84,5 +82,6 @@ class TransactionDB:
 
         db.execute(update_sql, update_fields)
         db.commit()
+        suggest_index.invalidate("transactionreport")
         return {"status": "Transaction updated", "runningNo": runningno}
 
@@ -0,0 +1,401 @@
+from database.connect_to_db import SessionLocal, Session, text
+from database.bulk import copy_rows
+from database.suggest import suggest_index
+from datetime import datetime
+from fastapi.responses import JSONResponse
+from typing import Union, Dict, Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+from fastapi import UploadFile
+from openpyxl import load_workbook
+import pandas as pd
+import os
+
+# rows read, validated and written per round (also the job progress step)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", "5000"))
+
+UPLOAD_MODES = ("insert", "upsert")
+
+_BOOLEAN_VALUES = {
+    "active": True, "true": True, "t": True, "yes": True, "y": True, "1": True, "1.0": True,
+    "inactive": False, "false": False, "f": False, "no": False, "n": False, "0": False, "0.0": False,
+}
+
+def error_response(code: int, message: str):
+    return JSONResponse( status_code=code, content={"detail": {"error": message}} )
+
+def success_response(code: int, content: Union[Dict[str, Any], str]):
+    return JSONResponse( status_code=code, content=content)
+
+class UploadSpec:
+    """
+    How one spreadsheet maps onto one table.
+
+    columns   : sheet header -> table column (in insert order)
+    defaults  : table column -> value used when the cell/column is empty
+    constants : table column -> value written for every new row (an upsert
+                never overwrites them on an existing row, e.g. passwords)
+    datetimes : table columns parsed with pd.to_datetime
+    booleans  : table columns parsed from Active/Inactive, true/false, 1/0 ...
+                (only blank cells get the default, other values reject the row)
+    required  : table columns that must not be empty (row is rejected otherwise)
+    key       : conflict target for mode="upsert"
+    soft_delete : the table has isdeleted; an upsert revives deleted rows
+    audit     : add createdby / createddate
+    on_commit : called after the upload commits (cache invalidation)
+    """
+
+    def __init__(
+        self,
+        table: str,
+        label: str,
+        columns: Dict[str, str],
+        defaults: Optional[Dict[str, Any]] = None,
+        constants: Optional[Dict[str, Any]] = None,
+        datetimes: Sequence[str] = (),
+        booleans: Sequence[str] = (),
+        required: Sequence[str] = (),
+        key: Sequence[str] = (),
+        soft_delete: bool = True,
+        audit: bool = True,
+        on_commit: Optional[Callable[[], None]] = None,
+    ):
+        self.table = table
+        self.label = label
+        self.columns = columns
+        self.defaults = defaults or {}
+        self.constants = constants or {}
+        self.datetimes = tuple(datetimes)
+        self.booleans = tuple(booleans)
+        self.required = tuple(required)
+        self.key = tuple(key)
+        self.soft_delete = soft_delete
+        self.audit = audit
+        self.on_commit = on_commit
+
+    @property
+    def table_columns(self) -> List[str]:
+        cols = list(self.columns.values()) + list(self.constants)
+        if self.audit:
+            cols += ["createdby", "createddate"]
+        return cols
+
+def check_upload_filename(filename: str):
+    filename = filename.lower()
+    if filename.endswith(".xls"):
+        # legacy BIFF workbooks cannot be streamed by openpyxl
+        raise ValueError("Legacy .xls files are not supported, save the sheet as .xlsx or .csv")
+    if not (filename.endswith(".xlsx") or filename.endswith(".csv")):
+        raise ValueError("File must be .xlsx or .csv")
+
+def iter_upload_chunks(fileobj, filename: str, chunksize: int = UPLOAD_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Yield the sheet chunksize rows at a time: CSV through pandas' chunked
+    reader, XLSX through openpyxl's read-only (streaming) mode. The index of
+    every chunk continues the previous one, so index + 2 is the sheet row.
+    """
+    check_upload_filename(filename)
+    fileobj.seek(0)
+    if filename.lower().endswith(".csv"):
+        offset = 0
+        for chunk in pd.read_csv(fileobj, chunksize=chunksize):
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            yield chunk
+        return
+
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(h).strip() if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+        offset = 0
+        batch = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            batch.append(row[:len(header)])
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=header, index=pd.RangeIndex(offset, offset + len(batch)))
+                offset += len(batch)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header, index=pd.RangeIndex(offset, offset + len(batch)))
+    finally:
+        wb.close()
+
+def estimate_upload_rows(fileobj, filename: str) -> int:
+    """Row count from the XLSX dimension tag (0 if unknown / CSV)."""
+    if filename.lower().endswith(".csv"):
+        return 0
+    fileobj.seek(0)
+    wb = load_workbook(fileobj, read_only=True)
+    try:
+        max_row = wb.active.max_row
+        return max(max_row - 1, 0) if max_row else 0
+    finally:
+        wb.close()
+
+def _integral(series: pd.Series) -> bool:
+    values = series.dropna()
+    return not values.empty and bool((values % 1 == 0).all())
+
+def prepare_upload(
+    df: pd.DataFrame, spec: UploadSpec, uploadby: str, now: Optional[datetime] = None
+) -> Tuple[pd.DataFrame, List[dict]]:
+    """
+    Rename/convert the whole frame column by column (no per-row Python).
+    Returns the rows ready for load and the rejected rows as
+    {"row": <sheet row number>, "error": ...}.
+    """
+    now = now or datetime.now()
+    df = df.rename(columns=lambda c: str(c).strip())
+    out = pd.DataFrame(index=df.index)
+    # boolean column -> original text of the cells that are not a known value
+    invalid = {}
+
+    for header, column in spec.columns.items():
+        series = df[header] if header in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if column in spec.datetimes:
+            series = pd.to_datetime(series, errors="coerce")
+        elif column in spec.booleans:
+            raw = series.astype(object).where(series.isna(), series.astype(str).str.strip())
+            series = raw.str.lower().map(_BOOLEAN_VALUES).astype(object)
+            unknown = series.isna() & raw.notna() & (raw != "")
+            if unknown.any():
+                invalid[column] = raw[unknown]
+        elif series.dtype.kind == "f" and _integral(series):
+            # ints with blanks come back from pandas as float (1.0) -> keep them ints
+            series = series.astype("Int64")
+        elif series.dtype.kind not in "biufmM":
+            # text (object / string dtype)
+            series = series.where(series.isna(), series.astype(str).str.strip())
+            series = series.mask(series == "")
+        if column in spec.defaults:
+            series = series.astype(object).where(series.notna(), spec.defaults[column])
+        out[column] = series
+
+    for column, value in spec.constants.items():
+        out[column] = value
+    if spec.audit:
+        out["createdby"] = uploadby
+        out["createddate"] = now
+
+    errors = []
+    missing = out[list(spec.required)].isna()
+    bad = missing.any(axis=1)
+    for values in invalid.values():
+        bad |= out.index.isin(values.index)
+    # +2 = header row + 1-based numbering, matches the row number in Excel
+    for index, flags in zip(missing.index[bad], missing[bad].to_numpy()):
+        problems = []
+        if flags.any():
+            problems.append("Missing " + ", ".join(c for c, m in zip(spec.required, flags) if m))
+        problems += [
+            f"Invalid {column} '{values[index]}'"
+            for column, values in invalid.items() if index in values.index
+        ]
+        errors.append({"row": int(index) + 2, "error": "; ".join(problems)})
+    out = out[~bad]
+
+    out = out.astype(object).where(out.notna(), None)
+    return out[spec.table_columns], errors
+
+def dedupe_keys(df: pd.DataFrame, spec: UploadSpec) -> Tuple[pd.DataFrame, List[dict]]:
+    """Upsert can touch a key only once per statement: the last row in the sheet wins."""
+    if not spec.key or df.empty:
+        return df, []
+    dup = df.duplicated(subset=list(spec.key), keep="last")
+    errors = [
+        {"row": int(index) + 2, "error": "Duplicate " + ", ".join(spec.key) + " (a later row replaces it)"}
+        for index in df.index[dup]
+    ]
+    return df[~dup], errors
+
+def _upsert_sql(spec: UploadSpec) -> str:
+    columns = ", ".join(spec.table_columns)
+    key = ", ".join(spec.key)
+    # only what the sheet carries is updated on a live row
+    assignments = [f"{c} = EXCLUDED.{c}" for c in spec.columns.values() if c not in spec.key]
+    if not spec.soft_delete:
+        # constants are insert-only
+        if spec.audit:
+            assignments += ["updatedby = EXCLUDED.createdby", "updateddate = EXCLUDED.createddate"]
+        return f"""
+        WITH upserted AS (
+            INSERT INTO {spec.table} AS t ({columns})
+            SELECT {columns} FROM _upload_stage
+            ON CONFLICT ({key}) DO UPDATE SET {", ".join(assignments)}
+            RETURNING (xmax = 0) AS created
+        )
+        SELECT
+            COUNT(*) FILTER (WHERE created) AS inserted,
+            COUNT(*) FILTER (WHERE NOT created) AS updated
+        FROM upserted
+    """
+
+    # constants are insert-only: a revived (deleted) row gets them like a new one
+    assignments += [
+        f"{c} = CASE WHEN t.isdeleted THEN EXCLUDED.{c} ELSE t.{c} END"
+        for c in spec.constants if c not in spec.key
+    ]
+    if spec.audit:
+        # reviving a deleted row works like add_product: it is created again,
+        # a live row is an update
+        assignments += [
+            "createdby = CASE WHEN t.isdeleted THEN EXCLUDED.createdby ELSE t.createdby END",
+            "createddate = CASE WHEN t.isdeleted THEN EXCLUDED.createddate ELSE t.createddate END",
+            "updatedby = CASE WHEN t.isdeleted THEN NULL ELSE EXCLUDED.createdby END",
+            "updateddate = CASE WHEN t.isdeleted THEN NULL ELSE EXCLUDED.createddate END",
+        ]
+    assignments.append("isdeleted = false")
+    return f"""
+        WITH existing AS (
+            SELECT {key}, isdeleted FROM {spec.table}
+            WHERE ({key}) IN (SELECT {key} FROM _upload_stage)
+        ), upserted AS (
+            INSERT INTO {spec.table} AS t ({columns})
+            SELECT {columns} FROM _upload_stage
+            ON CONFLICT ({key}) DO UPDATE SET {", ".join(assignments)}
+            RETURNING {key}, (xmax = 0) AS created
+        )
+        SELECT
+            COUNT(*) FILTER (WHERE u.created) AS inserted,
+            COUNT(*) FILTER (WHERE NOT u.created AND NOT COALESCE(e.isdeleted, false)) AS updated,
+            COUNT(*) FILTER (WHERE NOT u.created AND e.isdeleted) AS revived
+        FROM upserted u
+        LEFT JOIN existing e USING ({key})
+    """
+
+def load_upload(df: pd.DataFrame, spec: UploadSpec, db: Session, mode: str = "insert") -> dict:
+    """
+    COPY into a temp staging table, then one set-based statement into the target:
+    INSERT ... SELECT, or for mode="upsert" INSERT ... ON CONFLICT DO UPDATE.
+    """
+    counts = {"inserted": 0, "updated": 0, "revived": 0}
+    if df.empty:
+        return counts
+    columns = ", ".join(spec.table_columns)
+    db.execute(text(f"""
+        CREATE TEMP TABLE _upload_stage ON COMMIT DROP AS
+        SELECT {columns} FROM {spec.table} WITH NO DATA
+    """))
+    copy_rows(db, "_upload_stage", spec.table_columns, df.itertuples(index=False, name=None))
+    if mode == "upsert":
+        counts.update(db.execute(text(_upsert_sql(spec))).mappings().one())
+    else:
+        counts["inserted"] = db.execute(text(f"""
+            INSERT INTO {spec.table} ({columns})
+            SELECT {columns} FROM _upload_stage
+        """)).rowcount
+    db.execute(text("DROP TABLE _upload_stage"))
+    return counts
+
+def process_upload(
+    chunks: Iterable[pd.DataFrame], spec: UploadSpec, uploadby: str, db: Session,
+    mode: str = "insert", on_chunk=None,
+) -> Tuple[dict, List[dict]]:
+    """
+    Validate and write each chunk as soon as it is read (all in the caller's
+    transaction). on_chunk(rows_read, counts, chunk_errors) is called after each one.
+    """
+    now = datetime.now()
+    counts = {"inserted": 0, "updated": 0, "revived": 0}
+    errors = []
+    rows_read = 0
+    for chunk in chunks:
+        rows_read += len(chunk)
+        data, chunk_errors = prepare_upload(chunk, spec, uploadby, now)
+        if mode == "upsert":
+            # later chunks simply update keys written by earlier ones
+            data, duplicates = dedupe_keys(data, spec)
+            chunk_errors += duplicates
+        chunk_counts = load_upload(data, spec, db, mode)
+        for k in counts:
+            counts[k] += chunk_counts[k]
+        errors += chunk_errors
+        if on_chunk:
+            on_chunk(rows_read, counts, chunk_errors)
+    return counts, errors
+
+def check_upload_mode(spec: UploadSpec, mode: str):
+    if mode not in UPLOAD_MODES:
+        raise ValueError(f"mode must be one of {', '.join(UPLOAD_MODES)}")
+    if mode == "upsert" and not spec.key:
+        raise ValueError(f"Upsert is not supported for {spec.label}")
+
+def _upload_content(counts: dict, errors: List[dict], mode: str, include_errors: bool = True) -> dict:
+    written = counts["inserted"] + counts["updated"] + counts["revived"]
+    content = {"message": f"{written} records uploaded successfully!"}
+    if mode == "upsert":
+        content.update(counts)
+        content["rejected"] = len(errors)
+    elif errors:
+        content["rejected"] = len(errors)
+    if errors and include_errors:
+        content["errors"] = errors
+    return content
+
+def _after_commit(spec: UploadSpec):
+    suggest_index.invalidate(spec.table)
+    if spec.on_commit:
+        spec.on_commit()
+
+def upload_file(spec: UploadSpec, uploadby: str, file: UploadFile, db: Session, mode: str = "insert"):
+    try:
+        check_upload_mode(spec, mode)
+        check_upload_filename(file.filename)
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    try:
+        counts, errors = process_upload(iter_upload_chunks(file.file, file.filename), spec, uploadby, db, mode)
+        db.commit()
+        _after_commit(spec)
+        return success_response(200, _upload_content(counts, errors, mode))
+
+    except Exception as e:
+        print(f"Error uploading {spec.label}: {e}")
+        db.rollback()
+        return error_response(500, f"Failed to upload {spec.label}")
+
+def remove_upload_file(path: str):
+    # also JobManager's cleanup for abandoned jobs, so either side may be first
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def run_upload_job(job, spec: UploadSpec, uploadby: str, path: str, filename: str, mode: str = "insert"):
+    """
+    Job body for JobManager: stream the copied upload at path chunk by chunk,
+    reporting progress on job. The temp file is removed at the end.
+    """
+    db = SessionLocal()
+    try:
+        with open(path, "rb") as f:
+            job.update(phase="parse", rows_total=estimate_upload_rows(f, filename))
+
+            def progress(rows_read, counts, chunk_errors):
+                job.add_errors(chunk_errors)
+                job.update(
+                    phase="insert",
+                    rows_parsed=rows_read,
+                    rows_inserted=counts["inserted"] + counts["updated"] + counts["revived"],
+                )
+
+            counts, errors = process_upload(
+                iter_upload_chunks(f, filename), spec, uploadby, db, mode, on_chunk=progress
+            )
+        db.commit()
+        _after_commit(spec)
+        job.update(rows_total=job.rows_parsed)
+        # per-row errors are already on the job
+        return _upload_content(counts, errors, mode, include_errors=False)
+    except Exception:
+        db.rollback()
+        job.update(rows_inserted=0)
+        raise
+    finally:
+        db.close()
+        remove_upload_file(path)
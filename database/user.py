@@ -1,11 +1,13 @@
 from database.connect_to_db import engine, Session, text, SQLAlchemyError
+from database.suggest import suggest_index
+from database.permission import invalidate_user_permissions
 from fastapi import HTTPException
 import database.schemas as schemas
 from datetime import datetime
 from fastapi.responses import JSONResponse
 from typing import Union, Dict, Any
 from fastapi import UploadFile
-import pandas as pd
+from database.upload import UploadSpec, upload_file
 
 def error_response(code: int, message: str):
     return JSONResponse( status_code=code, content={"detail": {"error": message}} )
@@ -13,6 +15,24 @@ def error_response(code: int, message: str):
 def success_response(code: int, content: Union[Dict[str, Any], str]):
     return JSONResponse( status_code=code, content=content)
 
+USER_UPLOAD = UploadSpec(
+    table='"user"',
+    label="user",
+    columns={
+        "User ID": "userid",
+        "First Name": "ufname",
+        "Last Name": "ulname",
+        "Username": "username",
+        "Email": "email",
+        "Status": "userstatus",
+    },
+    defaults={"userstatus": True},
+    booleans=("userstatus",),
+    constants={"upassword": ""},
+    required=("userid",),
+    key=("userid",),
+)
+
 class UserDB:
     def _fetch_all(self, query: str, params: dict = None):
         try:
@@ -38,25 +58,17 @@ class UserDB:
           GROUP BY u.userid
         """)
 
-    def suggest_userid(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT userid FROM \"user\"
-            WHERE isdeleted = false AND userstatus = true AND LOWER(userid) LIKE LOWER(:keyword)
-            ORDER BY userid ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["userid"], "label": row["userid"]} for row in rows]
+    def suggest_userid(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("userid", q, mode=mode)
+
+    async def suggest_userid_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("userid", q, mode=mode)
     
-    def suggest_username(self, q: str):
-        rows = self._fetch_all("""
-            SELECT DISTINCT username FROM \"user\"
-            WHERE isdeleted = false AND userstatus = true AND LOWER(username) LIKE LOWER(:keyword)
-            ORDER BY username ASC
-            LIMIT 10; """,
-            {"keyword": q + "%"}
-        )
-        return [{"value": row["username"], "label": row["username"]} for row in rows]
+    def suggest_username(self, q: str, mode: str = "prefix"):
+        return suggest_index.suggest("username", q, mode=mode)
+
+    async def suggest_username_async(self, q: str, mode: str = "prefix"):
+        return await suggest_index.suggest_async("username", q, mode=mode)
     
 
 
@@ -165,6 +177,8 @@ class UserService:
             rolenames = new_roles.rolenames if new_roles else ''
 
         db.commit()
+        suggest_index.invalidate("user")
+        invalidate_user_permissions(user.userid)
         return success_response(200, {"userid": user.userid, "rolenames": rolenames, "createddate": str(now)})
 
     @staticmethod
@@ -259,6 +273,8 @@ class UserService:
         try:
           db.execute(update_sql, update_fields)
           db.commit()
+          suggest_index.invalidate("user")
+          invalidate_user_permissions(userid, user.userid)
           return success_response(200, { "userid": update_fields.get("userid", userid), "rolenames": rolenames, "updateddate": str(now)})
         except Exception as e:
             db.rollback()
@@ -272,55 +288,9 @@ class UserService:
         update_sql = text('UPDATE public."user" SET isdeleted = true WHERE userid = :userid')
         db.execute(update_sql, {"userid": userid})
         db.commit()
+        suggest_index.invalidate("user")
         return success_response(200,{ "userid": userid, "isdeleted": True})
 
     @staticmethod
-    async def upload_users(uploadby: str, file: UploadFile, db: Session):
-      try:
-        now = datetime.now()
-
-        # ตรวจสอบประเภทไฟล์
-        filename = file.filename.lower()
-        file.file.seek(0)
-        if filename.endswith(".xlsx") or filename.endswith(".xls"):
-            df = pd.read_excel(file.file, engine="openpyxl")
-        elif filename.endswith(".csv"):
-            df = pd.read_csv(file.file)
-        else:
-            raise error_response(400, "File must be .xlsx or .csv")
-
-        # แปลงข้อมูลแต่ละแถวเป็น dict ที่ตรงกับ SQL
-        user_data = []
-        for _, row in df.iterrows():
-            user_data.append({
-                "userid": row.get("User ID"),
-                "ufname": row.get("First Name"),
-                "ulname": row.get("Last Name"),
-                "username": row.get("Username"),
-                "upassword": '',
-                "email": row.get("Email"),
-                "userstatus": row.get("Status", "Active"),
-                "createdby": uploadby,
-                "createddate": now,
-                # "roles": row.get("Role Name"),
-            })
-
-       
-        # SQL สำหรับ insert
-        insert_sql = """
-            INSERT INTO \"user\" (
-                userid, ufname, ulname, username, upassword, email, userstatus, createdby, createddate
-            )
-            VALUES (
-                :userid, :ufname, :ulname, :username, :upassword, :email, :userstatus, :createdby, :createddate
-            )
-        """
-        # ทำ bulk insert
-        db.execute(text(insert_sql), user_data)
-        db.commit()
-        return success_response(200,{"message": f"{len(user_data)} records uploaded successfully!"})
- 
-      except Exception as e:
-          print(f"Error uploading user: {e}")
-          db.rollback()
-          raise error_response(500, "Failed to upload user")
+    def upload_users(uploadby: str, file: UploadFile, db: Session, mode: str = "insert"):
+        return upload_file(USER_UPLOAD, uploadby, file, db, mode)
@@ -0,0 +1,167 @@
+from database.connect_to_db import SessionLocal
+from database.report import ReportDB
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+import asyncio
+import os
+import time
+
+WRITE_BEHIND_MAXSIZE = int(os.getenv("WRITE_BEHIND_MAXSIZE", "10000"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+# failed records kept for /write-behind-stats
+WRITE_BEHIND_FAILURE_LOG = int(os.getenv("WRITE_BEHIND_FAILURE_LOG", "50"))
+
+class WriteBehindBuffer:
+    """
+    Bounded in-process queue in front of a batch writer.
+
+    put() never waits: it returns False when the queue is full so the caller can
+    answer 429. A background task flushes whenever batch_size records are
+    waiting or flush_interval seconds have passed, running the writer in a
+    worker thread. stop() flushes whatever is left.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        writer: Callable[[List[Any]], List[tuple]],
+        maxsize: int = WRITE_BEHIND_MAXSIZE,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+    ):
+        self.name = name
+        self.writer = writer
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._collecting: List[Any] = []
+        self._flushing: Optional[asyncio.Future] = None
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        # records that were acked but could not be written, newest last
+        self.recent_failures: "deque[dict]" = deque(maxlen=WRITE_BEHIND_FAILURE_LOG)
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run())
+
+    def put(self, item: Any) -> bool:
+        if self._task is None:
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def _collect(self) -> List[Any]:
+        # kept on self so stop() can recover records taken off the queue mid-collect
+        self._collecting = batch = []
+        batch.append(await self._queue.get())
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[Any]):
+        loop = asyncio.get_event_loop()
+        started = time.monotonic()
+        try:
+            statuses = await loop.run_in_executor(None, self.writer, batch)
+            errors = [(key, status) for key, status in statuses if status["status"] != "ok"]
+            for key, status in errors:
+                self._record_failure(batch[key], status.get("error"))
+            self.written += len(batch) - len(errors)
+            self.failed += len(errors)
+        except Exception as e:
+            for item in batch:
+                self._record_failure(item, f"flush error: {e}")
+            self.failed += len(batch)
+        finally:
+            elapsed = (time.monotonic() - started) * 1000
+            self.flushes += 1
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            self.total_flush_ms += elapsed
+
+    def _record_failure(self, item: Any, error: Optional[str]):
+        print(f"Write-behind {self.name} record dropped: {error}")
+        self.recent_failures.append({
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "error": error,
+            "record": item.dict(by_alias=True) if hasattr(item, "dict") else item,
+        })
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self._collecting = []
+            # shielded: cancelling the loop must not abandon a batch being written
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+
+        remaining, self._collecting = self._collecting, []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        for i in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[i:i + self.batch_size])
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "maxsize": self.maxsize,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "failed": self.failed,
+            "recent_failures": list(self.recent_failures),
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+def _session_writer(write: Callable) -> Callable[[List[Any]], List[tuple]]:
+    def writer(items: List[Any]):
+        db = SessionLocal()
+        try:
+            return write(list(enumerate(items)), db)
+        finally:
+            db.close()
+    return writer
+
+report_product_buffer = WriteBehindBuffer("report_product", _session_writer(ReportDB().write_report_products))
+report_defect_buffer = WriteBehindBuffer("report_defect", _session_writer(ReportDB().write_report_defects))
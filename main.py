@@ -1,30 +1,45 @@
-from fastapi import FastAPI, HTTPException, Depends, Body, Query, UploadFile, File, Form, WebSocket, WebSocketDisconnect
-# import asyncio
-from typing import Optional, List
+from fastapi import FastAPI, HTTPException, Depends, Body, Query, UploadFile, File, Form, WebSocket, WebSocketDisconnect, Request
+import asyncio
+from typing import Optional, List, Literal
 from datetime import datetime
 from sqlalchemy.sql import text
 from sqlalchemy.orm import Session
 from database.connect_to_db import Session
-from database.user import UserDB, UserService
-from database.product import ProductDB, ProductService, ProductTypeService
-from database.connect_to_db import test_db_connection, SessionLocal
+from database.user import UserDB, UserService, USER_UPLOAD
+from database.product import ProductDB, ProductService, ProductTypeService, PRODUCT_UPLOAD, PRODUCT_TYPE_UPLOAD
+from database.connect_to_db import test_db_connection, SessionLocal, pool_status, server_connections, run_read
 import database.schemas as schemas
-from database.defect import DefectDB
-from database.camera import CameraDB, CameraService
-from database.planning import PlanningDB
+from database.defect import DefectDB, DEFECT_TYPE_UPLOAD
+from database.camera import CameraDB, CameraService, CAMERA_UPLOAD
+from database.planning import PlanningDB, PLANNING_UPLOAD
 from database.model import DetectionModelDB, DetectionModelService
 from database.transaction import TransactionDB
 from database.report import ReportDB
+from database.export import export_rows, EXPORT_MEDIA_TYPES
+from database.bulk import parse_records
+from database.write_behind import report_product_buffer, report_defect_buffer
+from database.jobs import job_manager
+from database.suggest import suggest_index, SUGGEST_LIMIT
+from database.upload import check_upload_filename, check_upload_mode, run_upload_job, remove_upload_file
 from database.role import RoleDB
-from database.permission import PermissionDB
+from database.permission import PermissionDB, permission_cache
 from database.menu import MenuDB
-from database.dashboard import DashboardService
+from database.dashboard import DashboardService, dashboard_cache, invalidate_dashboard
+from database.migrate import apply_migrations
+from database.pg_listener import pg_listener
+from database.partition import PartitionService, MAINTENANCE_INTERVAL
 # from database.live_inspection import live_inspection_ws_handler
 # from streaming.live_stream import setup_streaming, websocket_clients
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware 
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
+import tempfile
+import itertools
+import shutil
+import os
 
 app = FastAPI(
     title="PI Backend API",
@@ -45,7 +60,8 @@ app = FastAPI(
         {"name": "Transaction", "description": "Lot and quantity tracking"},
         {"name": "ReportProduct", "description": "Product Defect Result"},
         {"name": "ReportDefect", "description": "Report Defect Summary"},
-        {"name": "Dashboard","description": "Dashboard"}
+        {"name": "Dashboard","description": "Dashboard"},
+        {"name": "Job", "description": "Background upload jobs"}
         # {"name": "Live", "description": "Live Inspection data"},
     ]
 )
@@ -55,6 +71,62 @@ def on_startup():
     # Register the current event loop for your kafka thread to use
     setup_streaming(asyncio.get_event_loop())
 '''
+@app.on_event("startup")
+def run_migrations():
+    # dashboard rollup tables / triggers etc. (see migrations/)
+    apply_migrations()
+
+@app.on_event("startup")
+def load_suggest_index():
+    # typeahead indexes for the suggest-* endpoints
+    suggest_index.load_all()
+
+@app.on_event("startup")
+def start_pg_listener():
+    # drop cached dashboard results when productdefectresult/defectsummary change
+    pg_listener.subscribe("dashboard_invalidate", invalidate_dashboard)
+    pg_listener.start()
+
+@app.on_event("shutdown")
+def stop_pg_listener():
+    pg_listener.stop()
+
+async def partition_maintenance_loop():
+    # create upcoming productdefectresult partitions + apply retention
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, PartitionService.run_maintenance)
+        except Exception as e:
+            # never let one failed run end the loop
+            print(f"Partition maintenance error: {type(e).__name__}: {e}")
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+@app.on_event("startup")
+async def start_partition_maintenance():
+    app.state.partition_task = asyncio.create_task(partition_maintenance_loop())
+
+@app.on_event("shutdown")
+async def stop_partition_maintenance():
+    task = getattr(app.state, "partition_task", None)
+    if task:
+        task.cancel()
+
+@app.on_event("shutdown")
+def stop_job_manager():
+    job_manager.shutdown()
+
+@app.on_event("startup")
+async def start_write_behind():
+    report_product_buffer.start()
+    report_defect_buffer.start()
+
+@app.on_event("shutdown")
+async def flush_write_behind():
+    # flush whatever is still queued before the worker exits
+    await report_product_buffer.stop()
+    await report_defect_buffer.stop()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # or frontend IP 
@@ -94,6 +166,34 @@ def test_db():
         return test_db_connection()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/suggest", tags=["General"])
+def suggest_batch(batch: schemas.SuggestBatch):
+    # several typeahead lookups per request, e.g. {"queries": [{"field": "planid", "q": "P0"}, {"field": "plan-lotno", "q": "L1"}]}
+    try:
+        return {"results": suggest_index.suggest_many(
+            [(item.field, item.q, item.mode or "prefix") for item in batch.queries],
+            limit=batch.limit or SUGGEST_LIMIT,
+        )}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/db-pool-stats", tags=["General"])
+def db_pool_stats(server: bool = False):
+    # server=true adds PostgreSQL's view of connections per application_name
+    stats = pool_status()
+    if server:
+        try:
+            stats["server"] = server_connections()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return stats
+
+@app.get("/suggest-index-stats", tags=["General"])
+def suggest_index_stats():
+    return suggest_index.stats()
     
 # -------------------- User Service --------------------
 @app.get("/users", tags=["User"])
@@ -125,23 +225,23 @@ def delete_user_api(userid: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post("/upload-users", tags=["User"])
-async def upload_user(uploadby: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_user(uploadby: str = Form(...), file: UploadFile = File(...), mode: str = Form("insert"), db: Session = Depends(get_db)):
     try:
-        return UserService.upload_users(uploadby, file, db)
+        return await run_in_threadpool(UserService.upload_users, uploadby, file, db, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-userid", tags=["User"])
-def suggest_userid(q: str):
+async def suggest_userid(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return user_db.suggest_userid(q)
+        return await user_db.suggest_userid_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-username", tags=["User"])
-def suggest_username(q: str):
+async def suggest_username(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return user_db.suggest_username(q)
+        return await user_db.suggest_username_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -195,10 +295,10 @@ async def upload_roles(uploadby: str = Form(...), file: UploadFile = File(...),
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/roles/suggestions", tags=["Role"])
-def get_role_suggestions(q: str):
+async def get_role_suggestions(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     """Get role name suggestions"""
     try:
-        return role_db.suggest_role_name(q)
+        return await role_db.suggest_role_name_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -237,9 +337,9 @@ def update_role_permissions(roleid: int, permissions_data: dict, db: Session = D
     
 # -------------------- Product Service --------------------
 @app.get("/products", tags=["Product"])
-def products():
+async def products():
     try:
-        return {"products": product_db.get_products()}
+        return {"products": await product_db.get_products_async()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -265,38 +365,38 @@ def delete_product_api(prodid: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post("/upload-products", tags=["Product"])
-async def upload_products(uploadby: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_products(uploadby: str = Form(...), file: UploadFile = File(...), mode: str = Form("insert"), db: Session = Depends(get_db)):
     try:
-        return ProductService.upload_products(uploadby, file, db)
+        return await run_in_threadpool(ProductService.upload_products, uploadby, file, db, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/suggest-product-id", tags=["Product"])
-def suggest_product_id(q: str):
+async def suggest_product_id(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return product_db.suggest_product_id(q)
+        return await product_db.suggest_product_id_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-product-name", tags=["Product"])
-def suggest_product_name(q: str):
+async def suggest_product_name(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return product_db.suggest_product_name(q)
+        return await product_db.suggest_product_name_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-serial-no", tags=["Product"])
-def suggest_serial_no(q: str):
+async def suggest_serial_no(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return product_db.suggest_serial_no(q)
+        return await product_db.suggest_serial_no_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # -------------------- Product Type Service --------------------
 @app.get("/product-types", tags=["ProductType"])
-def product_types():
+async def product_types():
     try:
-        return {"product_types": product_db.get_product_types()}
+        return {"product_types": await product_db.get_product_types_async()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -322,31 +422,31 @@ def delete_prodtype_api(prodtypeid: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post("/upload-product-types", tags=["ProductType"])
-async def upload_product_types(uploadby: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_product_types(uploadby: str = Form(...), file: UploadFile = File(...), mode: str = Form("insert"), db: Session = Depends(get_db)):
     try:
-        return ProductTypeService.upload_product_types(uploadby, file, db)
+        return await run_in_threadpool(ProductTypeService.upload_product_types, uploadby, file, db, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/suggest-producttype-id", tags=["ProductType"])
-def suggest_producttype_id(q: str):
+async def suggest_producttype_id(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return product_db.suggest_producttype_id(q)
+        return await product_db.suggest_producttype_id_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-producttype-name", tags=["ProductType"])
-def suggest_producttype_name(q: str):
+async def suggest_producttype_name(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return product_db.suggest_producttype_name(q)
+        return await product_db.suggest_producttype_name_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # -------------------- Camera Service --------------------
 @app.get("/cameras", tags=["Camera"])
-def cameras():
+async def cameras():
     try:
-        return {"cameras": camera_db.get_cameras()}
+        return {"cameras": await camera_db.get_cameras_async()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -372,30 +472,30 @@ def delete_camera_api(cameraid: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post("/upload-cameras", tags=["Camera"])
-async def upload_cameras(uploadby: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_cameras(uploadby: str = Form(...), file: UploadFile = File(...), mode: str = Form("insert"), db: Session = Depends(get_db)):
     try:
-        return CameraService.upload_cameras(uploadby, file, db)
+        return await run_in_threadpool(CameraService.upload_cameras, uploadby, file, db, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))   
     
 @app.get("/suggest-camera-id", tags=["Camera"])
-def suggest_camera_id(q: str):
+async def suggest_camera_id(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return camera_db.suggest_camera_id(q)
+        return await camera_db.suggest_camera_id_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-camera-name", tags=["Camera"])
-def suggest_camera_name(q: str):
+async def suggest_camera_name(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return camera_db.suggest_camera_name(q)
+        return await camera_db.suggest_camera_name_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-camera-location", tags=["Camera"])
-def suggest_camera_location(q: str):
+async def suggest_camera_location(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return camera_db.suggest_camera_location(q)
+        return await camera_db.suggest_camera_location_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -429,23 +529,23 @@ def delete_defecttype_api(defectid: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post("/upload-defect-types", tags=["DefectType"])
-async def upload_defect_types(uploadby: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_defect_types(uploadby: str = Form(...), file: UploadFile = File(...), mode: str = Form("insert"), db: Session = Depends(get_db)):
     try:
-        return DefectDB().upload_defect_types(uploadby, file, db)
+        return await run_in_threadpool(DefectDB().upload_defect_types, uploadby, file, db, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))   
 
 @app.get("/suggest-defecttype-id", tags=["DefectType"])
-def suggest_defecttype_id(q: str):
+async def suggest_defecttype_id(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return defect_db.suggest_defecttype_id(q)
+        return await defect_db.suggest_defecttype_id_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-defecttype-name", tags=["DefectType"])
-def suggest_defecttype_name(q: str):
+async def suggest_defecttype_name(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return defect_db.suggest_defecttype_name(q)
+        return await defect_db.suggest_defecttype_name_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -479,45 +579,45 @@ def delete_planning_api(planid: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post("/upload-plannings", tags=["Planning"])
-async def upload_planning(uploadby: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_planning(uploadby: str = Form(...), file: UploadFile = File(...), mode: str = Form("insert"), db: Session = Depends(get_db)):
     try:
-        return PlanningDB.upload_planning(uploadby, file, db)
+        return await run_in_threadpool(PlanningDB.upload_planning, uploadby, file, db, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-planid", tags=["Planning"])
-def suggest_planid(q: str):
+async def suggest_planid(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return planning_db.suggest_planid(q)
+        return await planning_db.suggest_planid_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-plan-lotno", tags=["Planning"])
-def suggest_plan_lotno(q: str):
+async def suggest_plan_lotno(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return planning_db.suggest_plan_lotno(q)
+        return await planning_db.suggest_plan_lotno_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-plan-lineid", tags=["Planning"])
-def suggest_plan_lineid(q: str):
+async def suggest_plan_lineid(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return planning_db.suggest_plan_lineid(q)
+        return await planning_db.suggest_plan_lineid_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 # -------------------- Detection Model Service --------------------
 @app.get("/suggest-modelname", tags=["Model"])
-def suggest_modelname(q: str):
+async def suggest_modelname(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return DetectionModelDB().suggest_modelname(q)
+        return await DetectionModelDB().suggest_modelname_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-function", tags=["Model"])
-def suggest_function(q: str):
+async def suggest_function(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return DetectionModelDB().suggest_function(q)
+        return await DetectionModelDB().suggest_function_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -679,17 +779,17 @@ def update_transaction(runningno: int, txn: schemas.TransactionUpdate, db: Sessi
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-transaction-lotno", tags=["Transaction"])
-def suggest_transaction_lotno(q: str):
+async def suggest_transaction_lotno(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
     try:
-        return transaction_db.suggest_transaction_lotno(q)
+        return await transaction_db.suggest_transaction_lotno_async(q, mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # -------------------- Report Defect Summary Service --------------------
 @app.get("/report-defect-summary", tags=["ReportDefect"])
-def defect_summary():
+async def defect_summary():
     try:
-        return {"defect_summary": ReportDB().get_defect_summary()}
+        return {"defect_summary": await ReportDB().get_defect_summary_async()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -700,6 +800,15 @@ def add_report_defect(item: schemas.ReportDefectCreate, db: Session = Depends(ge
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/queue-report-defect", tags=["ReportDefect"], status_code=202)
+async def queue_report_defect(item: schemas.ReportDefectCreate):
+    # ack now, written to defectsummary by the write-behind buffer
+    if not await run_read(ReportDB().defect_type_exists, item.defecttype):
+        raise HTTPException(status_code=422, detail=f"Unknown defect type: {item.defecttype}")
+    if not report_defect_buffer.put(item):
+        raise HTTPException(status_code=429, detail="Write-behind queue is full, retry later")
+    return {"status": "DefectSummary queued", "lotNo": item.lotno}
+
 @app.put("/update-report-defect", tags=["ReportDefect"])
 def update_report_defect(lotno: str, item: schemas.ReportDefectUpdate, db: Session = Depends(get_db)):
     try:
@@ -708,17 +817,51 @@ def update_report_defect(lotno: str, item: schemas.ReportDefectUpdate, db: Sessi
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/suggest-defect-lotno", tags=["ReportDefect"])
-def suggest_defect_lotno(q: str):
+async def suggest_defect_lotno(q: str, mode: Literal["prefix", "fuzzy"] = "prefix"):
+    try:
+        return await ReportDB().suggest_defect_lotno_async(q, mode)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/export-report-defect-summary", tags=["ReportDefect"])
+def export_defect_summary(
+    format: str = Query("csv"),
+    productid: Optional[str] = Query(None),
+    lotno: Optional[str] = Query(None),
+):
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or xlsx")
+    rows = ReportDB().stream_defect_summary(productid, lotno)
     try:
-        return ReportDB().suggest_defect_lotno(q)
+        # runs the query and fetches the header so a failure is still a 500
+        header = next(rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        export_rows(itertools.chain([header], rows), format, "DefectSummary"),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=defect_summary.{format}"},
+    )
 
 # -------------------- Product Defect Result Service --------------------
 @app.get("/report-product-defect", tags=["ReportProduct"])
-def product_defect_results():
+async def product_defect_results(
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    cameraid: Optional[str] = Query(None),
+    productid: Optional[str] = Query(None),
+    productname: Optional[str] = Query(None),
+    lotno: Optional[str] = Query(None),
+    defecttype: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+):
     try:
-        return {"product_defect_results": ReportDB().get_product_defect_results()}
+        return await ReportDB().get_product_defect_results_async(
+            start, end, cameraid, productid, productname, lotno, defecttype, cursor, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -729,6 +872,34 @@ def add_report_product(item: schemas.ReportProductCreate, db: Session = Depends(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/queue-report-product", tags=["ReportProduct"], status_code=202)
+async def queue_report_product(item: schemas.ReportProductResult):
+    # ack now, written to productdefectresult by the write-behind buffer
+    if not await run_read(ReportDB().defect_type_exists, item.defecttype):
+        raise HTTPException(status_code=422, detail=f"Unknown defect type: {item.defecttype}")
+    if not report_product_buffer.put(item):
+        raise HTTPException(status_code=429, detail="Write-behind queue is full, retry later")
+    return {"status": "ProductDefectResult queued", "productId": item.productid}
+
+@app.get("/write-behind-stats", tags=["ReportProduct"])
+def write_behind_stats():
+    return {
+        "report_product": report_product_buffer.stats(),
+        "report_defect": report_defect_buffer.stats(),
+    }
+
+@app.post("/bulk-report-product", tags=["ReportProduct"])
+async def bulk_report_product(request: Request, db: Session = Depends(get_db)):
+    # JSON array of ReportProductBulkItem, or NDJSON (Content-Type: application/x-ndjson)
+    try:
+        records = parse_records(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid body: {e}")
+    try:
+        return await run_in_threadpool(ReportDB().bulk_add_report_products, records, db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/add-report-product-detail", tags=["ReportProduct"])
 def add_product_detail(item: schemas.ProductDetailCreate, db: Session = Depends(get_db)):
     try:
@@ -743,13 +914,57 @@ def update_report_product(productid: str, item: schemas.ReportProductUpdate, db:
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/export-report-product-defect", tags=["ReportProduct"])
+def export_product_defect_results(
+    format: str = Query("csv"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    cameraid: Optional[str] = Query(None),
+    productid: Optional[str] = Query(None),
+    productname: Optional[str] = Query(None),
+    lotno: Optional[str] = Query(None),
+    defecttype: Optional[str] = Query(None),
+):
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or xlsx")
+    rows = ReportDB().stream_product_defect_results(
+        start, end, cameraid, productid, productname, lotno, defecttype
+    )
+    try:
+        # runs the query and fetches the header so a failure is still a 500
+        header = next(rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        export_rows(itertools.chain([header], rows), format, "ProductDefectResult"),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=product_defect_result.{format}"},
+    )
+
 # -------------------- Permission Service --------------------
 @app.get("/user-permissions", tags=["Permission"])
-def user_permission(userid: str, db: Session = Depends(get_db)):
+def user_permission(userid: str, request: Request, db: Session = Depends(get_db)):
     try:
-        return PermissionDB().user_permission(userid, db)
+        rows, etag = permission_db.user_permission_tree(userid, db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    # private: the menu is per user
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=jsonable_encoder(rows), headers=headers)
+
+@app.get("/permission-roles", tags=["Permission"])
+def permission_roles(menuid: str, actionid: int, db: Session = Depends(get_db)):
+    try:
+        return {"roles": permission_db.roles_with_action(menuid, actionid, db)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/permission-cache-stats", tags=["Permission"])
+def permission_cache_stats():
+    return permission_cache.stats()
     
 @app.get("/login", tags=["Permission"])
 def login(username: str, password: str, db: Session = Depends(get_db)):
@@ -769,101 +984,165 @@ def get_menus():
   
 # -------------------- Dashboard Service --------------------
 @app.get("/dashboard-defectscamera", tags=["Dashboard"])
-def endpoint_defects_camera(start: datetime, end: datetime, db: Session = Depends(get_db)):
+async def endpoint_defects_camera(start: datetime, end: datetime):
     try:
-      return DashboardService.get_defects_with_ng_gt_zero(start, end, db)
+      return await run_read(DashboardService.get_defects_with_ng_gt_zero, start, end)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/dashboard-goodngratio", tags=["Dashboard"])
-def endpoint_ratio(
+async def endpoint_ratio(
     start: datetime,
     end: datetime,
     productname: Optional[str] = Query(None),
     prodline: Optional[str] = Query(None),
-    cameraid: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    cameraid: Optional[str] = Query(None)
 ):
     try:
-      return DashboardService.get_ratio(start, end, productname, prodline, cameraid, db)
+      return await run_read(DashboardService.get_ratio, start, end, productname, prodline, cameraid)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/dashboard-ngdistribution", tags=["Dashboard"])
-def endpoint_distribution(
+async def endpoint_distribution(
     start: datetime,
     end: datetime,
     productname: Optional[str] = Query(None),
     prodline: Optional[str] = Query(None),
-    cameraid: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    cameraid: Optional[str] = Query(None)
 ):
     try:
-      return DashboardService.ng_distribution(start, end, productname, prodline, cameraid, db)
+      return await run_read(DashboardService.ng_distribution, start, end, productname, prodline, cameraid)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/dashboard-top5defects", tags=["Dashboard"])
-def endpoint_top5defects(
+async def endpoint_top5defects(
     start: datetime,
     end: datetime,
     productname: Optional[str] = Query(None),
     prodline: Optional[str] = Query(None),
-    cameraid: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    cameraid: Optional[str] = Query(None)
 ):
     try:
-      return DashboardService.top_5_defects(start, end, productname, prodline, cameraid, db)
+      return await run_read(DashboardService.top_5_defects, start, end, productname, prodline, cameraid)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/dashboard-top5trends", tags=["Dashboard"])
-def endpoint_top5trends(
+async def endpoint_top5trends(
     start: datetime,
-    end: datetime,
-    db: Session = Depends(get_db)
-):
+    end: datetime):
     try:
-      return DashboardService.top_5_trends(start, end, db)
+      return await run_read(DashboardService.top_5_trends, start, end)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/dashboard-totalproduct", tags=["Dashboard"])
-def get_total_products(
+async def get_total_products(
     start: datetime,
     end: datetime,
     productname: Optional[str] = Query(None),
     prodline: Optional[str] = Query(None),
-    cameraid: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    cameraid: Optional[str] = Query(None)
 ):
     try:
-        return DashboardService.get_total_products(start, end, productname, prodline, cameraid, db)
+        return await run_read(DashboardService.get_total_products, start, end, productname, prodline, cameraid)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.get("/dashboard", tags=["Dashboard"])
+async def get_dashboard(
+    start: datetime,
+    end: datetime,
+    productname: Optional[str] = Query(None),
+    prodline: Optional[str] = Query(None),
+    cameraid: Optional[str] = Query(None)
+):
+    try:
+        return await run_read(DashboardService.get_dashboard, start, end, productname, prodline, cameraid)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/dashboard-cache-stats", tags=["Dashboard"])
+def get_dashboard_cache_stats():
+    try:
+        return dashboard_cache.stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/filter-lines", tags=["Dashboard"])
-def get_lines_dropdown_list(db: Session = Depends(get_db)):
+async def get_lines_dropdown_list():
     try:
-        return DashboardService.get_lines_list(db)
+        return await run_read(DashboardService.get_lines_list)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/filter-products", tags=["Dashboard"]) 
-def get_products_dropdown_list(db: Session = Depends(get_db)):
+async def get_products_dropdown_list():
     try:
-        return DashboardService.get_products_list(db)
+        return await run_read(DashboardService.get_products_list)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/filter-cameras", tags=["Dashboard"])
-def get_cameras_dropdown_list(db: Session = Depends(get_db)):
+async def get_cameras_dropdown_list():
     try:
-        return DashboardService.get_cameras_list(db)
+        return await run_read(DashboardService.get_cameras_list)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
+# -------------------- Upload Job Service --------------------
+UPLOAD_JOB_SPECS = {
+    "users": USER_UPLOAD,
+    "products": PRODUCT_UPLOAD,
+    "product-types": PRODUCT_TYPE_UPLOAD,
+    "cameras": CAMERA_UPLOAD,
+    "defect-types": DEFECT_TYPE_UPLOAD,
+    "plannings": PLANNING_UPLOAD,
+}
+
+def _save_upload(file: UploadFile) -> str:
+    # the UploadFile is closed once the request ends, the job reads its own copy
+    suffix = Path(file.filename).suffix
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as tmp:
+        file.file.seek(0)
+        shutil.copyfileobj(file.file, tmp)
+    return path
+
+@app.post("/upload-jobs/{kind}", tags=["Job"], status_code=202)
+async def submit_upload_job(kind: str, uploadby: str = Form(...), file: UploadFile = File(...), mode: str = Form("insert")):
+    spec = UPLOAD_JOB_SPECS.get(kind)
+    if spec is None:
+        raise HTTPException(status_code=404, detail=f"Unknown upload kind: {kind}")
+    try:
+        check_upload_filename(file.filename)
+        check_upload_mode(spec, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        path = await run_in_threadpool(_save_upload, file)
+        job = job_manager.submit(
+            f"upload-{kind}", run_upload_job, spec, uploadby, path, file.filename, mode,
+            description=file.filename, cleanup=lambda: remove_upload_file(path),
+        )
+        return {"jobId": job.id, "status": job.status}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs", tags=["Job"])
+def list_jobs():
+    return [job.to_dict() for job in job_manager.list()]
+
+@app.get("/jobs/{job_id}", tags=["Job"])
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 # -------------------- serve image --------------------
     
 # @app.get("/files/{full_path:path}")
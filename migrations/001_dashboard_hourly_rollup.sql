@@ -0,0 +1,132 @@
+-- Hourly rollups of productdefectresult for the dashboard.
+--
+-- defecthourlyrollup   : defect count per (hour, defecttype, prodname, prodlot, cameraid)
+-- producthourlyrollup  : result count per (hour, prodid, prodname, prodlot, cameraid),
+--                        used for COUNT(DISTINCT prodid)
+--
+-- prodlot is resolved through defectsummary.prodid exactly like the dashboard
+-- queries join it (one count per matching summary row). Key columns store ''
+-- instead of NULL so ON CONFLICT can match them; readers turn '' back into NULL.
+
+CREATE TABLE IF NOT EXISTS defecthourlyrollup (
+    hour_slot    timestamp NOT NULL,
+    defecttype   varchar   NOT NULL DEFAULT '',
+    prodname     varchar   NOT NULL DEFAULT '',
+    prodlot      varchar   NOT NULL DEFAULT '',
+    cameraid     varchar   NOT NULL DEFAULT '',
+    defect_count bigint    NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour_slot, defecttype, prodname, prodlot, cameraid)
+);
+
+CREATE TABLE IF NOT EXISTS producthourlyrollup (
+    hour_slot    timestamp NOT NULL,
+    prodid       varchar   NOT NULL DEFAULT '',
+    prodname     varchar   NOT NULL DEFAULT '',
+    prodlot      varchar   NOT NULL DEFAULT '',
+    cameraid     varchar   NOT NULL DEFAULT '',
+    result_count bigint    NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour_slot, prodid, prodname, prodlot, cameraid)
+);
+
+CREATE OR REPLACE FUNCTION dashboardrollup_apply(
+    p_defecttime timestamp,
+    p_prodid     varchar,
+    p_prodname   varchar,
+    p_defecttype varchar,
+    p_cameraid   varchar,
+    p_delta      integer
+) RETURNS void AS $$
+DECLARE
+    v_hour timestamp;
+BEGIN
+    IF p_defecttime IS NULL THEN
+        RETURN;
+    END IF;
+    v_hour := date_trunc('hour', p_defecttime);
+
+    INSERT INTO defecthourlyrollup AS r (hour_slot, defecttype, prodname, prodlot, cameraid, defect_count)
+    SELECT v_hour, COALESCE(p_defecttype, ''), COALESCE(p_prodname, ''), lots.prodlot,
+           COALESCE(p_cameraid, ''), lots.n * p_delta
+    FROM (
+        SELECT COALESCE(ds.prodlot, '') AS prodlot, COUNT(*) AS n
+        FROM defectsummary ds
+        WHERE ds.prodid = p_prodid
+        GROUP BY 1
+        UNION ALL
+        SELECT '', 1
+        WHERE NOT EXISTS (SELECT 1 FROM defectsummary ds WHERE ds.prodid = p_prodid)
+    ) lots
+    ON CONFLICT (hour_slot, defecttype, prodname, prodlot, cameraid)
+    DO UPDATE SET defect_count = r.defect_count + EXCLUDED.defect_count;
+
+    INSERT INTO producthourlyrollup AS r (hour_slot, prodid, prodname, prodlot, cameraid, result_count)
+    SELECT v_hour, COALESCE(p_prodid, ''), COALESCE(p_prodname, ''), lots.prodlot,
+           COALESCE(p_cameraid, ''), p_delta
+    FROM (
+        SELECT DISTINCT COALESCE(ds.prodlot, '') AS prodlot
+        FROM defectsummary ds
+        WHERE ds.prodid = p_prodid
+        UNION
+        SELECT ''
+        WHERE NOT EXISTS (SELECT 1 FROM defectsummary ds WHERE ds.prodid = p_prodid)
+    ) lots
+    ON CONFLICT (hour_slot, prodid, prodname, prodlot, cameraid)
+    DO UPDATE SET result_count = r.result_count + EXCLUDED.result_count;
+
+    IF p_delta < 0 THEN
+        DELETE FROM defecthourlyrollup WHERE hour_slot = v_hour AND defect_count <= 0;
+        DELETE FROM producthourlyrollup WHERE hour_slot = v_hour AND result_count <= 0;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION productdefectresult_rollup_trg() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM dashboardrollup_apply(OLD.defecttime, OLD.prodid, OLD.prodname, OLD.defecttype, OLD.cameraid, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM dashboardrollup_apply(NEW.defecttime, NEW.prodid, NEW.prodname, NEW.defecttype, NEW.cameraid, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Creating the trigger locks productdefectresult against writes until this
+-- transaction commits, so the backfill below cannot race with new rows.
+DROP TRIGGER IF EXISTS productdefectresult_rollup ON productdefectresult;
+CREATE TRIGGER productdefectresult_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF defecttime, prodid, prodname, defecttype, cameraid
+    ON productdefectresult
+    FOR EACH ROW EXECUTE FUNCTION productdefectresult_rollup_trg();
+
+-- Backfill from existing rows
+TRUNCATE defecthourlyrollup, producthourlyrollup;
+
+INSERT INTO defecthourlyrollup (hour_slot, defecttype, prodname, prodlot, cameraid, defect_count)
+SELECT
+    date_trunc('hour', pdr.defecttime),
+    COALESCE(pdr.defecttype, ''),
+    COALESCE(pdr.prodname, ''),
+    COALESCE(ds.prodlot, ''),
+    COALESCE(pdr.cameraid, ''),
+    COUNT(*)
+FROM productdefectresult pdr
+LEFT JOIN defectsummary ds ON pdr.prodid = ds.prodid
+WHERE pdr.defecttime IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5;
+
+INSERT INTO producthourlyrollup (hour_slot, prodid, prodname, prodlot, cameraid, result_count)
+SELECT
+    date_trunc('hour', pdr.defecttime),
+    COALESCE(pdr.prodid, ''),
+    COALESCE(pdr.prodname, ''),
+    COALESCE(ds.prodlot, ''),
+    COALESCE(pdr.cameraid, ''),
+    COUNT(*)
+FROM productdefectresult pdr
+LEFT JOIN (
+    SELECT DISTINCT prodid, COALESCE(prodlot, '') AS prodlot FROM defectsummary
+) ds ON pdr.prodid = ds.prodid
+WHERE pdr.defecttime IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5;
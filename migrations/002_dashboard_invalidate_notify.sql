@@ -0,0 +1,29 @@
+-- NOTIFY dashboard_invalidate whenever rows that feed the dashboard change,
+-- so every worker can drop its cached dashboard results.
+--   payload = affected hour (productdefectresult), '' = everything (defectsummary)
+
+CREATE OR REPLACE FUNCTION productdefectresult_rollup_trg() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM dashboardrollup_apply(OLD.defecttime, OLD.prodid, OLD.prodname, OLD.defecttype, OLD.cameraid, -1);
+        PERFORM pg_notify('dashboard_invalidate', COALESCE(date_trunc('hour', OLD.defecttime)::text, ''));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM dashboardrollup_apply(NEW.defecttime, NEW.prodid, NEW.prodname, NEW.defecttype, NEW.cameraid, 1);
+        PERFORM pg_notify('dashboard_invalidate', COALESCE(date_trunc('hour', NEW.defecttime)::text, ''));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION defectsummary_notify_trg() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('dashboard_invalidate', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS defectsummary_notify ON defectsummary;
+CREATE TRIGGER defectsummary_notify
+    AFTER INSERT OR UPDATE OR DELETE ON defectsummary
+    FOR EACH STATEMENT EXECUTE FUNCTION defectsummary_notify_trg();
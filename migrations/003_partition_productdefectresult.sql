@@ -0,0 +1,86 @@
+-- Range-partition productdefectresult on defecttime.
+--
+-- The existing table is kept as one partition (productdefectresult_legacy)
+-- covering everything up to the start of next month; newer partitions are
+-- created ahead of time by PartitionService (database/partition.py), which
+-- also applies the retention policy. Rows without defecttime (or already past
+-- the legacy bound) go to productdefectresult_default.
+--
+-- Detached partitions are attached to productdefectresult_archive (or dropped).
+-- Detaching does not fire row triggers, so the dashboard rollups keep their
+-- history after the raw rows are archived. Everything that reads
+-- productdefectresult directly (the dashboard's partial-hour edges and
+-- all_defect_times, reports, exports) no longer sees archived rows, so
+-- dashboard ranges that reach past PDR_RETENTION_DAYS are only complete for
+-- whole hours.
+--
+-- LIKE does not copy primary key / unique constraints, and a unique key on a
+-- partitioned table must contain the partition column, so resultid is kept
+-- unique through (resultid, defecttime). Rows without defecttime are only
+-- protected by the resultid sequence.
+--
+-- NOTE: foreign keys or views that reference productdefectresult keep pointing
+-- at productdefectresult_legacy after the rename and must be recreated.
+
+DO $$
+DECLARE
+    v_boundary timestamp := date_trunc('month', now()) + interval '1 month';
+    v_old_seq  text;
+    v_new_seq  text;
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = 'productdefectresult' AND c.relkind = 'p'
+    ) THEN
+        RETURN;
+    END IF;
+
+    v_old_seq := pg_get_serial_sequence('public.productdefectresult', 'resultid');
+
+    ALTER TABLE productdefectresult RENAME TO productdefectresult_legacy;
+    DROP TRIGGER IF EXISTS productdefectresult_rollup ON productdefectresult_legacy;
+
+    CREATE TABLE productdefectresult (
+        LIKE productdefectresult_legacy INCLUDING DEFAULTS INCLUDING IDENTITY
+    ) PARTITION BY RANGE (defecttime);
+
+    ALTER TABLE productdefectresult
+        ADD CONSTRAINT productdefectresult_resultid_defecttime_key UNIQUE (resultid, defecttime);
+
+    -- keep resultid numbering going
+    v_new_seq := pg_get_serial_sequence('public.productdefectresult', 'resultid');
+    IF v_new_seq IS NOT NULL AND v_new_seq IS DISTINCT FROM v_old_seq THEN
+        EXECUTE format(
+            'SELECT setval(%L, COALESCE((SELECT MAX(resultid) FROM productdefectresult_legacy), 0) + 1, false)',
+            v_new_seq);
+    ELSIF v_old_seq IS NOT NULL THEN
+        -- serial: the sequence must not be dropped together with the legacy partition
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY productdefectresult.resultid', v_old_seq);
+    END IF;
+
+    CREATE TABLE productdefectresult_default PARTITION OF productdefectresult DEFAULT;
+
+    INSERT INTO productdefectresult_default
+    SELECT * FROM productdefectresult_legacy
+    WHERE defecttime IS NULL OR defecttime >= v_boundary;
+
+    DELETE FROM productdefectresult_legacy
+    WHERE defecttime IS NULL OR defecttime >= v_boundary;
+
+    EXECUTE format(
+        'ALTER TABLE productdefectresult ATTACH PARTITION productdefectresult_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+        v_boundary);
+
+    CREATE TABLE productdefectresult_archive (
+        LIKE productdefectresult
+    ) PARTITION BY RANGE (defecttime);
+END
+$$;
+
+-- Row triggers on the partitioned parent are cloned to every partition
+DROP TRIGGER IF EXISTS productdefectresult_rollup ON productdefectresult;
+CREATE TRIGGER productdefectresult_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF defecttime, prodid, prodname, defecttype, cameraid
+    ON productdefectresult
+    FOR EACH ROW EXECUTE FUNCTION productdefectresult_rollup_trg();
@@ -0,0 +1,8 @@
+-- Keyset pagination for /report-product-defect walks (defecttime, resultid) DESC.
+-- The composite also serves plain defecttime range scans. Databases migrated
+-- before 003 stopped creating its own defecttime index still have it; drop it.
+
+CREATE INDEX IF NOT EXISTS idx_productdefectresult_defecttime_resultid
+    ON productdefectresult (defecttime, resultid);
+
+DROP INDEX IF EXISTS idx_productdefectresult_defecttime;
@@ -0,0 +1,48 @@
+-- Trigram (pg_trgm) GIN indexes for fuzzy typeahead (suggest ... mode=fuzzy).
+-- The indexes are on lower(column), matching the queries in database/suggest.py.
+-- If the extension cannot be installed (no privilege), this is a no-op and
+-- fuzzy suggestions use the in-memory fallback instead.
+
+DO $$
+DECLARE
+    v_target record;
+BEGIN
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    EXCEPTION WHEN insufficient_privilege OR undefined_file THEN
+        RAISE NOTICE 'pg_trgm not available, skipping trigram indexes';
+        RETURN;
+    END;
+
+    FOR v_target IN
+        SELECT * FROM (VALUES
+            ('camera', 'cameraid'),
+            ('camera', 'cameraname'),
+            ('camera', 'cameralocation'),
+            ('defecttype', 'defectid'),
+            ('defecttype', 'defecttype'),
+            ('model', 'modelname'),
+            ('function', 'functionname'),
+            ('planning', 'prodid'),
+            ('planning', 'prodlot'),
+            ('planning', 'prodline'),
+            ('product', 'prodid'),
+            ('product', 'prodname'),
+            ('product', 'prodserial'),
+            ('prodtype', 'prodtypeid'),
+            ('prodtype', 'prodtype'),
+            ('defectsummary', 'prodlot'),
+            ('role', 'rolename'),
+            ('transactionreport', 'prodlot'),
+            ('user', 'userid'),
+            ('user', 'username')
+        ) AS t(tbl, col)
+    LOOP
+        IF to_regclass(format('public.%I', v_target.tbl)) IS NOT NULL THEN
+            EXECUTE format(
+                'CREATE INDEX IF NOT EXISTS %I ON public.%I USING gin (lower(%I::text) gin_trgm_ops)',
+                'idx_' || v_target.tbl || '_' || v_target.col || '_trgm', v_target.tbl, v_target.col);
+        END IF;
+    END LOOP;
+END
+$$;
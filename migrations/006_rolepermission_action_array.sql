@@ -0,0 +1,23 @@
+-- rolepermission.actionid: comma-separated text ('1,2,3') -> integer[] ('{1,2,3}').
+-- Values are parsed once here instead of on every permission lookup; the GIN
+-- index serves "which roles have action X" (actionid @> ARRAY[X]).
+-- Non-numeric parts are dropped; a value with no numbers at all becomes {1}
+-- (View), the same fallback get_role_permissions used when parsing the text.
+
+ALTER TABLE rolepermission ADD COLUMN actionid_new integer[];
+
+UPDATE rolepermission rp
+SET actionid_new = COALESCE((
+    SELECT array_agg(DISTINCT btrim(part)::int ORDER BY btrim(part)::int)
+    FROM unnest(string_to_array(rp.actionid::text, ',')) AS part
+    WHERE btrim(part) ~ '^[0-9]+$'
+), '{1}');
+
+ALTER TABLE rolepermission DROP COLUMN actionid;
+ALTER TABLE rolepermission RENAME COLUMN actionid_new TO actionid;
+ALTER TABLE rolepermission
+    ALTER COLUMN actionid SET DEFAULT '{1}',
+    ALTER COLUMN actionid SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_rolepermission_actionid
+    ON rolepermission USING gin (actionid);
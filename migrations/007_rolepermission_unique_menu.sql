@@ -0,0 +1,37 @@
+-- update_role_permissions upserts with ON CONFLICT (roleid, menuid), which needs
+-- a unique index on exactly those columns. Databases that already have one
+-- (e.g. the primary key) are left alone; otherwise duplicate rows are merged
+-- first, keeping the union of their actions.
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM pg_index i
+        WHERE i.indrelid = 'rolepermission'::regclass
+          AND i.indisunique
+          AND i.indpred IS NULL
+          AND (
+              SELECT array_agg(a.attname::text ORDER BY a.attname)
+              FROM unnest(i.indkey) AS k(attnum)
+              JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+          ) = ARRAY['menuid', 'roleid']
+    ) THEN
+        RETURN;
+    END IF;
+
+    CREATE TEMP TABLE rolepermission_merged ON COMMIT DROP AS
+    SELECT roleid, menuid, array_agg(DISTINCT action ORDER BY action) AS actionid
+    FROM rolepermission, unnest(actionid) AS action
+    GROUP BY roleid, menuid;
+
+    DELETE FROM rolepermission rp
+    USING rolepermission_merged m
+    WHERE rp.roleid = m.roleid AND rp.menuid = m.menuid;
+
+    INSERT INTO rolepermission (roleid, menuid, actionid)
+    SELECT roleid, menuid, actionid FROM rolepermission_merged;
+
+    CREATE UNIQUE INDEX idx_rolepermission_roleid_menuid ON rolepermission (roleid, menuid);
+END;
+$$;
@@ -0,0 +1,37 @@
+-- NOTIFY live_metadata_invalidate when the static fields used by live
+-- inspection change, so ws_main can drop its cached camera metadata.
+--   payload = cameraid (camera rows), '' = every camera (product / prodtype)
+
+CREATE OR REPLACE FUNCTION camera_live_metadata_notify_trg() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('live_metadata_invalidate', COALESCE(OLD.cameraid, ''));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('live_metadata_invalidate', COALESCE(NEW.cameraid, ''));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION live_metadata_notify_all_trg() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('live_metadata_invalidate', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS camera_live_metadata_notify ON camera;
+CREATE TRIGGER camera_live_metadata_notify
+    AFTER INSERT OR UPDATE OR DELETE ON camera
+    FOR EACH ROW EXECUTE FUNCTION camera_live_metadata_notify_trg();
+
+DROP TRIGGER IF EXISTS product_live_metadata_notify ON product;
+CREATE TRIGGER product_live_metadata_notify
+    AFTER INSERT OR UPDATE OR DELETE ON product
+    FOR EACH STATEMENT EXECUTE FUNCTION live_metadata_notify_all_trg();
+
+DROP TRIGGER IF EXISTS prodtype_live_metadata_notify ON prodtype;
+CREATE TRIGGER prodtype_live_metadata_notify
+    AFTER INSERT OR UPDATE OR DELETE ON prodtype
+    FOR EACH STATEMENT EXECUTE FUNCTION live_metadata_notify_all_trg();
@@ -0,0 +1,12 @@
+-- Live updates too large for a NOTIFY payload (8000 bytes) are stored here and
+-- only the id is sent; rows are deleted after LIVE_PAYLOAD_RETENTION seconds.
+
+CREATE TABLE IF NOT EXISTS live_update_payload (
+    id bigserial PRIMARY KEY,
+    channel text NOT NULL,
+    payload text NOT NULL,
+    created timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_live_update_payload_created
+    ON live_update_payload (created);
@@ -0,0 +1,101 @@
+-- Key the hourly rollups on prodid instead of prodlot.
+--
+-- 001 resolved prodlot through defectsummary when a result row was written,
+-- so later inserts / updates / deletes on defectsummary left the rollups out
+-- of step with the raw rows. The rollups now only depend on
+-- productdefectresult; readers join defectsummary on prodid at query time,
+-- exactly like the raw-row queries do.
+--
+-- defecthourlyrollup   : defect count per (hour, defecttype, prodid, prodname, cameraid)
+-- producthourlyrollup  : result count per (hour, prodid, prodname, cameraid)
+
+-- Blocks writers until commit so the backfill below cannot race with new rows
+LOCK TABLE productdefectresult IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TABLE IF EXISTS defecthourlyrollup;
+DROP TABLE IF EXISTS producthourlyrollup;
+
+CREATE TABLE defecthourlyrollup (
+    hour_slot    timestamp NOT NULL,
+    defecttype   varchar   NOT NULL DEFAULT '',
+    prodid       varchar   NOT NULL DEFAULT '',
+    prodname     varchar   NOT NULL DEFAULT '',
+    cameraid     varchar   NOT NULL DEFAULT '',
+    defect_count bigint    NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour_slot, defecttype, prodid, prodname, cameraid)
+);
+
+CREATE TABLE producthourlyrollup (
+    hour_slot    timestamp NOT NULL,
+    prodid       varchar   NOT NULL DEFAULT '',
+    prodname     varchar   NOT NULL DEFAULT '',
+    cameraid     varchar   NOT NULL DEFAULT '',
+    result_count bigint    NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour_slot, prodid, prodname, cameraid)
+);
+
+-- Same signature as 001, so productdefectresult_rollup_trg (002) is unchanged
+CREATE OR REPLACE FUNCTION dashboardrollup_apply(
+    p_defecttime timestamp,
+    p_prodid     varchar,
+    p_prodname   varchar,
+    p_defecttype varchar,
+    p_cameraid   varchar,
+    p_delta      integer
+) RETURNS void AS $$
+DECLARE
+    v_hour timestamp;
+BEGIN
+    IF p_defecttime IS NULL THEN
+        RETURN;
+    END IF;
+    v_hour := date_trunc('hour', p_defecttime);
+
+    INSERT INTO defecthourlyrollup AS r (hour_slot, defecttype, prodid, prodname, cameraid, defect_count)
+    VALUES (v_hour, COALESCE(p_defecttype, ''), COALESCE(p_prodid, ''), COALESCE(p_prodname, ''),
+            COALESCE(p_cameraid, ''), p_delta)
+    ON CONFLICT (hour_slot, defecttype, prodid, prodname, cameraid)
+    DO UPDATE SET defect_count = r.defect_count + EXCLUDED.defect_count;
+
+    INSERT INTO producthourlyrollup AS r (hour_slot, prodid, prodname, cameraid, result_count)
+    VALUES (v_hour, COALESCE(p_prodid, ''), COALESCE(p_prodname, ''), COALESCE(p_cameraid, ''), p_delta)
+    ON CONFLICT (hour_slot, prodid, prodname, cameraid)
+    DO UPDATE SET result_count = r.result_count + EXCLUDED.result_count;
+
+    IF p_delta < 0 THEN
+        DELETE FROM defecthourlyrollup WHERE hour_slot = v_hour AND defect_count <= 0;
+        DELETE FROM producthourlyrollup WHERE hour_slot = v_hour AND result_count <= 0;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill from existing rows, including partitions already moved to
+-- productdefectresult_archive (003) so the rollups keep their history
+DO $$
+DECLARE
+    v_source text := 'productdefectresult';
+BEGIN
+    IF to_regclass('public.productdefectresult_archive') IS NOT NULL THEN
+        v_source := '(SELECT * FROM productdefectresult UNION ALL SELECT * FROM productdefectresult_archive)';
+    END IF;
+
+    EXECUTE $q$
+        INSERT INTO defecthourlyrollup (hour_slot, defecttype, prodid, prodname, cameraid, defect_count)
+        SELECT
+            date_trunc('hour', pdr.defecttime),
+            COALESCE(pdr.defecttype, ''),
+            COALESCE(pdr.prodid, ''),
+            COALESCE(pdr.prodname, ''),
+            COALESCE(pdr.cameraid, ''),
+            COUNT(*)
+        FROM $q$ || v_source || $q$ pdr
+        WHERE pdr.defecttime IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5
+    $q$;
+END
+$$;
+
+INSERT INTO producthourlyrollup (hour_slot, prodid, prodname, cameraid, result_count)
+SELECT hour_slot, prodid, prodname, cameraid, SUM(defect_count)
+FROM defecthourlyrollup
+GROUP BY 1, 2, 3, 4;
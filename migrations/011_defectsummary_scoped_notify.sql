@@ -0,0 +1,51 @@
+-- Scope the dashboard_invalidate NOTIFY sent for defectsummary writes.
+--
+-- 002 sent '' (drop every cached dashboard result) once per statement, so the
+-- live summary writes kept the dashboard cache empty during production. A
+-- defectsummary row only changes results for the hours in which its prodid
+-- has productdefectresult rows, so the payload is now that range,
+-- '<first hour>/<end of last hour>', read from producthourlyrollup (010).
+-- Products without results send nothing. PostgreSQL folds identical
+-- payloads within a transaction, so a batch of rows for one product sends
+-- one notification.
+
+CREATE INDEX IF NOT EXISTS idx_producthourlyrollup_prodid_hour
+    ON producthourlyrollup (prodid, hour_slot);
+
+CREATE OR REPLACE FUNCTION dashboard_notify_prodid(p_prodid varchar) RETURNS void AS $$
+DECLARE
+    v_first timestamp;
+    v_last  timestamp;
+BEGIN
+    IF p_prodid IS NULL THEN
+        RETURN;
+    END IF;
+    SELECT MIN(hour_slot), MAX(hour_slot) INTO v_first, v_last
+    FROM producthourlyrollup
+    WHERE prodid = p_prodid;
+    IF v_first IS NOT NULL THEN
+        PERFORM pg_notify('dashboard_invalidate', v_first::text || '/' || (v_last + interval '1 hour')::text);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION defectsummary_notify_trg() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM dashboard_notify_prodid(NEW.prodid);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM dashboard_notify_prodid(OLD.prodid);
+    ELSE
+        PERFORM dashboard_notify_prodid(OLD.prodid);
+        IF NEW.prodid IS DISTINCT FROM OLD.prodid THEN
+            PERFORM dashboard_notify_prodid(NEW.prodid);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS defectsummary_notify ON defectsummary;
+CREATE TRIGGER defectsummary_notify
+    AFTER INSERT OR UPDATE OR DELETE ON defectsummary
+    FOR EACH ROW EXECUTE FUNCTION defectsummary_notify_trg();
@@ -3,7 +3,7 @@ import asyncio
 from database.connect_to_db import Session
 from database.user import UserDB, UserService
 from database.product import ProductDB, ProductService
-from database.connect_to_db import test_db_connection, SessionLocal
+from database.connect_to_db import test_db_connection, SessionLocal, pool_status, server_connections
 import database.schemas as schemas
 from database.defect import DefectDB
 from database.camera import CameraDB, CameraService
@@ -14,7 +14,12 @@ from database.report import ReportDB
 from database.role import RoleDB
 from database.permission import PermissionDB
 from database.menu import MenuDB
-from database.live_inspection import live_defect_ws_handler, active_websockets, pending_updates
+from database.live_inspection import (
+    live_defect_ws_handler, live_hubs, push_live_update, live_pubsub, start_live_pubsub, rejected_pushes,
+    invalidate_live_metadata, live_metadata_cache,
+)
+from database.migrate import apply_migrations
+from database.pg_listener import pg_listener
 from streaming.live_stream import setup_streaming, websocket_clients
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware 
@@ -45,6 +50,27 @@ def on_startup():
     # Register the current event loop for your kafka thread to use
     setup_streaming(asyncio.get_event_loop())
 
+@app.on_event("startup")
+def run_migrations():
+    # the live notify triggers / live_update_payload live in migrations/ too;
+    # the advisory lock in apply_migrations serialises this with main.py
+    apply_migrations()
+
+@app.on_event("startup")
+def start_pg_listener():
+    # drop cached live-inspection metadata when camera/product/prodtype change
+    pg_listener.subscribe("live_metadata_invalidate", invalidate_live_metadata)
+    pg_listener.start()
+
+@app.on_event("startup")
+async def start_live_distribution():
+    # live-defect-data pushes reach the websockets on every worker
+    start_live_pubsub()
+
+@app.on_event("shutdown")
+def stop_pg_listener():
+    pg_listener.stop()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # allow frontend IP or domains
@@ -68,17 +94,41 @@ role_db = RoleDB()
 permission_db = PermissionDB()
 menu_db = MenuDB()
 
+@app.get("/db-pool-stats", tags=["General"])
+def db_pool_stats(server: bool = False):
+    # server=true adds PostgreSQL's view of connections per application_name
+    stats = pool_status()
+    if server:
+        try:
+            stats["server"] = server_connections()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return stats
+
 @app.websocket("/live-defect/{camera_id}")
 async def live_defect(websocket: WebSocket, camera_id: str):
-    db_gen = get_db()
-    db = next(db_gen)
-    await live_defect_ws_handler(websocket, camera_id, db)
+    await live_defect_ws_handler(websocket, camera_id)
 
 @app.post("/live-defect-data/{camera_id}") # Endpoint to push live defect data from node-red
 async def push_live_defect_data(camera_id: str, request: Request):
     data = await request.json()
-    if camera_id in pending_updates:
-        await pending_updates[camera_id].put(data)
-        return {"status": "queued", "clients": len(active_websockets.get(camera_id, []))}
-    return {"status": "no_active_socket"}
+    try:
+        published = await push_live_update(camera_id, data)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Live update not published: {e}")
+    if not published:
+        # backpressure policy: viewers of this camera are behind
+        raise HTTPException(status_code=429, detail="Live viewers are behind, retry later", headers={"Retry-After": "1"})
+    # subscribers may be on any worker, so only the local ones are counted
+    local_clients = len(live_hubs[camera_id].subscribers) if camera_id in live_hubs else 0
+    return {"status": "published", "backend": live_pubsub.name, "localClients": local_clients}
+
+@app.get("/live-stats", tags=["Live"])
+def live_stats():
+    return {
+        "hubs": {camera_id: hub.stats() for camera_id, hub in live_hubs.items()},
+        "metadata_cache": live_metadata_cache.stats(),
+        "pubsub": live_pubsub.stats(),
+        "rejected": dict(rejected_pushes),
+    }
 